@@ -0,0 +1,87 @@
+"""Memory held by split chunks: LangChain Documents vs slotted chunk records.
+
+Splits a synthetic corpus of PDF-like pages (PyPDFLoader-style metadata) both
+ways and reports the memory still allocated once the page objects are freed,
+plus the peak during splitting, measured with tracemalloc.
+
+    python benchmarks/bench_chunk_memory.py --files 200 --pages 50
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from langchain.schema.document import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from chat_with_docs import chunk_records
+from chat_with_docs import populate_db
+
+WORDS = ("retrieval", "embedding", "vector", "document", "chunk", "index", "query", "model", "store", "page")
+
+
+def make_pages(files: int, pages: int, page_chars: int):
+    rng = random.Random(0)
+    for f in range(files):
+        source = f"data/reports/quarterly-report-{f:05d}.pdf"
+        for p in range(pages):
+            words = []
+            while sum(len(w) + 1 for w in words) < page_chars:
+                words.append(rng.choice(WORDS))
+            # Separate string objects per page, as a loader would produce.
+            yield Document(page_content=" ".join(words), metadata={
+                "source": "".join(source), "page": p, "page_label": str(p + 1), "total_pages": pages,
+                "producer": "pdfTeX-1.40.25", "creationdate": "2024-03-01T10:00:00+00:00",
+            })
+
+
+def documents_baseline(pages, splitter):
+    chunks = splitter.split_documents(pages)
+    last, index = None, 0
+    for chunk in chunks:
+        key = f"{chunk.metadata.get('source')}:{chunk.metadata.get('page', '0')}"
+        index = index + 1 if key == last else 0
+        last = key
+        chunk.metadata["id"] = f"{key}:{index}"
+    return chunks
+
+
+def records(pages, splitter):
+    return list(chunk_records.split_into_records(pages, splitter))
+
+
+def measure(label, build, args, splitter):
+    pages = list(make_pages(args.files, args.pages, args.page_chars))
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    chunks = build(pages, splitter)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    del pages
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # Text is the same either way; what differs is the per-chunk overhead.
+    text_bytes = sum(len(getattr(c, "text", None) or c.page_content) + 49 for c in chunks)
+    overhead = (retained - text_bytes) / len(chunks)
+    print(f"{label:<10} {len(chunks):>9} chunks  retained {retained / 1e6:8.1f} MB  "
+          f"(~{overhead:,.0f} B/chunk besides text)  peak +{peak / 1e6:8.1f} MB  split {seconds:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--page-chars", type=int, default=3000)
+    args = parser.parse_args()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=populate_db.CHUNK_SIZE, chunk_overlap=populate_db.CHUNK_OVERLAP,
+                                              length_function=len, is_separator_regex=False)
+    measure("documents", documents_baseline, args, splitter)
+    measure("records", records, args, splitter)
+
+
+if __name__ == "__main__":
+    main()
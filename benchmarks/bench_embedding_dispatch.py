@@ -0,0 +1,63 @@
+"""Compare sequential embedding with the adaptive dispatcher against the mock server.
+
+    python benchmarks/bench_embedding_dispatch.py --texts 2000 --rps 8
+"""
+import argparse
+import time
+
+from langchain_openai import OpenAIEmbeddings
+from pydantic import SecretStr
+
+from chat_with_docs.embedding_dispatcher import AdaptiveEmbeddingDispatcher, estimate_tokens
+from mock_embedding_server import start_server
+
+
+def make_client(base_url: str, batch_size: int) -> OpenAIEmbeddings:
+    return OpenAIEmbeddings(
+        model="text-embedding-3-small",
+        api_key=SecretStr("mock"),
+        base_url=base_url,
+        chunk_size=batch_size,
+        max_retries=0,
+        check_embedding_ctx_length=False,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--rps", type=float, default=8.0)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    args = parser.parse_args()
+
+    texts = [f"chunk {i} " + "lorem ipsum dolor sit amet " * 30 for i in range(args.texts)]
+    tokens = sum(estimate_tokens(t) for t in texts)
+
+    server, base_url, stats = start_server(rps=args.rps, burst=int(args.rps), latency=args.latency,
+                                           error_rate=args.error_rate)
+    try:
+        sequential = AdaptiveEmbeddingDispatcher(make_client(base_url, args.batch_size), batch_size=args.batch_size,
+                                                 initial_concurrency=1, max_concurrency=1)
+        start = time.perf_counter()
+        sequential.embed_documents(texts)
+        seq_seconds = time.perf_counter() - start
+        print(f"sequential: {seq_seconds:.2f}s  {tokens / seq_seconds:,.0f} tok/s  retries={sequential.retries}")
+
+        adaptive = AdaptiveEmbeddingDispatcher(make_client(base_url, args.batch_size), batch_size=args.batch_size,
+                                               max_concurrency=args.max_concurrency)
+        start = time.perf_counter()
+        vectors = adaptive.embed_documents(texts)
+        ada_seconds = time.perf_counter() - start
+        assert len(vectors) == len(texts)
+        print(f"adaptive:   {ada_seconds:.2f}s  {adaptive.tokens_per_second:,.0f} tok/s  "
+              f"retries={adaptive.retries} throttled={adaptive.throttled} final_concurrency={adaptive.concurrency}")
+        print(f"server: {stats}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
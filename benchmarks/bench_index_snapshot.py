@@ -0,0 +1,64 @@
+"""Export/import throughput of index snapshots on a synthetic Chroma store.
+
+    python benchmarks/bench_index_snapshot.py --chunks 50000 --dim 1024
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from chat_with_docs import index_snapshot
+from chat_with_docs import vector_store_manager
+
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def build_store(path: str, chunks: int, dim: int, batch_size: int = 5000):
+    rng = np.random.default_rng(0)
+    collection = vector_store_manager.get_client(path).get_or_create_collection(vector_store_manager.DEFAULT_COLLECTION)
+    for start in range(0, chunks, batch_size):
+        n = min(batch_size, chunks - start)
+        ids = [f"data/doc{(start + i) // 40}.pdf:{(start + i) // 4 % 10}:{(start + i) % 4}" for i in range(n)]
+        collection.add(
+            ids=ids,
+            embeddings=rng.standard_normal((n, dim), dtype=np.float32),
+            documents=[("lorem ipsum dolor sit amet " * 30)[:800] for _ in range(n)],
+            metadatas=[{"source": chunk_id.split(":")[0], "page": int(chunk_id.split(":")[1]), "id": chunk_id}
+                       for chunk_id in ids],
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1024)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="cwd-snapshot-bench-")
+    try:
+        source = os.path.join(workdir, "source")
+        target = os.path.join(workdir, "target")
+        snapshot = os.path.join(workdir, "index.snap")
+
+        start = time.perf_counter()
+        build_store(source, args.chunks, args.dim)
+        print(f"built store: {args.chunks} chunks x {args.dim} dims in {time.perf_counter() - start:.1f}s, "
+              f"{directory_size(source) / 1e6:.1f} MB on disk")
+
+        stats = index_snapshot.export_index(source, snapshot)
+        print(f"export: {stats['seconds']:.2f}s  {stats['count'] / stats['seconds']:,.0f} chunks/s  "
+              f"{stats['bytes'] / 1e6 / stats['seconds']:.1f} MB/s  snapshot {stats['bytes'] / 1e6:.1f} MB")
+
+        stats = index_snapshot.import_index(snapshot, target)
+        print(f"import: {stats['seconds']:.2f}s  {stats['count'] / stats['seconds']:,.0f} chunks/s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Time-to-first-token against the mock Ollama server.
+
+Compares a default OllamaLLM (short keep-alive, model loaded only when the
+prompt arrives) with the configured one (long keep-alive, fixed num_ctx and
+warm-up overlapped with retrieval), and a variable-first prompt layout with
+the stable-prefix PROMPT_TEMPLATE.
+
+    python benchmarks/bench_ttft.py --questions 5 --idle 2
+"""
+import argparse
+import statistics
+import time
+
+from langchain_ollama import OllamaLLM
+
+from chat_with_docs import llm_manager
+from chat_with_docs import query_data
+from mock_ollama_server import start_server
+
+VARIABLE_FIRST_TEMPLATE = "Context:\n{context}\n\nQuestion:\n{question}\n\n" + query_data.PROMPT_TEMPLATE.split("Context:")[0]
+
+
+def time_to_first_token(llm: OllamaLLM, prompt: str, retrieval_seconds: float, warm: bool) -> float:
+    start = time.perf_counter()
+    if warm:
+        llm_manager.warm_up(llm)
+    time.sleep(retrieval_seconds)  # stands in for embedding + similarity search
+    for _ in llm.stream(prompt):
+        return time.perf_counter() - start
+    return time.perf_counter() - start
+
+
+def run(label: str, llm: OllamaLLM, template: str, args, warm: bool):
+    context = "\n\n---\n\n".join(f"chunk {i} " + "lorem ipsum " * 60 for i in range(query_data.RETRIEVAL_K))
+    samples = []
+    for i in range(args.questions):
+        prompt = template.format(context=context, question=f"Question number {i}?")
+        samples.append(time_to_first_token(llm, prompt, args.retrieval, warm))
+        time.sleep(args.idle)
+    print(f"{label:<34} TTFT p50 {statistics.median(samples):.2f}s  max {max(samples):.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--idle", type=float, default=2.0, help="Seconds between questions")
+    parser.add_argument("--retrieval", type=float, default=0.5, help="Simulated retrieval seconds")
+    parser.add_argument("--load-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    server, base_url, _ = start_server(load_seconds=args.load_seconds)
+    try:
+        num_ctx = llm_manager.context_window_for(query_data.max_prompt_chars())
+        default = OllamaLLM(model="mock", base_url=base_url, keep_alive="1s")  # expires during idle gaps
+        tuned = OllamaLLM(model="mock-tuned", base_url=base_url, keep_alive="30m", num_ctx=num_ctx)
+        run("default, variable-first prompt", default, VARIABLE_FIRST_TEMPLATE, args, warm=False)
+        run("keep-alive + warm-up, stable prefix", tuned, query_data.PROMPT_TEMPLATE, args, warm=True)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Latency and recall of two-stage (document centroid -> chunk) retrieval vs a flat chunk search.
+
+Builds a synthetic clustered corpus in a temporary Chroma store: every
+document has a topic vector and its chunks are noisy copies of it. Recall@k
+is measured against the flat search results.
+
+    python benchmarks/bench_two_stage.py --documents 20000 --chunks-per-doc 10 --top-documents 20
+"""
+import argparse
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from chat_with_docs import document_index
+from chat_with_docs import vector_store_manager
+
+K = 5
+
+
+def build_corpus(client, documents: int, chunks_per_doc: int, dim: int, rng) -> np.ndarray:
+    collection = client.get_or_create_collection(vector_store_manager.DEFAULT_COLLECTION)
+    topics = rng.standard_normal((documents, dim), dtype=np.float32)
+    batch_docs = max(1, 5000 // chunks_per_doc)
+    for start in range(0, documents, batch_docs):
+        doc_ids = range(start, min(documents, start + batch_docs))
+        ids, embeddings, metadatas = [], [], []
+        for d in doc_ids:
+            noise = rng.standard_normal((chunks_per_doc, dim), dtype=np.float32) * 0.8
+            embeddings.append(topics[d] + noise)
+            for c in range(chunks_per_doc):
+                ids.append(f"data/doc{d}.pdf:0:{c}")
+                metadatas.append({"source": f"data/doc{d}.pdf", "page": 0})
+        collection.add(ids=ids, embeddings=np.concatenate(embeddings), metadatas=metadatas)
+    return topics
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--chunks-per-doc", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--top-documents", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    workdir = tempfile.mkdtemp(prefix="cwd-two-stage-bench-")
+    try:
+        client = vector_store_manager.get_client(workdir)
+        topics = build_corpus(client, args.documents, args.chunks_per_doc, args.dim, rng)
+        start = time.perf_counter()
+        document_index.update_document_index(client, vector_store_manager.DEFAULT_COLLECTION)
+        print(f"corpus: {args.documents * args.chunks_per_doc} chunks in {args.documents} documents; "
+              f"document index built in {time.perf_counter() - start:.1f}s")
+
+        chunks = client.get_collection(vector_store_manager.DEFAULT_COLLECTION)
+        queries = topics[rng.integers(0, args.documents, args.queries)] + \
+            rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+        flat_ms, two_stage_ms, recalls = [], [], []
+        for query in queries.tolist():
+            start = time.perf_counter()
+            flat = chunks.query(query_embeddings=[query], n_results=K, include=[])["ids"][0]
+            flat_ms.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            sources = document_index.select_documents(client, vector_store_manager.DEFAULT_COLLECTION, query,
+                                                      args.top_documents)
+            fine = chunks.query(query_embeddings=[query], n_results=K, where={"source": {"$in": sources}},
+                                include=[])["ids"][0]
+            two_stage_ms.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(set(flat) & set(fine)) / K)
+
+        def p(values, q):
+            return np.percentile(values, q)
+
+        print(f"flat:      p50 {p(flat_ms, 50):.2f} ms  p95 {p(flat_ms, 95):.2f} ms")
+        print(f"two-stage: p50 {p(two_stage_ms, 50):.2f} ms  p95 {p(two_stage_ms, 95):.2f} ms  "
+              f"recall@{K} vs flat {statistics.mean(recalls):.3f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Latency of one `populate-db --watch` burst against index size.
+
+A burst that opens a new index generation copies the whole store first; a
+burst written to the watcher's already open generation does not. Embeddings
+are a cheap deterministic stand-in, so the numbers are copy + Chroma cost.
+
+    python benchmarks/bench_watch_burst.py --sizes 5000 20000 50000 --dim 384
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from bench_index_snapshot import build_store, directory_size
+from chat_with_docs import cli_utils
+from chat_with_docs import index_generations
+from chat_with_docs import watcher
+
+
+class HashEmbeddings(Embeddings):
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def embed_query(self, text: str) -> list:
+        seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32).tolist()
+
+    def embed_documents(self, texts: list) -> list:
+        return [self.embed_query(text) for text in texts]
+
+
+def burst(root: str, data_file: str, embeddings: Embeddings, revision: int, generation: watcher.OpenGeneration) -> float:
+    with open(data_file, "w") as f:
+        f.write(f"Revision {revision}. " + "The edited file has a few pages of new text. " * 100)
+    start = time.perf_counter()
+    watcher.index_changes({data_file}, set(), generation.open(), embeddings)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 20000, 50000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--bursts", type=int, default=3)
+    args = parser.parse_args()
+    cli_utils.configure_logging(quiet=True)
+    embeddings = HashEmbeddings(args.dim)
+
+    print(f"{'chunks':>8} {'store MB':>9} {'new generation':>15} {'open generation':>16}")
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp(prefix="cwd-watch-bench-")
+        try:
+            root = os.path.join(workdir, "store")
+            data_file = os.path.join(workdir, "edited.txt")
+            with index_generations.write_generation(root, fresh=True) as path:
+                build_store(path, size, args.dim)
+            store_mb = directory_size(index_generations.resolve(root)) / 1e6
+
+            # Publishing every burst: each one copies the store into a new generation.
+            copied = []
+            for revision in range(args.bursts):
+                generation = watcher.OpenGeneration(root, interval=0)
+                copied.append(burst(root, data_file, embeddings, revision, generation))
+                generation.publish()
+
+            # The watcher's open generation: only the first burst of an interval pays for the copy.
+            generation = watcher.OpenGeneration(root)
+            generation.open()
+            reused = [burst(root, data_file, embeddings, revision, generation) for revision in range(args.bursts)]
+            generation.publish()
+
+            print(f"{size:>8} {store_mb:>9.1f} {np.median(copied):>14.2f}s {np.median(reused):>15.2f}s")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
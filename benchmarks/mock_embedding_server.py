@@ -0,0 +1,110 @@
+"""OpenAI-compatible /v1/embeddings stand-in that simulates provider rate limits.
+
+Run standalone (`python benchmarks/mock_embedding_server.py --rps 5`) and point
+`openai_base_url` in config.json at it, or start it in-process with
+`start_server()` from another benchmark.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+def fake_vector(text: str, dim: int) -> list:
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+    rng = random.Random(seed)
+    return [rng.uniform(-1, 1) for _ in range(dim)]
+
+
+def make_handler(bucket: TokenBucket, latency: float, error_rate: float, dim: int, stats: dict):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status: int, body: dict, headers: dict | None = None):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not bucket.take():
+                stats["429"] += 1
+                self._reply(429, {"error": {"message": "Rate limit exceeded", "type": "rate_limit"}}, {"Retry-After": "1"})
+                return
+            if random.random() < error_rate:
+                stats["5xx"] += 1
+                self._reply(503, {"error": {"message": "Service unavailable", "type": "server_error"}})
+                return
+            inputs = body.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            time.sleep(latency * (0.5 + random.random()))
+            stats["ok"] += 1
+            data = [
+                {"object": "embedding", "index": i, "embedding": fake_vector(str(text), dim)}
+                for i, text in enumerate(inputs)
+            ]
+            tokens = sum(len(str(text)) // 4 for text in inputs)
+            self._reply(200, {
+                "object": "list",
+                "data": data,
+                "model": body.get("model", "mock"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            })
+
+    return Handler
+
+
+def start_server(rps: float = 5.0, burst: int = 5, latency: float = 0.2, error_rate: float = 0.0,
+                 dim: int = 256, port: int = 0):
+    """Start the server on a background thread; returns (server, base_url, stats)."""
+    stats = {"ok": 0, "429": 0, "5xx": 0}
+    handler = make_handler(TokenBucket(rps, burst), latency, error_rate, dim, stats)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1", stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--rps", type=float, default=5.0, help="Sustained requests per second before 429s")
+    parser.add_argument("--burst", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mean seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--dim", type=int, default=256)
+    args = parser.parse_args()
+    server, url, _ = start_server(args.rps, args.burst, args.latency, args.error_rate, args.dim, args.port)
+    print(f"Mock embedding server listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
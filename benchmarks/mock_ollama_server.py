@@ -0,0 +1,145 @@
+"""Ollama stand-in that models load time, keep-alive and prompt-prefix caching.
+
+* A model that is not resident (never loaded, keep-alive expired, or asked
+  for a different num_ctx) pays `--load-seconds` before the first token.
+* Prompt processing costs `--prefill-ms-per-kchar` for every character that
+  is not a shared prefix of the previous prompt, like Ollama's KV cache reuse.
+
+Start it with `python benchmarks/mock_ollama_server.py` and set
+`ollama_base_url` to http://127.0.0.1:11435, or use `start_server()`.
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def parse_keep_alive(value) -> float:
+    if value is None:
+        return 300.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.fullmatch(r"(-?\d+(?:\.\d+)?)([smh]?)", str(value).strip())
+    if not match:
+        return 300.0
+    number, unit = float(match.group(1)), match.group(2)
+    return number * {"": 1, "s": 1, "m": 60, "h": 3600}[unit]
+
+
+class ModelState:
+    def __init__(self, load_seconds: float, prefill_ms_per_kchar: float, token_ms: float):
+        self.load_seconds = load_seconds
+        self.prefill_ms_per_kchar = prefill_ms_per_kchar
+        self.token_ms = token_ms
+        self.lock = threading.Lock()
+        self.loaded = {}  # model -> (num_ctx, expires_at)
+        self.last_prompt = {}
+
+    def ensure_loaded(self, model: str, num_ctx, keep_alive) -> float:
+        with self.lock:
+            now = time.monotonic()
+            current = self.loaded.get(model)
+            cost = 0.0
+            if current is None or current[0] != num_ctx or current[1] < now:
+                cost = self.load_seconds
+                self.last_prompt.pop(model, None)
+            self.loaded[model] = (num_ctx, now + cost + parse_keep_alive(keep_alive))
+        time.sleep(cost)
+        return cost
+
+    def prefill(self, model: str, prompt: str) -> float:
+        with self.lock:
+            previous = self.last_prompt.get(model, "")
+            shared = len(os.path.commonprefix([previous, prompt]))
+            self.last_prompt[model] = prompt
+        cost = (len(prompt) - shared) / 1000 * self.prefill_ms_per_kchar / 1000
+        time.sleep(cost)
+        return cost
+
+
+def make_handler(state: ModelState, answer_tokens: int):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status: int, body: dict):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path.startswith("/api/tags"):
+                self._json(200, {"models": [{"name": name} for name in state.loaded]})
+            else:
+                self._json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if not self.path.startswith("/api/generate"):
+                self._json(404, {"error": "not found"})
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            model = body.get("model", "mock")
+            num_ctx = (body.get("options") or {}).get("num_ctx")
+            state.ensure_loaded(model, num_ctx, body.get("keep_alive"))
+            prompt = body.get("prompt") or ""
+            created = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            if not prompt:
+                self._json(200, {"model": model, "created_at": created, "response": "", "done": True,
+                                 "done_reason": "load"})
+                return
+            state.prefill(model, prompt)
+            if body.get("stream", True) is False:
+                time.sleep(answer_tokens * state.token_ms / 1000)
+                self._json(200, {"model": model, "created_at": created, "response": "mock " * answer_tokens,
+                                 "done": True, "done_reason": "stop",
+                                 "prompt_eval_count": len(prompt) // 4, "eval_count": answer_tokens})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(answer_tokens):
+                self._chunk({"model": model, "created_at": created, "response": "mock ", "done": False})
+                time.sleep(state.token_ms / 1000)
+            self._chunk({"model": model, "created_at": created, "response": "", "done": True, "done_reason": "stop",
+                         "prompt_eval_count": len(prompt) // 4, "eval_count": answer_tokens})
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _chunk(self, body: dict):
+            line = json.dumps(body).encode("utf-8") + b"\n"
+            self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def start_server(load_seconds: float = 3.0, prefill_ms_per_kchar: float = 150.0, token_ms: float = 20.0,
+                 answer_tokens: int = 40, port: int = 0):
+    """Start the server on a background thread; returns (server, base_url, state)."""
+    state = ModelState(load_seconds, prefill_ms_per_kchar, token_ms)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state, answer_tokens))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--load-seconds", type=float, default=3.0)
+    parser.add_argument("--prefill-ms-per-kchar", type=float, default=150.0)
+    parser.add_argument("--token-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    server, url, _ = start_server(args.load_seconds, args.prefill_ms_per_kchar, args.token_ms, port=args.port)
+    print(f"Mock Ollama server listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,117 @@
+import sys
+from typing import Any, Dict, Iterable, List
+
+from langchain.schema.document import Document
+
+
+_RESERVED_KEYS = ("source", "page", "id", "start")
+_EMPTY: Dict[str, Any] = {}
+
+
+class ChunkRecord:
+    """A chunk in the ingest pipeline, much smaller than a LangChain Document.
+
+    `source` strings are interned and the remaining loader metadata (`extra`)
+    is one dict shared by every chunk of a page, so a chunk costs little more
+    than its text. The ID and the metadata dict are only built when the chunk
+    reaches the vector store. `start` is the chunk's character offset in
+    its source:page text, kept when parent passages are stored.
+    """
+
+    __slots__ = ("source", "page", "index", "text", "extra", "start")
+
+    def __init__(self, source: str | None, page: Any, index: int, text: str, extra: Dict[str, Any] = _EMPTY,
+                 start: int | None = None):
+        self.source = source
+        self.page = page
+        self.index = index
+        self.text = text
+        self.extra = extra
+        self.start = start
+
+    @property
+    def id(self) -> str:
+        return f"{page_key(self.source, self.page)}:{self.index}"
+
+    def metadata(self) -> Dict[str, Any]:
+        metadata = dict(self.extra)
+        metadata["source"] = self.source
+        if self.page is not None:
+            metadata["page"] = self.page
+        metadata["id"] = self.id
+        if self.start is not None:
+            metadata["start"] = self.start
+        return metadata
+
+    def to_document(self) -> Document:
+        return Document(page_content=self.text, metadata=self.metadata())
+
+    def __repr__(self) -> str:
+        return f"ChunkRecord({self.id!r}, {len(self.text)} chars)"
+
+
+def page_key(source: str | None, page: Any) -> str:
+    """`source:page` key shared by chunk IDs and the parent passage store."""
+    return f"{source}:{'0' if page is None else page}"
+
+
+def _start_offsets(text: str, pieces: List[str], chunk_overlap: int) -> Iterable[int | None]:
+    # Same search as LangChain's add_start_index, which split_text() does not offer.
+    index = 0
+    previous_len = 0
+    for piece in pieces:
+        found = text.find(piece, max(0, index + previous_len - chunk_overlap))
+        if found < 0:
+            yield None
+            continue
+        index, previous_len = found, len(piece)
+        yield found
+
+
+def split_into_records(documents: Iterable[Document], text_splitter: Any, offsets: bool = False,
+                       chunk_overlap: int = 0) -> Iterable[ChunkRecord]:
+    """Split loader output into chunk records, numbering chunks per source:page.
+
+    Chunk indexes continue across consecutive documents of the same
+    source:page, which keeps IDs identical to those of existing stores.
+    With `offsets`, each record gets its start offset in the source:page
+    text (consecutive documents of a page are treated as one text);
+    `chunk_overlap` must then be the overlap the splitter was built with.
+    """
+    last_key = None
+    index = 0
+    offset_key = None
+    page_offset = 0
+    for document in documents:
+        metadata = document.metadata
+        source = metadata.get("source")
+        if isinstance(source, str):
+            source = sys.intern(source)
+        page = metadata.get("page")
+        extra = {key: value for key, value in metadata.items() if key not in _RESERVED_KEYS} or _EMPTY
+        key = page_key(source, page)
+        pieces = text_splitter.split_text(document.page_content)
+        starts = _start_offsets(document.page_content, pieces, chunk_overlap) if offsets else None
+        if key != offset_key:
+            offset_key, page_offset = key, 0
+        for text in pieces:
+            start = next(starts) if starts else None
+            if key == last_key:
+                index += 1
+            else:
+                index = 0
+                last_key = key
+            yield ChunkRecord(source, page, index, text, extra, None if start is None else page_offset + start)
+        page_offset += len(document.page_content)
+
+
+def texts(records: List[ChunkRecord]) -> List[str]:
+    return [record.text for record in records]
+
+
+def ids(records: List[ChunkRecord]) -> List[str]:
+    return [record.id for record in records]
+
+
+def metadatas(records: List[ChunkRecord]) -> List[Dict[str, Any]]:
+    return [record.metadata() for record in records]
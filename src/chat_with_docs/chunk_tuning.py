@@ -0,0 +1,287 @@
+import hashlib
+import json
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from chat_with_docs import chunk_records
+from chat_with_docs import cli_utils
+from chat_with_docs import config_manager
+from chat_with_docs import dimension_reduction
+from chat_with_docs import document_loader
+from chat_with_docs import embedding_manager
+from chat_with_docs import index_generations
+from chat_with_docs import index_maintenance
+from chat_with_docs import llm_manager
+from chat_with_docs import populate_db
+from chat_with_docs import query_data
+from chat_with_docs import vector_store_manager
+
+
+CACHE_FILE = "embedding_cache.sqlite3"
+DEFAULT_SIZES = (400, 800, 1200, 1600)
+DEFAULT_OVERLAPS = (0, 80, 160)
+DEFAULT_SAMPLE_FILES = 50
+ADD_BATCH_SIZE = 5000       # Stays under Chroma's default max batch size
+RECALL_TOLERANCE = 0.02     # Settings this close to the best recall compete on prompt size
+
+
+def _cache_path() -> str:
+    return os.path.join(os.path.dirname(config_manager.get_config_file_path()), CACHE_FILE)
+
+
+class CachedEmbeddings(Embeddings):
+    """Embedding client backed by an on-disk cache, so each text is embedded once across trials.
+
+    Vectors are keyed by the embedding settings and the text; overlapping
+    chunk settings produce many identical chunks, and re-runs embed nothing.
+    """
+
+    def __init__(self, embeddings: Embeddings, namespace: str, cache_path: str | None = None):
+        self.embeddings = embeddings
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        cache_path = cache_path or _cache_path()
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        self.conn = sqlite3.connect(cache_path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+
+    def _key(self, kind: str, text: str) -> str:
+        return hashlib.sha1(f"{self.namespace}:{kind}:{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT key, vector FROM vectors WHERE key IN ({','.join('?' * len(batch))})", batch
+            )
+            found.update((key, np.frombuffer(blob, dtype="<f4").tolist()) for key, blob in rows)
+        return found
+
+    def _store(self, keys: List[str], vectors: List[List[float]]):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO vectors (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype="<f4").tobytes()) for key, vector in zip(keys, vectors)],
+            )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key("d", text) for text in texts]
+        found = self._lookup(list(set(keys)))
+        missing = list({key: text for key, text in zip(keys, texts) if key not in found}.items())
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            vectors = self.embeddings.embed_documents([text for _, text in missing])
+            self._store([key for key, _ in missing], vectors)
+            found.update(zip((key for key, _ in missing), vectors))
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key("q", text)
+        found = self._lookup([key])
+        if key in found:
+            self.hits += 1
+            return found[key]
+        self.misses += 1
+        vector = self.embeddings.embed_query(text)
+        self._store([key], [vector])
+        return vector
+
+    def close(self):
+        self.conn.close()
+
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    """Read question/expected-source pairs from a JSON-lines file.
+
+    Each line is {"question": "...", "source": "data/file.pdf"} or uses
+    "sources": [...] when any of several files answers the question.
+    """
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON ({e})") from e
+            sources = entry.get("sources") or ([entry["source"]] if entry.get("source") else [])
+            if not entry.get("question") or not sources:
+                raise ValueError(f"{path}:{line_number}: each line needs a 'question' and a 'source' or 'sources'.")
+            questions.append({"question": entry["question"], "sources": [os.path.normpath(s) for s in sources]})
+    if not questions:
+        raise ValueError(f"No questions found in '{path}'.")
+    return questions
+
+
+def _source_matches(found: str | None, expected: str) -> bool:
+    if not found:
+        return False
+    found = os.path.normpath(found)
+    if os.sep not in expected:
+        return os.path.basename(found) == expected  # bare file names match anywhere in the corpus
+    return found == expected or found.endswith(os.sep + expected)
+
+
+def sample_corpus(data_path: str, questions: List[Dict[str, Any]], sample_files: int) -> List[str]:
+    """All files the questions expect plus random other files, up to `sample_files` in total."""
+    files = [
+        os.path.normpath(os.path.join(root, name))
+        for root, _, names in os.walk(data_path) for name in sorted(names)
+        if document_loader.is_supported(name)
+    ]
+    expected = [s for q in questions for s in q["sources"]]
+    chosen = [f for f in files if any(_source_matches(f, s) for s in expected)]
+    missing = [s for s in dict.fromkeys(expected) if not any(_source_matches(f, s) for f in chosen)]
+    if missing:
+        cli_utils.print_warning(f"{len(missing)} expected sources are not in '{data_path}': {', '.join(missing[:5])}")
+    others = [f for f in files if f not in chosen]
+    random.Random(0).shuffle(others)
+    return chosen + others[:max(0, sample_files - len(chosen))]
+
+
+def _prompt_tokens(contexts: List[str], question: str) -> int:
+    prompt = query_data.PROMPT_TEMPLATE.format(context="\n\n---\n\n".join(contexts), question=question)
+    return len(prompt) // llm_manager.CHARS_PER_TOKEN
+
+
+def run_trial(documents: list, embeddings: Any, questions: List[Dict[str, Any]], chunk_size: int,
+              chunk_overlap: int, k: int) -> Dict[str, Any]:
+    """Index the sample with one chunking setting in a scratch store and score retrieval."""
+    store_path = tempfile.mkdtemp(prefix="chat_with_docs-tune-")
+    try:
+        start = time.perf_counter()
+        chunks = populate_db.split_documents(documents, chunk_size, chunk_overlap)
+        if getattr(embeddings, "needs_fit", False):
+            embeddings.fit(chunk_records.texts(chunks))
+        db = vector_store_manager.open_store(store_path, embeddings)
+        for offset in range(0, len(chunks), ADD_BATCH_SIZE):
+            batch = chunks[offset:offset + ADD_BATCH_SIZE]
+            db.add_texts(chunk_records.texts(batch), metadatas=chunk_records.metadatas(batch),
+                         ids=chunk_records.ids(batch))
+        ingest_seconds = time.perf_counter() - start
+        hits, prompt_tokens, latencies = 0, [], []
+        for entry in questions:
+            start = time.perf_counter()
+            results = db.similarity_search(entry["question"], k=k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if any(_source_matches(doc.metadata.get("source"), s) for doc in results for s in entry["sources"]):
+                hits += 1
+            prompt_tokens.append(_prompt_tokens([doc.page_content for doc in results], entry["question"]))
+        chunk_chars = sum(len(chunk.text) for chunk in chunks)
+        return {
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "chunks": len(chunks),
+            "embedding_tokens": chunk_chars // llm_manager.CHARS_PER_TOKEN,
+            "ingest_seconds": round(ingest_seconds, 3),
+            "index_bytes": index_maintenance.directory_size(store_path),
+            "recall": round(hits / len(questions), 4),
+            "prompt_tokens": round(float(np.mean(prompt_tokens)), 1),
+            "query_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        }
+    finally:
+        shutil.rmtree(store_path, ignore_errors=True)
+
+
+def choose(trials: List[Dict[str, Any]], tolerance: float = RECALL_TOLERANCE) -> Dict[str, Any]:
+    """Best recall; among settings within `tolerance` of it, the smallest prompts, then fewest chunks."""
+    best_recall = max(trial["recall"] for trial in trials)
+    candidates = [trial for trial in trials if trial["recall"] >= best_recall - tolerance]
+    return min(candidates, key=lambda trial: (trial["prompt_tokens"], trial["chunks"], -trial["recall"]))
+
+
+def _print_table(trials: List[Dict[str, Any]], chosen: Dict[str, Any], k: int):
+    from rich.table import Table
+
+    table = Table(title="Chunking sweep")
+    for column in ("size", "overlap", "chunks", f"recall@{k}", "prompt tok/query", "embed tokens",
+                   "ingest s", "index MB", "query p50 ms"):
+        table.add_column(column, justify="right")
+    for trial in trials:
+        table.add_row(
+            str(trial["chunk_size"]), str(trial["chunk_overlap"]), str(trial["chunks"]), f"{trial['recall']:.2f}",
+            f"{trial['prompt_tokens']:.0f}", str(trial["embedding_tokens"]), f"{trial['ingest_seconds']:.2f}",
+            f"{trial['index_bytes'] / 1e6:.1f}", f"{trial['query_p50_ms']:.2f}",
+            style="bold green" if trial is chosen else None,
+        )
+    cli_utils.console.print(table)
+
+
+def tune_command(config: dict, questions_path: str, sizes: Tuple[int, ...] = DEFAULT_SIZES,
+                 overlaps: Tuple[int, ...] = DEFAULT_OVERLAPS, sample_files: int = DEFAULT_SAMPLE_FILES,
+                 k: int = query_data.RETRIEVAL_K, apply: bool = False):
+    questions = load_questions(questions_path)
+    data_path = populate_db.data_path(config)
+    files = sample_corpus(data_path, questions, sample_files)
+    if not files:
+        raise ValueError(f"No supported documents found in '{data_path}'.")
+    cli_utils.print_info(f"Sampling {len(files)} files for {len(questions)} questions...")
+    documents = [document for path in files for document in document_loader.iter_file(path)]
+    if not documents:
+        raise ValueError("None of the sampled files produced any text.")
+
+    service, model_name = embedding_manager.get_embedding_settings(config)
+    reduction = dimension_reduction.reduction_label(config)
+    cached = CachedEmbeddings(embedding_manager.get_base_embedding_function(config),
+                              f"{service}:{model_name}:{reduction}")
+    settings = [(size, overlap) for size in sizes for overlap in overlaps if overlap < size]
+    if not settings:
+        raise ValueError("Every overlap is at least as large as its chunk size; nothing to try.")
+    # Without a store path a PCA projection is fitted in memory on the first trial, not saved next to the index.
+    embeddings = embedding_manager.apply_dimension_reduction(cached, {**config, "vector_store_path": None})
+    trials = []
+    try:
+        for size, overlap in settings:
+            trial = run_trial(documents, embeddings, questions, size, overlap, k)
+            trials.append(trial)
+            cli_utils.log(
+                "info",
+                f"size {size}, overlap {overlap}: recall@{k} {trial['recall']:.2f}, "
+                f"{trial['prompt_tokens']:.0f} prompt tokens/query, {trial['chunks']} chunks",
+                event="chunking_trial",
+                k=k,
+                **trial,
+            )
+    finally:
+        cached.close()
+    cli_utils.print_debug(f"Embedding cache: {cached.hits} hits, {cached.misses} texts embedded.")
+
+    chosen = choose(trials)
+    if cli_utils.is_interactive():
+        _print_table(trials, chosen, k)
+    current = populate_db.chunking_settings(config)
+    proposed = (chosen["chunk_size"], chosen["chunk_overlap"])
+    cli_utils.log(
+        "success",
+        f"Best setting: chunk_size {proposed[0]}, chunk_overlap {proposed[1]} "
+        f"(recall@{k} {chosen['recall']:.2f}, {chosen['prompt_tokens']:.0f} prompt tokens/query).",
+        event="chunking_chosen",
+        chunk_size=proposed[0],
+        chunk_overlap=proposed[1],
+        previous_chunk_size=current[0],
+        previous_chunk_overlap=current[1],
+    )
+    if proposed == current:
+        cli_utils.print_info("The configured chunking already matches; nothing to change.")
+        return
+    if not apply:
+        cli_utils.print_info("Re-run with --apply to save these settings to your config.")
+        return
+    config_manager.update_config_file({"chunk_size": proposed[0], "chunk_overlap": proposed[1]},
+                                      index=config.get("index_name"))
+    config["chunk_size"], config["chunk_overlap"] = proposed
+    cli_utils.print_success("Saved chunk_size and chunk_overlap to your config.")
+    if index_generations.has_data(config.get("vector_store_path") or ""):
+        cli_utils.print_info("Run 'chat-with-docs populate-db --reset' to re-chunk the documents already indexed.")
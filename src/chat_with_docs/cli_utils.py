@@ -1,16 +1,144 @@
+import atexit
+import json
 import sys
+import threading
 import time
 import requests
 
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, TextIO
+
 from rich.console import Console
 from rich.prompt import Prompt, Confirm
 from rich.panel import Panel
 from rich.text import Text
 from rich.live import Live
 from rich.spinner import Spinner
+from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TimeRemainingColumn, TimeElapsedColumn
 
 console = Console()
 
+# ---------------------- LOGGING ----------------------
+
+LEVELS = {"debug": 10, "info": 20, "success": 25, "warning": 30, "error": 40}
+LOG_FORMATS = ("rich", "json")
+JSON_BUFFER_EVENTS = 512   # Buffered JSON events are written in one go...
+JSON_FLUSH_SECONDS = 1.0   # ...or at least this often
+
+_STYLES = {
+    "debug": "[dim]{}[/dim]",
+    "info": "[blue]ℹ️  {}[/blue]",
+    "success": "[bold green]✅  {}[/bold green]",
+    "warning": "[yellow]⚠️  {}[/yellow]",
+    "error": "[bold red]❌  {}[/bold red]",
+}
+
+
+class JsonEventWriter:
+    """Writes events as JSON lines, buffered so logging stays off the ingest hot path."""
+
+    def __init__(self, stream: TextIO, buffer_events: int = JSON_BUFFER_EVENTS, flush_seconds: float = JSON_FLUSH_SECONDS):
+        self.stream = stream
+        self.buffer_events = buffer_events
+        self.flush_seconds = flush_seconds
+        self._lines: list = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def write(self, record: dict):
+        line = json.dumps(record, default=str, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._lines.append(line)
+            due = len(self._lines) >= self.buffer_events or time.monotonic() - self._last_flush >= self.flush_seconds
+        if due or record["level"] == "error":
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            lines, self._lines = self._lines, []
+            self._last_flush = time.monotonic()
+        if lines:
+            self.stream.write("".join(lines))
+            self.stream.flush()
+
+
+_level = LEVELS["info"]
+_json_writer: JsonEventWriter | None = None
+
+
+def configure_logging(level: str = "info", quiet: bool = False, log_format: str = "rich", stream: TextIO | None = None):
+    """Select the output mode for all print_* helpers and log events.
+
+    `quiet` only shows warnings and errors. `log_format="json"` replaces the
+    rich messages with buffered JSON lines on `stream` (stderr by default),
+    keeping stdout for answers.
+    """
+    global _level, _json_writer
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Unsupported log format '{log_format}'. Use one of: {', '.join(LOG_FORMATS)}.")
+    _level = LEVELS["warning"] if quiet else LEVELS[level]
+    if _json_writer:
+        _json_writer.flush()
+    _json_writer = JsonEventWriter(stream or sys.stderr) if log_format == "json" else None
+    if _json_writer:
+        atexit.register(_json_writer.flush)
+
+
+def logging_settings() -> dict:
+    """Arguments for configure_logging() that reproduce the current mode, e.g. in worker processes."""
+    level = next(name for name, value in LEVELS.items() if value == _level)
+    return {"level": level, "log_format": "json" if _json_writer else "rich"}
+
+
+def is_interactive() -> bool:
+    """True when rich progress bars and info messages are shown."""
+    return _json_writer is None and _level <= LEVELS["info"]
+
+
+def log(level: str, message: str | None = None, event: str = "message", **fields: Any):
+    """Report a message and/or a structured event.
+
+    In rich mode only `message` is printed (events without a message are
+    silent); in JSON mode every event is written with its fields.
+    """
+    if LEVELS[level] < _level:
+        return
+    if _json_writer:
+        record = {"ts": round(time.time(), 3), "level": level, "event": event}
+        if message is not None:
+            record["message"] = Text.from_markup(message).plain
+        record.update(fields)
+        _json_writer.write(record)
+    elif message is not None:
+        console.print(_STYLES[level].format(message))
+
+
+def flush_logs():
+    if _json_writer:
+        _json_writer.flush()
+
+
+@contextmanager
+def progress(description: str, total: int | None = None, transient: bool = False) -> Iterator[Callable[..., None]]:
+    """Progress bar (or spinner when `total` is None); yields an `advance(n=1)` callable.
+
+    Hidden in quiet and JSON modes.
+    """
+    if total is None:
+        columns = (SpinnerColumn(), TextColumn("[progress.description]{task.description}"))
+    else:
+        columns = (
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+            TimeRemainingColumn(),
+            TimeElapsedColumn(),
+        )
+    with Progress(*columns, console=console, transient=transient, disable=not is_interactive()) as bar:
+        task = bar.add_task(description, total=total)
+        yield lambda n=1: bar.update(task, advance=n)
+
 # ---------------------- UI OUTPUT FUNCTIONS ----------------------
 
 def print_intro(title: str, instructions: str):
@@ -23,20 +151,24 @@ def print_intro(title: str, instructions: str):
     console.print(panel)
 
 
+def print_debug(message: str):
+    log("debug", message)
+
+
 def print_info(message: str):
-    console.print(f"[blue]ℹ️  {message}[/blue]")
+    log("info", message)
 
 
 def print_warning(message: str):
-    console.print(f"[yellow]⚠️  {message}[/yellow]")
+    log("warning", message)
 
 
 def print_error(message: str):
-    console.print(f"[bold red]❌  {message}[/bold red]")
+    log("error", message)
 
 
 def print_success(message: str):
-    console.print(f"[bold green]✅  {message}[/bold green]")
+    log("success", message)
 
 # ---------------------- PROMPT FUNCTIONS ----------------------
 
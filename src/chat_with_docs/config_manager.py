@@ -1,11 +1,9 @@
 import json
 import os
 
-from rich.console import Console
 from rich.text import Text
 
-
-_console=Console()
+from chat_with_docs import cli_utils
 
 
 DEFAULT_CONFIG = {
@@ -19,6 +17,34 @@ DEFAULT_CONFIG = {
     "vector_store_path": "chroma",     # Default path for the Chroma vector store
     "gemini_api_key": None,            # Placeholder for Gemini API key
     "openai_api_key": None,            # Placeholder for OpenAI API key
+    "ollama_base_url": "http://localhost:11434", # Ollama server used for chat and embeddings
+    "ollama_keep_alive": "30m",        # How long Ollama keeps the chat model loaded after a request
+    "ollama_num_ctx": None,            # Ollama context window; None sizes it to the packed prompt
+    "openai_base_url": None,           # Optional OpenAI-compatible endpoint (e.g. a local mock server)
+    "embedding_service": None,         # Embedding backend if not preferred_ai_service, e.g. "onnx" (local, in-process)
+    "onnx_embedding_model": None,      # Local model directory with model.onnx and tokenizer.json
+    "onnx_threads": None,              # CPU threads for local ONNX inference; None uses all cores
+    "onnx_pooling": "mean",            # "mean" or "cls", as the local model was trained
+    "embedding_batch_size": 32,        # Texts per embedding request (or local ONNX inference batch)
+    "embedding_max_concurrency": 8,    # Upper bound for in-flight remote embedding requests
+    "two_stage_retrieval": False,      # Pick the closest documents first, then search only their chunks
+    "two_stage_top_documents": 20,     # Documents kept by the coarse stage
+    "near_duplicate_threshold": None,  # e.g. 0.85: skip chunks this similar (MinHash Jaccard) to stored ones
+    "embedding_reduction": None,       # None, "native" (API-side dimensions), "truncate" (Matryoshka) or "pca"
+    "embedding_dimensions": None,      # Stored vector size when embedding_reduction is set, e.g. 256
+    "chunk_size": 800,                 # Characters per chunk (see 'tune-chunking')
+    "chunk_overlap": 80,               # Characters shared by neighbouring chunks
+    "parent_chunk_size": None,         # Small-to-big: characters of surrounding page text sent per matching chunk
+    "data_path": None,                 # Folder populate-db reads; None means 'data' in the working directory
+    "indexes": {},                     # Named indexes: {"legal": {"vector_store_path": ..., other overrides}}
+    "default_index": None,             # Index used without --index; None uses the top-level settings
+    "index_pool_size": 8,              # Vector stores a long-running session keeps open at once
+    "index_idle_seconds": 600,         # Open vector stores unused for this long are closed
+    "query_deadline_seconds": 90,      # Budget per question; a slower answer is cut off (None: no limit)
+    "query_retrieval_seconds": 10,     # Part of the budget vector search may use before keyword search takes over
+    "usage_ledger": True,              # Record tokens and latencies of questions and populate-db batches (see 'usage-report')
+    "usage_ledger_path": None,         # None: usage.sqlite3 next to this config file
+    "usage_prices": {},                # USD per million tokens, e.g. {"gpt-4o-mini": {"input": 0.15, "output": 0.6}}
 }
 def get_config_file_path()->str:
     home_dir=os.path.expanduser("~")
@@ -35,16 +61,16 @@ def load_config()->dict:
                 settings=json.load(f)
                 merged_settings=DEFAULT_CONFIG.copy()
                 merged_settings.update(settings)
-                _console.print(f"[green]Configuration loaded from {config_path}[/green]")
+                cli_utils.log("success",f"Configuration loaded from {config_path}",event="config_loaded",path=config_path)
                 return merged_settings
         else:
-            _console.print(f"[yellow]Configuration file not found at {config_path}. Using default settings.[/yellow]")
+            cli_utils.print_warning(f"Configuration file not found at {config_path}. Using default settings.")
             return DEFAULT_CONFIG.copy()
     except json.JSONDecodeError:
-        _console.print(f"[bold red]Error: Invalid JSON in config file {config_path}. Using default settings.[/bold red]")
+        cli_utils.print_error(f"Invalid JSON in config file {config_path}. Using default settings.")
         return DEFAULT_CONFIG.copy()
     except Exception as e:
-        _console.print(f"[bold red]An unexpected error occurred loading config: {e}. Using default settings.[/bold red]")
+        cli_utils.print_error(f"An unexpected error occurred loading config: {e}. Using default settings.")
         return DEFAULT_CONFIG.copy()
 
 
@@ -58,15 +84,53 @@ def save_config(settings:dict):
         os.makedirs(app_config_dir,exist_ok=True)
         with open(config_path,'w')as f:
             json.dump(settings,f,indent=4)
-        _console.print(f"[green]Configuration saved to {config_path}[/green]")
+        cli_utils.log("success",f"Configuration saved to {config_path}",event="config_saved",path=config_path)
     except IOError as e:
-         _console.print(f"[bold red]Error: Could not save configuration to {config_path}: {e}[/bold red]")
+         cli_utils.print_error(f"Could not save configuration to {config_path}: {e}")
     except Exception as e:
-         _console.print(f"[bold red]An unexpected error occurred saving config: {e}[/bold red]")
+         cli_utils.print_error(f"An unexpected error occurred saving config: {e}")
 
          
 
 
+def update_config_file(updates:dict,index:str|None=None):
+    """Change only the given keys in the saved config file, leaving everything else as written.
+
+    With `index`, the keys are changed in that named index's entry instead.
+    """
+    config_path = get_config_file_path()
+    settings={}
+    if os.path.exists(config_path):
+        with open(config_path) as f:
+            settings=json.load(f)
+    if index:
+        settings.setdefault("indexes",{}).setdefault(index,{}).update(updates)
+    else:
+        settings.update(updates)
+    save_config(settings)
+
+
+def index_names(config:dict)->list:
+    return sorted(config.get("indexes") or {})
+
+
+def index_config(config:dict,name:str|None=None)->dict:
+    """Settings of a named index: the top-level settings overridden by its entry in `indexes`.
+
+    Without a name, `default_index` is used if set, otherwise the top-level settings.
+    """
+    name=name or config.get("default_index")
+    if not name:
+        return config
+    indexes=config.get("indexes") or {}
+    if name not in indexes:
+        raise ValueError(f"Unknown index '{name}'. Configured indexes: {', '.join(sorted(indexes)) or 'none'}.")
+    settings=indexes[name] or {}
+    if not settings.get("vector_store_path"):
+        raise ValueError(f"Index '{name}' needs its own 'vector_store_path' in the config.")
+    return {**config,**settings,"index_name":name}
+
+
 def get_setting(key:str,default=None):
     config=load_config()
     return config.get(key,default)
@@ -91,6 +155,8 @@ def is_configured(config:dict)->bool:
         case "openai":
             if not config.get("openai_chat_model")or config.get("openai_api_key") is None:
                 return False
+    if config.get("embedding_service")=="onnx" and not config.get("onnx_embedding_model"):
+        return False
     return True
 
 
@@ -0,0 +1,180 @@
+import hashlib
+import os
+import random
+from typing import Any, Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from chat_with_docs import cli_utils
+
+
+REDUCTION_METHODS = ("native", "truncate", "pca")
+PCA_SAMPLE_SIZE = 2000
+# Models trained with Matryoshka representation learning keep most of their
+# quality when truncated to a prefix of their dimensions.
+MATRYOSHKA_MODELS = ("text-embedding-3-small", "text-embedding-3-large", "mxbai-embed-large",
+                     "nomic-embed-text", "gemini-embedding-001")
+NATIVE_DIMENSION_MODELS = ("text-embedding-3-small", "text-embedding-3-large")
+
+
+def reduction_label(config: dict) -> str | None:
+    method = config.get("embedding_reduction")
+    dimensions = config.get("embedding_dimensions")
+    if not method or not dimensions:
+        return None
+    return f"{method}-{int(dimensions)}"
+
+
+def parse_reduction_label(label: str | None) -> Dict[str, Any]:
+    if not label:
+        return {"embedding_reduction": None, "embedding_dimensions": None}
+    method, dimensions = label.rsplit("-", 1)
+    return {"embedding_reduction": method, "embedding_dimensions": int(dimensions)}
+
+
+def supports_native_dimensions(model_name: str) -> bool:
+    return any(model_name.startswith(name) for name in NATIVE_DIMENSION_MODELS)
+
+
+def projection_path(vector_store_path: str, service: str, model_name: str, dimensions: int) -> str:
+    digest = hashlib.sha1(f"{service}:{model_name}:{dimensions}".encode("utf-8")).hexdigest()[:10]
+    return os.path.join(vector_store_path, f"projection-{digest}.npz")
+
+
+def projection_path_for_record(vector_store_path: str, record: dict | None) -> str | None:
+    """Projection file of an index_meta embedding record, or None when it is not PCA-reduced."""
+    settings = parse_reduction_label((record or {}).get("reduction"))
+    if settings["embedding_reduction"] != "pca":
+        return None
+    return projection_path(vector_store_path, record["provider"], record["model"], settings["embedding_dimensions"])
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class ReducedEmbeddings(Embeddings):
+    """Wraps an embedding client and stores fewer dimensions per vector.
+
+    `truncate` keeps the first `dimensions` components (Matryoshka models);
+    `pca` projects onto principal components fitted on a sample of the corpus
+    and saved next to the index, so queries get the same projection.
+    Vectors are L2-normalized after reduction.
+    """
+
+    def __init__(self, embeddings: Embeddings, method: str, dimensions: int, projection_file: str | None = None):
+        if method not in ("truncate", "pca"):
+            raise ValueError(f"Unsupported client-side reduction method: {method}")
+        self.embeddings = embeddings
+        self.method = method
+        self.dimensions = dimensions
+        self.projection_file = projection_file
+        self.mean: np.ndarray | None = None
+        self.components: np.ndarray | None = None
+        self._fit_cache: Dict[str, List[float]] = {}
+        if method == "pca" and projection_file and os.path.exists(projection_file):
+            with np.load(projection_file) as data:
+                self.mean, self.components = data["mean"], data["components"]
+
+    def __getattr__(self, name: str) -> Any:
+        # ingest_batch_size, report(), tokens_per_second... of the wrapped client
+        if name == "embeddings":
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
+
+    @property
+    def needs_fit(self) -> bool:
+        if self.method != "pca":
+            return False
+        # A missing file means the store was reset; the old projection no longer describes it.
+        return self.components is None or bool(self.projection_file and not os.path.exists(self.projection_file))
+
+    def fit(self, texts: List[str]):
+        """Fit the PCA projection on a sample of corpus texts and persist it."""
+        if len(texts) > PCA_SAMPLE_SIZE:
+            texts = random.Random(0).sample(texts, PCA_SAMPLE_SIZE)
+        if len(texts) <= self.dimensions:
+            raise ValueError(
+                f"PCA to {self.dimensions} dimensions needs more than {self.dimensions} sample chunks "
+                f"(got {len(texts)}). Lower embedding_dimensions or index more documents first."
+            )
+        cli_utils.print_info(f"Fitting PCA projection to {self.dimensions} dimensions on {len(texts)} chunks...")
+        full = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        self.fit_vectors(full)
+        # The sample's full vectors are reused when these texts are stored, so fitting costs no extra calls.
+        self._fit_cache = dict(zip(texts, full.tolist()))
+        if self.projection_file:
+            os.makedirs(os.path.dirname(self.projection_file), exist_ok=True)
+            np.savez(self.projection_file, mean=self.mean, components=self.components)
+
+    def fit_vectors(self, vectors: np.ndarray):
+        """Fit the PCA projection in memory from full-dimension vectors."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        mean = vectors.mean(axis=0)
+        _, _, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+        self.mean, self.components = mean, vt[:self.dimensions].astype(np.float32)
+
+    def reduce(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.method == "truncate":
+            return _normalize(vectors[:, :self.dimensions])
+        if self.components is None:
+            raise ValueError("PCA projection has not been fitted yet. Run populate-db first.")
+        return _normalize((vectors - self.mean) @ self.components.T)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Batches repeat texts (headers, boilerplate): embed each distinct one once.
+        missing = list(dict.fromkeys(t for t in texts if t not in self._fit_cache))
+        fresh = dict(zip(missing, self.embeddings.embed_documents(missing))) if missing else {}
+        full = [self._fit_cache[t] if t in self._fit_cache else fresh[t] for t in texts]
+        for t in texts:
+            self._fit_cache.pop(t, None)
+        return self.reduce(np.asarray(full)).tolist() if full else []
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.reduce(np.asarray([self.embeddings.embed_query(text)]))[0].tolist()
+
+
+def recall_at_k(full_corpus: np.ndarray, full_queries: np.ndarray, reduced_corpus: np.ndarray,
+                reduced_queries: np.ndarray, k: int) -> float:
+    """Share of the full-dimension top-k neighbours that reduced vectors also return (cosine)."""
+    def top_k(corpus, queries):
+        scores = _normalize(queries) @ _normalize(corpus).T
+        return np.argsort(-scores, axis=1)[:, :k]
+
+    expected, actual = top_k(full_corpus, full_queries), top_k(reduced_corpus, reduced_queries)
+    return float(np.mean([len(set(e) & set(a)) / k for e, a in zip(expected, actual)]))
+
+
+def _pseudo_query(text: str, max_chars: int = 200) -> str:
+    # The opening of a chunk stands in for a question about it.
+    text = " ".join(text.split())
+    end = text.find(". ")
+    return text[:end + 1] if 0 < end < max_chars else text[:max_chars]
+
+
+def evaluate(full_embeddings: Embeddings, reduced_embeddings: Embeddings, texts: List[str], k: int,
+             num_queries: int) -> Dict[str, Any]:
+    """Recall@k of reduced vectors against full-dimension retrieval over a corpus sample."""
+    rng = random.Random(0)
+    queries = [_pseudo_query(text) for text in rng.sample(texts, min(num_queries, len(texts)))]
+    full_corpus = np.asarray(full_embeddings.embed_documents(texts), dtype=np.float32)
+    full_queries = np.asarray([full_embeddings.embed_query(q) for q in queries], dtype=np.float32)
+    if isinstance(reduced_embeddings, ReducedEmbeddings):
+        if reduced_embeddings.needs_fit:
+            reduced_embeddings.fit_vectors(full_corpus)
+        reduced_corpus = reduced_embeddings.reduce(full_corpus)
+        reduced_queries = reduced_embeddings.reduce(full_queries)
+    else:
+        reduced_corpus = np.asarray(reduced_embeddings.embed_documents(texts), dtype=np.float32)
+        reduced_queries = np.asarray([reduced_embeddings.embed_query(q) for q in queries], dtype=np.float32)
+    return {
+        "corpus": len(texts),
+        "queries": len(queries),
+        "full_dimension": full_corpus.shape[1],
+        "reduced_dimension": reduced_corpus.shape[1],
+        "recall": recall_at_k(full_corpus, full_queries, reduced_corpus, reduced_queries, k),
+    }
@@ -0,0 +1,104 @@
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+from chat_with_docs import cli_utils
+
+
+DOCUMENT_COLLECTION_SUFFIX = "-documents"
+REBUILD_PAGE_SIZE = 2000
+UPSERT_BATCH_SIZE = 1000
+
+
+def document_collection_name(chunk_collection_name: str) -> str:
+    return f"{chunk_collection_name}{DOCUMENT_COLLECTION_SUFFIX}"
+
+
+def _get_document_collection(client: Any, chunk_collection_name: str) -> Any:
+    # Centroids are compared by direction, so this collection uses cosine distance.
+    return client.get_or_create_collection(
+        document_collection_name(chunk_collection_name),
+        metadata={"hnsw:space": "cosine"},
+    )
+
+
+def _accumulate(sums: Dict[str, np.ndarray], counts: Dict[str, int], page: dict):
+    for embedding, metadata in zip(page["embeddings"], page["metadatas"]):
+        source = (metadata or {}).get("source")
+        if source is None:
+            continue
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+        if source in sums:
+            sums[source] += vector
+            counts[source] += 1
+        else:
+            sums[source] = vector.copy()
+            counts[source] = 1
+
+
+def update_document_index(client: Any, chunk_collection_name: str, sources: Iterable[str] | None = None) -> int:
+    """(Re)compute one centroid vector per `source` from its chunk embeddings.
+
+    With `sources=None` the whole chunk collection is scanned once; otherwise
+    only the given sources are refreshed, and sources that no longer have any
+    chunks are dropped from the document index. Returns the number of
+    document vectors written.
+    """
+    chunks = client.get_or_create_collection(chunk_collection_name)
+    documents = _get_document_collection(client, chunk_collection_name)
+    sums: Dict[str, np.ndarray] = {}
+    counts: Dict[str, int] = {}
+    if sources is None:
+        total = chunks.count()
+        for offset in range(0, total, REBUILD_PAGE_SIZE):
+            page = chunks.get(limit=REBUILD_PAGE_SIZE, offset=offset, include=["embeddings", "metadatas"])
+            _accumulate(sums, counts, page)
+        stale = set(documents.get(include=[])["ids"]) - set(sums)
+    else:
+        sources = list(dict.fromkeys(sources))
+        for source in sources:
+            _accumulate(sums, counts, chunks.get(where={"source": source}, include=["embeddings", "metadatas"]))
+        stale = {source for source in sources if source not in sums}
+    if stale:
+        documents.delete(ids=list(stale))
+
+    ids = list(sums)
+    for start in range(0, len(ids), UPSERT_BATCH_SIZE):
+        batch = ids[start:start + UPSERT_BATCH_SIZE]
+        documents.upsert(
+            ids=batch,
+            embeddings=[(sums[s] / counts[s]).tolist() for s in batch],
+            documents=batch,
+            metadatas=[{"source": s, "chunks": counts[s]} for s in batch],
+        )
+    return len(ids)
+
+
+def has_document_index(client: Any, chunk_collection_name: str) -> bool:
+    try:
+        return client.get_collection(document_collection_name(chunk_collection_name)).count() > 0
+    except Exception:
+        return False
+
+
+def select_documents(client: Any, chunk_collection_name: str, query_embedding: List[float], top_m: int) -> List[str]:
+    """Coarse stage: the `top_m` sources whose centroid is closest to the query."""
+    if not has_document_index(client, chunk_collection_name):
+        return []
+    documents = _get_document_collection(client, chunk_collection_name)
+    result = documents.query(query_embeddings=[query_embedding], n_results=top_m, include=["metadatas"])
+    return [metadata["source"] for metadata in result["metadatas"][0]]
+
+
+def ensure_document_index(client: Any, chunk_collection_name: str):
+    """Build the document index for stores populated before it existed."""
+    if has_document_index(client, chunk_collection_name):
+        return
+    if not client.get_or_create_collection(chunk_collection_name).count():
+        return
+    cli_utils.print_info("Building document-level index for two-stage retrieval...")
+    count = update_document_index(client, chunk_collection_name)
+    cli_utils.print_success(f"Indexed {count} documents.")
@@ -1,11 +1,13 @@
 import os
+import time
 import pytesseract
 from chat_with_docs import cli_utils
+from chat_with_docs import ocr_pipeline
+from chat_with_docs import streaming_loaders
 
-from typing import List
+from typing import Iterator,List
 from langchain.schema.document import Document
 from langchain_community.document_loaders import PyPDFLoader,Docx2txtLoader
-from PIL import Image
 
 
 
@@ -13,7 +15,8 @@ def load_pdf(file_path:str)->List[Document]:
     try:
         loader = PyPDFLoader(file_path)
         documents = loader.load()
-        cli_utils.print_info(f"Loaded PDF: {os.path.basename(file_path)} ({len(documents)} pages)")
+        cli_utils.log("info",f"Loaded PDF: {os.path.basename(file_path)} ({len(documents)} pages)",
+                      event="file_loaded",path=file_path,kind="pdf",parts=len(documents))
         return documents
     except Exception as e:
         cli_utils.print_warning(f"Could not load PDF '{os.path.basename(file_path)}': {e}")
@@ -25,7 +28,8 @@ def load_docx(file_path:str)->List[Document]:
         loader = Docx2txtLoader(file_path)
         documents = loader.load()
         if documents:
-            cli_utils.print_info(f"Loaded DOCX: {os.path.basename(file_path)}")
+            cli_utils.log("info",f"Loaded DOCX: {os.path.basename(file_path)}",
+                          event="file_loaded",path=file_path,kind="docx",parts=len(documents))
             return documents
         else:
              cli_utils.print_warning(f"DOCX '{os.path.basename(file_path)}' loaded but no content found.")
@@ -38,15 +42,17 @@ def load_docx(file_path:str)->List[Document]:
 
 def load_img(file_path:str)->List[Document]:
     try:
-        img = Image.open(file_path)
-        text = pytesseract.image_to_string(img)
-        if text.strip():
-            document = Document(
-                page_content=text.strip(),
-                metadata={"source":file_path,"type":"image_ocr"}
+        documents,stats=ocr_pipeline.ocr_image_file(file_path)
+        if documents:
+            frames_note=f" ({len(documents)}/{stats.frames_total} frames)" if stats.frames_total>1 else ""
+            cli_utils.log(
+                "info",
+                f"Loaded Image (OCR): {os.path.basename(file_path)}{frames_note} "
+                f"in {stats.ocr_seconds:.2f}s, ~{stats.estimated_seconds_saved():.2f}s OCR saved",
+                event="file_loaded",path=file_path,kind="image",parts=len(documents),
+                frames=stats.frames_total,ocr_seconds=round(stats.ocr_seconds,3),
             )
-            cli_utils.print_info(f"Loaded Image (OCR): {os.path.basename(file_path)}")
-            return [document]
+            return documents
         else:
             cli_utils.print_warning(f"No text found in image '{os.path.basename(file_path)}' after OCR.")
             return []
@@ -65,41 +71,79 @@ def load_img(file_path:str)->List[Document]:
         
 
 
-def load_documents_from_directory(data_path:str)->List[Document]:
-    all_documents:List[Document]=[]
-    supported_extensions = {
-        ".pdf":load_pdf,
-        ".docx":load_docx,
-        ".png":load_img,
-        ".jpg":load_img,
-        ".jpeg":load_img,
-        ".tiff":load_img,
-        ".bmp":load_img,
-        ".gif":load_img,
-    }
+SUPPORTED_EXTENSIONS = {
+    ".pdf":load_pdf,
+    ".docx":load_docx,
+    ".png":load_img,
+    ".jpg":load_img,
+    ".jpeg":load_img,
+    ".tiff":load_img,
+    ".bmp":load_img,
+    ".gif":load_img,
+    # Streaming loaders: yield documents one bounded segment at a time
+    ".txt":streaming_loaders.load_text,
+    ".md":streaming_loaders.load_text,
+    ".html":streaming_loaders.load_html,
+    ".htm":streaming_loaders.load_html,
+    ".csv":streaming_loaders.load_csv,
+}
+
+
+def is_supported(file_path:str)->bool:
+    return os.path.splitext(file_path)[1].lower() in SUPPORTED_EXTENSIONS
+
+
+def iter_file(file_path:str)->Iterator[Document]:
+    loader_func = SUPPORTED_EXTENSIONS.get(os.path.splitext(file_path)[1].lower())
+    if loader_func is None:
+        cli_utils.log("info",f"Skipping unsupported file: {os.path.basename(file_path)}",event="file_skipped",path=file_path)
+        return
+    start=time.perf_counter()
+    yield from loader_func(file_path)
+    cli_utils.log("debug",event="file_timing",path=file_path,seconds=round(time.perf_counter()-start,3))
+
+
+def load_file(file_path:str)->List[Document]:
+    return list(iter_file(file_path))
+
+
+def iter_files_from_directory(data_path:str)->Iterator[str]:
     if not os.path.exists(data_path):
         cli_utils.print_error(f"Data folder '{data_path}' not found. Please create it and add your documents.")
-        return []
+        return
     if not os.listdir(data_path):
         cli_utils.print_warning(f"Data folder '{data_path}' is empty. Add some documents to load.")
-        return []
+        return
     cli_utils.print_info(f"Scanning '{data_path}' for documents...")
     for root,_,files in os.walk(data_path):
         for file in files:
-            file_path = os.path.join(root, file)
-            file_extension = os.path.splitext(file)[1].lower()
-
-            if file_extension in supported_extensions:
-                loader_func = supported_extensions[file_extension]
-                documents = loader_func(file_path)
-                all_documents.extend(documents)
-            else:
-                cli_utils.print_info(f"Skipping unsupported file: {os.path.basename(file_path)}")
-        if not all_documents:
-            cli_utils.print_warning("No supported documents were loaded from the directory.")
-        else:
-            cli_utils.print_success(f"Successfully loaded {len(all_documents)} document parts from {len(files)} files.")
-    return all_documents
+            yield os.path.join(root, file)
+
+
+def iter_documents_from_directory(data_path:str)->Iterator[Document]:
+    """Yield document parts file by file; streaming loaders keep memory bounded for huge files."""
+    start=time.perf_counter()
+    file_count=0
+    part_count=0
+    for file_path in iter_files_from_directory(data_path):
+        for document in iter_file(file_path):
+            part_count+=1
+            yield document
+        file_count+=1
+    if not file_count:
+        return
+    if not part_count:
+        cli_utils.print_warning("No supported documents were loaded from the directory.")
+    else:
+        cli_utils.log(
+            "success",f"Successfully loaded {part_count} document parts from {file_count} files.",
+            event="directory_loaded",path=data_path,files=file_count,parts=part_count,
+            seconds=round(time.perf_counter()-start,3),
+        )
+
+
+def load_documents_from_directory(data_path:str)->List[Document]:
+    return list(iter_documents_from_directory(data_path))
         
 
 
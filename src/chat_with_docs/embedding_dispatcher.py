@@ -0,0 +1,218 @@
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from chat_with_docs import cli_utils
+
+
+RETRYABLE_STATUS = {408, 409, 429}
+RATE_LIMIT_MARKERS = ("429", "rate limit", "ratelimit", "resource_exhausted", "resource exhausted", "quota")
+TRANSIENT_ERROR_NAMES = ("timeout", "connection", "serviceunavailable", "internalservererror")
+
+
+def _status_code(exc: BaseException) -> int | None:
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        for candidate in (
+            getattr(exc, "status_code", None),
+            getattr(exc, "code", None),
+            getattr(getattr(exc, "response", None), "status_code", None),
+        ):
+            if isinstance(candidate, int):
+                return candidate
+            value = getattr(candidate, "value", None)  # http.HTTPStatus / grpc enums
+            if isinstance(value, int) and 100 <= value < 600:
+                return value
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+def classify_error(exc: BaseException) -> Tuple[bool, bool]:
+    """Return (retryable, congestion) for an exception raised by an embedding client.
+
+    `congestion` marks rate limiting and server overload, which should shrink
+    the concurrency window; other retryable errors are only retried.
+    """
+    status = _status_code(exc)
+    if status is not None:
+        if status == 429 or status >= 500:
+            return True, True
+        return status in RETRYABLE_STATUS, False
+    message = str(exc).lower()
+    if any(marker in message for marker in RATE_LIMIT_MARKERS):
+        return True, True
+    name = type(exc).__name__.lower()
+    if any(marker in name for marker in TRANSIENT_ERROR_NAMES):
+        return True, False
+    return False, False
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is the usual rule of thumb for English BPE vocabularies.
+    return max(1, len(text) // 4)
+
+
+class AdaptiveEmbeddingDispatcher(Embeddings):
+    """Keeps several embedding batches in flight against a remote provider.
+
+    The number of concurrent requests follows AIMD: it grows by one after a
+    full window of fast successful batches and is halved on 429/5xx responses
+    or when latency exceeds `target_latency`. Failed batches are retried with
+    full-jitter exponential backoff.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        batch_size: int = 32,
+        initial_concurrency: int = 2,
+        max_concurrency: int = 8,
+        target_latency: float = 10.0,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = max(1, min(initial_concurrency, self.max_concurrency))
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.tokens_embedded = 0
+        self.embed_seconds = 0.0
+        self.retries = 0
+        self.throttled = 0
+        self._credit = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def ingest_batch_size(self) -> int:
+        # Lets callers hand over enough texts at once to fill every in-flight slot.
+        return self.batch_size * self.max_concurrency
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens_embedded / self.embed_seconds if self.embed_seconds else 0.0
+
+    def _on_success(self, latency: float, submitted_at: float):
+        with self._lock:
+            if latency > self.target_latency:
+                self._decrease(submitted_at)
+                return
+            self._credit += 1.0 / self.concurrency
+            if self._credit >= 1.0 and self.concurrency < self.max_concurrency:
+                self.concurrency += 1
+                self._credit = 0.0
+
+    def _on_congestion(self, submitted_at: float):
+        with self._lock:
+            self.throttled += 1
+            self._decrease(submitted_at)
+
+    def _decrease(self, submitted_at: float):
+        # Batches already in flight when we last backed off report the same
+        # congestion event; only react once per round trip, like TCP.
+        if submitted_at <= self._last_decrease:
+            return
+        self._last_decrease = time.monotonic()
+        self.concurrency = max(1, self.concurrency // 2)
+        self._credit = 0.0
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _timed_call(self, batch: List[str]) -> Tuple[List[List[float]], float]:
+        start = time.perf_counter()
+        vectors = self.embeddings.embed_documents(batch)
+        return vectors, time.perf_counter() - start
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results: List[List[List[float]] | None] = [None] * len(batches)
+        # (ready_at, attempt, batch index)
+        waiting: List[Tuple[float, int, int]] = [(0.0, 0, i) for i in range(len(batches))]
+        in_flight: Dict[Future, Tuple[int, int, float]] = {}
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            while waiting or in_flight:
+                now = time.monotonic()
+                waiting.sort()
+                while waiting and waiting[0][0] <= now and len(in_flight) < self.concurrency:
+                    _, attempt, idx = waiting.pop(0)
+                    future = executor.submit(self._timed_call, batches[idx])
+                    in_flight[future] = (idx, attempt, time.monotonic())
+                if not in_flight:
+                    time.sleep(max(0.0, waiting[0][0] - now))
+                    continue
+                # Only wake up for a backoff deadline if there is a free slot to use it.
+                timeout = None
+                if waiting and len(in_flight) < self.concurrency:
+                    timeout = max(0.0, waiting[0][0] - now)
+                done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    idx, attempt, submitted_at = in_flight.pop(future)
+                    try:
+                        vectors, latency = future.result()
+                    except Exception as e:
+                        retryable, congestion = classify_error(e)
+                        if not retryable or attempt >= self.max_retries:
+                            for pending in in_flight:
+                                pending.cancel()
+                            raise
+                        if congestion:
+                            self._on_congestion(submitted_at)
+                        self.retries += 1
+                        waiting.append((time.monotonic() + self._backoff(attempt), attempt + 1, idx))
+                        continue
+                    self._on_success(latency, submitted_at)
+                    results[idx] = vectors
+
+        self.embed_seconds += time.perf_counter() - start
+        self.tokens_embedded += sum(estimate_tokens(t) for t in texts)
+        return [vector for batch in results for vector in batch]  # type: ignore[union-attr]
+
+    def embed_query(self, text: str) -> List[float]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embeddings.embed_query(text)
+            except Exception as e:
+                retryable, _ = classify_error(e)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                time.sleep(self._backoff(attempt))
+        raise RuntimeError("unreachable")
+
+    def report(self):
+        cli_utils.log(
+            "info",
+            f"Embedding throughput: {self.tokens_per_second:,.0f} tokens/s "
+            f"(concurrency {self.concurrency}/{self.max_concurrency}, "
+            f"{self.retries} retries, {self.throttled} throttled responses)",
+            event="embedding_throughput",
+            tokens_per_second=round(self.tokens_per_second, 1),
+            concurrency=self.concurrency,
+            retries=self.retries,
+            throttled=self.throttled,
+        )
+
+
+def wrap_remote_embeddings(embeddings: Embeddings, config: dict) -> Any:
+    # With a request timeout the caller is a question on a budget: it falls back instead of retrying.
+    retries = {"max_retries": 0} if config.get("embedding_request_timeout") else {}
+    return AdaptiveEmbeddingDispatcher(
+        embeddings,
+        batch_size=config.get("embedding_batch_size", 32),
+        max_concurrency=config.get("embedding_max_concurrency", 8),
+        **retries,
+    )
@@ -5,7 +5,11 @@ from typing import Any
 from pydantic import SecretStr
 
 from chat_with_docs import cli_utils
+from chat_with_docs import dimension_reduction
+from chat_with_docs import embedding_dispatcher
+from chat_with_docs import index_generations
 from chat_with_docs import llm_manager
+from chat_with_docs import onnx_embeddings
 
 from langchain_ollama import OllamaEmbeddings
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
@@ -20,10 +24,31 @@ def get_base_model_name(full_model_name: str) -> str:
     return full_model_name.split(':')[0]
 
 
+def select_embedding_service(config:dict)->str:
+    """Ask whether embeddings come from the preferred AI service or a local ONNX model; sets embedding_service."""
+    service=config.get("preferred_ai_service","ollama")
+    label={"ollama":"Ollama","gemini":"Gemini","openai":"OpenAI"}.get(service,service)
+    options=[f"{label} embeddings (same service as chat)","Local ONNX model (in-process, offline)"]
+    current=config.get("embedding_service") or service
+    selected_option=cli_utils.select_from_list(
+        f"Select your embedding backend (Current: [bold yellow]{current}[/bold yellow]):",
+        options,
+        default_index=1 if current=="onnx" else 0
+    )
+    # None follows preferred_ai_service, as configs written before embedding_service existed do.
+    config["embedding_service"]="onnx" if selected_option==options[1] else None
+    return config["embedding_service"] or service
+
+
 def select_embedding_model(config:dict):
-    service=config.get("preferred_ai_service")
+    service,_=get_embedding_settings(config)
     selected_model=None
     match service:
+        case "onnx":
+            current_model=config.get("onnx_embedding_model") or ""
+            selected_model=cli_utils.get_user_input("Local ONNX model directory (model.onnx + tokenizer.json):",current_model).strip()
+            onnx_embeddings.resolve_model(selected_model)
+            config["onnx_embedding_model"]=selected_model
         case "ollama":
             cli_utils.show_spinner("Checking Ollama server status for embedding models...")
             if not cli_utils.check_ollama_server_running():
@@ -138,14 +163,72 @@ def select_embedding_model(config:dict):
 
 
 
+def get_embedding_settings(config:dict)->tuple[str|None,str|None]:
+    service=config.get("embedding_service") or config.get("preferred_ai_service")
+    return service,config.get(f"{service}_embedding_model")
+
+
+def with_embedding_settings(config:dict,service:str,model_name:str,reduction:str|None=None)->dict:
+    return {
+        **config,
+        "embedding_service":service,
+        f"{service}_embedding_model":model_name,
+        **dimension_reduction.parse_reduction_label(reduction),
+    }
+
+
+def _native_dimensions(config:dict,model_name:str)->int|None:
+    if config.get("embedding_reduction")=="native" and dimension_reduction.supports_native_dimensions(model_name):
+        return int(config["embedding_dimensions"])
+    return None
+
+
+def apply_dimension_reduction(embeddings:Any,config:dict)->Any:
+    """Wrap `embeddings` so vectors are stored with `embedding_dimensions` components."""
+    method=config.get("embedding_reduction")
+    dimensions=config.get("embedding_dimensions")
+    if not method or not dimensions:
+        return embeddings
+    if method not in dimension_reduction.REDUCTION_METHODS:
+        raise ValueError(f"Unsupported embedding_reduction '{method}'. Use one of: {', '.join(dimension_reduction.REDUCTION_METHODS)}.")
+    service,model_name=get_embedding_settings(config)
+    if method=="native":
+        if _native_dimensions(config,model_name or ""):
+            return embeddings # the API already returns shortened vectors
+        cli_utils.print_warning(f"{service}/{model_name} cannot shorten vectors server-side; truncating client-side instead.")
+        method="truncate"
+    if method=="truncate" and get_base_model_name(model_name or "").removeprefix("models/") not in dimension_reduction.MATRYOSHKA_MODELS:
+        cli_utils.print_warning(f"{model_name} is not known to be Matryoshka-trained; truncated vectors may lose recall. Consider 'pca'.")
+    projection_file=dimension_reduction.projection_path(index_generations.resolve(config["vector_store_path"]),service,model_name,int(dimensions)) \
+        if method=="pca" and config.get("vector_store_path") else None
+    cli_utils.print_info(f"Reducing embeddings to {dimensions} dimensions ({method}).")
+    return dimension_reduction.ReducedEmbeddings(embeddings,method,int(dimensions),projection_file)
+
+
 def get_embedding_function(config:dict)-> Any:
-    service =config.get("preferred_ai_service")
-    if service =="ollama":
+    return apply_dimension_reduction(get_base_embedding_function(config),config)
+
+
+def get_base_embedding_function(config:dict)-> Any:
+    service,_=get_embedding_settings(config)
+    if service =="onnx":
+         model_path=config.get("onnx_embedding_model")
+         if not model_path:
+              raise ValueError("ONNX embedding model not configured. Set 'onnx_embedding_model' to a local model directory.")
+         cli_utils.print_info(f"Initializing local ONNX embeddings with model: {model_path}")
+         return onnx_embeddings.OnnxEmbeddings(
+              model_path,
+              batch_size=config.get("embedding_batch_size",32),
+              threads=config.get("onnx_threads"),
+              pooling=config.get("onnx_pooling") or "mean",
+         )
+    elif service =="ollama":
          model_name = config.get("ollama_embedding_model")
          if not model_name or not model_name.strip():
               raise ValueError("Ollama embedding model not configured. Please run setup.")
          cli_utils.print_info(f"Initializing OllamaEmbeddings with model: {model_name}")
-         return OllamaEmbeddings(model=model_name)
+         timeout=config.get("embedding_request_timeout")
+         return OllamaEmbeddings(model=model_name,base_url=config.get("ollama_base_url"),client_kwargs={"timeout":timeout} if timeout else {})
     elif service =="gemini":
          model_name=config.get("gemini_embedding_model")
          api_key = config.get("gemini_api_key")
@@ -157,14 +240,24 @@ def get_embedding_function(config:dict)-> Any:
          final_model_name=model_name
          if not final_model_name.startswith("models/"):
              final_model_name=f"models/{model_name}"
-         return GoogleGenerativeAIEmbeddings(model=final_model_name,google_api_key=SecretStr(api_key))
+         embeddings=GoogleGenerativeAIEmbeddings(model=final_model_name,google_api_key=SecretStr(api_key))
+         return embedding_dispatcher.wrap_remote_embeddings(embeddings,config)
     elif service =="openai":
          model_name=config.get("openai_embedding_model")
          api_key=config.get("openai_api_key") 
          if not model_name or not api_key:
               raise ValueError("OpenAI embedding model or API key not configured. Please run setup.")
          cli_utils.print_info(f"Initializing OpenAIEmbeddings with model: {model_name}")
-         return OpenAIEmbeddings(model=model_name,api_key=SecretStr(api_key))
+         embeddings=OpenAIEmbeddings(
+              model=model_name,
+              api_key=SecretStr(api_key),
+              base_url=config.get("openai_base_url"),
+              chunk_size=config.get("embedding_batch_size",32),
+              dimensions=_native_dimensions(config,model_name),
+              max_retries=0, # retries and backoff are handled by the dispatcher
+              request_timeout=config.get("embedding_request_timeout"),
+         )
+         return embedding_dispatcher.wrap_remote_embeddings(embeddings,config)
     else:
           raise ValueError(f"Unsupported AI service configured for embeddings: {service}. Please run setup.")
 
@@ -0,0 +1,436 @@
+import os
+import re
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterator, List
+
+from chat_with_docs import cli_utils
+
+
+# The configured vector_store_path is a root holding immutable index generations:
+#
+#   <root>/CURRENT                  name of the published generation, replaced atomically
+#   <root>/generations.sqlite3      reader/writer leases and the generation counter
+#   <root>/generations/gen-000042/  a complete Chroma store plus index_meta.json & co.
+#
+# Writers build the next generation in a private directory (a copy of the
+# current one, or empty for --reset) and publish it by swapping CURRENT.
+# Readers lease the generation they opened, so nothing they use is modified
+# or deleted until they let go. Stores from before generations existed are
+# read in place from the root until the first write copies them. A resumable
+# writer that dies leaves its generation "parked" so the next run can finish it.
+
+GENERATIONS_DIR = "generations"
+CURRENT_FILE = "CURRENT"
+REGISTRY_FILE = "generations.sqlite3"
+LEASE_SECONDS = 60.0  # Leases of crashed processes expire after this long
+LEGACY = ""           # Lease key of a pre-generation store kept directly in the root
+_GENERATION = re.compile(r"^gen-\d{6,}$")
+_DELETED_SUFFIX = ".deleted"
+# Snapshots open in this process per store directory; Chroma clients are shared per directory.
+_held: Counter = Counter()
+_held_lock = threading.Lock()
+_LEGACY_ENTRY = re.compile(
+    r"^(chroma\.sqlite3(-journal|-wal|-shm)?|index_meta\.json|near_duplicates\.sqlite|projection-[0-9a-f]+\.npz"
+    r"|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})$"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    id TEXT PRIMARY KEY,
+    generation TEXT NOT NULL,
+    role TEXT NOT NULL,          -- reader | writer
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS parked (
+    generation TEXT PRIMARY KEY,
+    base TEXT,                   -- generation it was copied from; NULL when built fresh or from a legacy store
+    fresh INTEGER NOT NULL,
+    parked_at REAL NOT NULL
+);
+"""
+
+
+def connect(root: str) -> sqlite3.Connection:
+    os.makedirs(root, exist_ok=True)
+    # Rollback journal rather than WAL, for the same network-filesystem reasons as the ingest queue.
+    conn = sqlite3.connect(os.path.join(root, REGISTRY_FILE), timeout=60, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout = 60000")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+@contextmanager
+def _immediate(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    # CURRENT is only read for leasing and only swapped under this lock, so a
+    # generation can never be collected between a reader choosing it and leasing it.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _holder() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def current_generation(root: str) -> str | None:
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def generation_path(root: str, generation: str | None) -> str:
+    return os.path.join(root, GENERATIONS_DIR, generation) if generation else root
+
+
+def resolve(path: str) -> str:
+    """Directory of the published store for a vector_store_path.
+
+    A generation directory (or a store from before generations) resolves to itself.
+    """
+    return generation_path(path, current_generation(path))
+
+
+def _lease(conn: sqlite3.Connection, generation: str, role: str) -> str:
+    lease_id = uuid.uuid4().hex
+    conn.execute(
+        "INSERT INTO leases (id, generation, role, holder, expires_at) VALUES (?, ?, ?, ?, ?)",
+        (lease_id, generation, role, _holder(), time.time() + LEASE_SECONDS),
+    )
+    return lease_id
+
+
+def _release(root: str, lease_id: str):
+    conn = connect(root)
+    try:
+        conn.execute("DELETE FROM leases WHERE id=?", (lease_id,))
+    finally:
+        conn.close()
+
+
+class _LeaseKeeper:
+    """Renews a generation lease in the background for as long as it is held."""
+
+    def __init__(self, root: str, lease_id: str):
+        self._root = root
+        self._lease_id = lease_id
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        conn = connect(self._root)
+        try:
+            while not self._stop.wait(LEASE_SECONDS / 3):
+                conn.execute("UPDATE leases SET expires_at=? WHERE id=?", (time.time() + LEASE_SECONDS, self._lease_id))
+        except sqlite3.Error as e:
+            cli_utils.print_warning(f"Could not renew index lease: {e}")
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class Snapshot:
+    """A leased, read-only view of one published generation.
+
+    `refresh()` moves the lease to a newer generation if one was published;
+    the old generation becomes collectable once no other reader holds it.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.generation: str | None = None
+        self._lease_id: str | None = None
+        self._keeper: _LeaseKeeper | None = None
+        self._acquire()
+
+    def _acquire(self):
+        conn = connect(self.root)
+        try:
+            with _immediate(conn):
+                generation = current_generation(self.root)
+                lease_id = _lease(conn, generation or LEGACY, "reader")
+        finally:
+            conn.close()
+        self.generation, self._lease_id = generation, lease_id
+        self._keeper = _LeaseKeeper(self.root, lease_id)
+        with _held_lock:
+            _held[self.path] += 1
+
+    def _let_go(self, path: str):
+        with _held_lock:
+            _held[path] -= 1
+            last = _held[path] <= 0
+            if last:
+                del _held[path]
+        if last:
+            close_clients(path)
+
+    @property
+    def path(self) -> str:
+        return generation_path(self.root, self.generation)
+
+    def refresh(self) -> bool:
+        if current_generation(self.root) == self.generation:
+            return False
+        old_keeper, old_lease, old_path = self._keeper, self._lease_id, self.path
+        self._acquire()
+        self._let_go(old_path)
+        old_keeper.stop()
+        _release(self.root, old_lease)
+        return True
+
+    def close(self):
+        if self._lease_id is None:
+            return
+        self._let_go(self.path)
+        self._keeper.stop()
+        _release(self.root, self._lease_id)
+        self._lease_id = None
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_snapshot(root: str) -> Snapshot:
+    return Snapshot(root)
+
+
+def _legacy_entries(root: str) -> List[str]:
+    if not os.path.isdir(root):
+        return []
+    return [name for name in os.listdir(root) if _LEGACY_ENTRY.match(name)]
+
+
+def has_data(root: str) -> bool:
+    return current_generation(root) is not None or bool(_legacy_entries(root))
+
+
+def _copy_store(source: Snapshot, target: str):
+    if source.generation:
+        shutil.copytree(source.path, target)
+        return
+    os.makedirs(target)
+    for name in _legacy_entries(source.root):
+        path = os.path.join(source.root, name)
+        if os.path.isdir(path):
+            shutil.copytree(path, os.path.join(target, name))
+        else:
+            shutil.copy2(path, os.path.join(target, name))
+
+
+def _next_generation(conn: sqlite3.Connection, root: str) -> str:
+    row = conn.execute("SELECT value FROM counters WHERE name='generation'").fetchone()
+    number = row[0] if row else 0
+    while True:
+        number += 1
+        name = f"gen-{number:06d}"
+        if not os.path.exists(generation_path(root, name)):
+            break
+    conn.execute("INSERT OR REPLACE INTO counters (name, value) VALUES ('generation', ?)", (number,))
+    return name
+
+
+def close_clients(path: str):
+    """Stop Chroma's cached client for a store directory this process is done with.
+
+    Chroma keeps one client system per directory for the life of the process;
+    stopping it persists pending writes and frees the memory and open files of
+    a generation that is published or retired.
+    """
+    import chromadb
+    from chromadb.api.shared_system_client import SharedSystemClient
+
+    # Chroma has no public API for this; the cache is a private class attribute (chromadb 1.x).
+    if not isinstance(getattr(SharedSystemClient, "_identifier_to_system", None), dict):
+        raise RuntimeError(
+            f"chromadb {chromadb.__version__} no longer exposes SharedSystemClient._identifier_to_system; "
+            "cannot flush and close the client of a finished index generation."
+        )
+    system = SharedSystemClient._identifier_to_system.pop(path, None)
+    getattr(SharedSystemClient, "_identifier_to_refcount", {}).pop(path, None)
+    if system is not None:
+        system.stop()
+
+
+def _drop_stale_parked(conn: sqlite3.Connection, root: str):
+    # A parked copy of a generation that is no longer current can never be resumed
+    # (see _resumable_generation); keeping it would only pin a full copy on disk.
+    conn.execute("DELETE FROM parked WHERE fresh=0 AND base IS NOT ?", (current_generation(root),))
+
+
+def publish(root: str, generation: str):
+    conn = connect(root)
+    try:
+        with _immediate(conn):
+            current_path = os.path.join(root, CURRENT_FILE)
+            tmp_path = f"{current_path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(generation)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, current_path)
+            conn.execute("DELETE FROM parked WHERE generation=?", (generation,))
+            _drop_stale_parked(conn, root)
+    finally:
+        conn.close()
+
+
+def _resumable_generation(conn: sqlite3.Connection, root: str, fresh: bool) -> str | None:
+    # Usable only if built the same way from the generation that is still current.
+    current = current_generation(root)
+    for name, base, was_fresh in conn.execute("SELECT generation, base, fresh FROM parked ORDER BY parked_at DESC"):
+        if bool(was_fresh) == fresh and (fresh or base == current) and os.path.isdir(generation_path(root, name)):
+            return name
+    return None
+
+
+@contextmanager
+def write_generation(root: str, fresh: bool = False, resumable: bool = False, resume: bool = False) -> Iterator[str]:
+    """Build the next generation in a private directory and publish it on success.
+
+    Yields the directory to write to: a copy of the current generation, or an
+    empty one when `fresh`. Readers keep using the current generation until the
+    new one is published; if the block raises, the new directory is discarded.
+    Only one writer per root runs at a time.
+
+    A `resumable` write is parked instead of discarded when it fails (or its
+    process dies), and `resume=True` continues the parked generation if it is
+    still based on the current one. Starting a resumable write drops any other
+    parked generation.
+    """
+    conn = connect(root)
+    try:
+        with _immediate(conn):
+            conn.execute("DELETE FROM leases WHERE expires_at < ?", (time.time(),))
+            writer = conn.execute("SELECT holder FROM leases WHERE role='writer'").fetchone()
+            if writer:
+                raise RuntimeError(f"Another process ({writer[0]}) is updating '{root}'. Try again when it finishes.")
+            generation = _resumable_generation(conn, root, fresh) if resume else None
+            resumed = generation is not None
+            if resumable:
+                conn.execute("DELETE FROM parked WHERE generation IS NOT ?", (generation,))
+            if not resumed:
+                generation = _next_generation(conn, root)
+                if resumable:
+                    conn.execute(
+                        "INSERT INTO parked (generation, base, fresh, parked_at) VALUES (?, ?, ?, ?)",
+                        (generation, None if fresh else current_generation(root), int(fresh), time.time()),
+                    )
+            lease_id = _lease(conn, generation, "writer")
+    finally:
+        conn.close()
+    keeper = _LeaseKeeper(root, lease_id)
+    path = generation_path(root, generation)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if resumed:
+            cli_utils.print_info(f"Resuming interrupted index generation {generation}.")
+        elif fresh:
+            os.makedirs(path)
+        else:
+            with open_snapshot(root) as source:
+                cli_utils.print_debug(f"Copying index generation {source.generation or '(legacy)'} to {generation}")
+                _copy_store(source, path)
+        yield path
+        close_clients(path)  # flushes everything this process wrote before readers can see it
+        publish(root, generation)
+    except BaseException:
+        close_clients(path)
+        if not resumable:
+            shutil.rmtree(path, ignore_errors=True)
+        raise
+    finally:
+        keeper.stop()
+        _release(root, lease_id)
+    cli_utils.log("debug", f"Published index generation {generation}", event="generation_published",
+                  root=root, generation=generation)
+    collect_garbage(root)
+
+
+def collect_garbage(root: str) -> int:
+    """Delete generations that are neither published nor leased; returns how many were removed."""
+    generations_dir = os.path.join(root, GENERATIONS_DIR)
+    conn = connect(root)
+    doomed = []
+    try:
+        with _immediate(conn):
+            conn.execute("DELETE FROM leases WHERE expires_at < ?", (time.time(),))
+            _drop_stale_parked(conn, root)
+            live = {generation for (generation,) in conn.execute("SELECT generation FROM leases")}
+            live |= {generation for (generation,) in conn.execute("SELECT generation FROM parked")}
+            current = current_generation(root)
+            names = os.listdir(generations_dir) if os.path.isdir(generations_dir) else []
+            for name in names:
+                if _GENERATION.match(name) and name != current and name not in live:
+                    path = os.path.join(generations_dir, name)
+                    try:
+                        # Renamed under the lock, deleted after it; a failed rename (open files on Windows) retries later.
+                        os.replace(path, path + _DELETED_SUFFIX)
+                        doomed.append(name)
+                    except OSError:
+                        pass
+            legacy = _legacy_entries(root) if current and LEGACY not in live else []
+    finally:
+        conn.close()
+    for name in os.listdir(generations_dir) if os.path.isdir(generations_dir) else []:
+        if name.endswith(_DELETED_SUFFIX):
+            shutil.rmtree(os.path.join(generations_dir, name), ignore_errors=True)
+    for name in legacy:
+        path = os.path.join(root, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    if doomed:
+        cli_utils.log("debug", f"Removed {len(doomed)} old index generation(s)", event="generations_collected",
+                      root=root, generations=doomed)
+    return len(doomed)
+
+
+def generation_stats(root: str) -> dict:
+    conn = connect(root)
+    try:
+        with _immediate(conn):
+            conn.execute("DELETE FROM leases WHERE expires_at < ?", (time.time(),))
+            _drop_stale_parked(conn, root)
+        leases = conn.execute("SELECT generation, role FROM leases").fetchall()
+        parked = [generation for (generation,) in conn.execute("SELECT generation FROM parked")]
+    finally:
+        conn.close()
+    generations_dir = os.path.join(root, GENERATIONS_DIR)
+    names = sorted(n for n in os.listdir(generations_dir) if _GENERATION.match(n)) if os.path.isdir(generations_dir) else []
+    writing = {generation for generation, role in leases if role == "writer"}
+    return {
+        "generation": current_generation(root),
+        "generations_on_disk": len(names),
+        "readers": sum(1 for _, role in leases if role == "reader"),
+        "writer": next((generation for generation, role in leases if role == "writer"), None),
+        "parked": [generation for generation in parked if generation not in writing],
+    }
@@ -0,0 +1,328 @@
+import os
+import re
+import shutil
+import sqlite3
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+from chat_with_docs import cli_utils
+from chat_with_docs import config_manager
+from chat_with_docs import document_index
+from chat_with_docs import embedding_manager
+from chat_with_docs import index_generations
+from chat_with_docs import parent_store
+from chat_with_docs import populate_db
+from chat_with_docs import vector_store_manager
+
+
+CHROMA_SQLITE_FILE = "chroma.sqlite3"
+SCAN_PAGE_SIZE = 5000
+REWRITE_BATCH_SIZE = 5000  # Stays under Chroma's default max batch size
+LATENCY_QUERIES = 50
+LATENCY_K = 5
+_SEGMENT_DIR = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def _sqlite_path(vector_store_path: str) -> str:
+    return os.path.join(vector_store_path, CHROMA_SQLITE_FILE)
+
+
+def sqlite_free_bytes(vector_store_path: str) -> tuple:
+    """(free bytes, total bytes) of Chroma's SQLite file; free pages are reclaimed by VACUUM."""
+    db_path = _sqlite_path(vector_store_path)
+    if not os.path.exists(db_path):
+        return 0, 0
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        conn.close()
+    return free_pages * page_size, page_count * page_size
+
+
+def orphaned_segment_dirs(vector_store_path: str) -> List[str]:
+    """HNSW segment directories that no collection references any more."""
+    db_path = _sqlite_path(vector_store_path)
+    if not os.path.exists(db_path):
+        return []
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        live = {row[0] for row in conn.execute("SELECT id FROM segments")}
+    finally:
+        conn.close()
+    return [
+        os.path.join(vector_store_path, name) for name in os.listdir(vector_store_path)
+        if _SEGMENT_DIR.match(name) and name not in live and os.path.isdir(os.path.join(vector_store_path, name))
+    ]
+
+
+def source_counts(collection: Any) -> Counter:
+    counts: Counter = Counter()
+    for offset in range(0, collection.count(), SCAN_PAGE_SIZE):
+        page = collection.get(limit=SCAN_PAGE_SIZE, offset=offset, include=["metadatas"])
+        counts.update((metadata or {}).get("source") for metadata in page["metadatas"])
+    return counts
+
+
+def query_latency(collection: Any, queries: int = LATENCY_QUERIES, k: int = LATENCY_K) -> Dict[str, float] | None:
+    """p50/p95 query latency in ms, using stored vectors as queries so nothing is embedded."""
+    total = collection.count()
+    if not total:
+        return None
+    rng = np.random.default_rng(0)
+    offsets = rng.integers(0, total, size=min(queries, total))
+    vectors = [collection.get(limit=1, offset=int(o), include=["embeddings"])["embeddings"][0] for o in offsets]
+    timings = []
+    for vector in vectors:
+        start = time.perf_counter()
+        collection.query(query_embeddings=[list(vector)], n_results=min(k, total), include=[])
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": float(np.percentile(timings, 50)), "p95_ms": float(np.percentile(timings, 95))}
+
+
+def missing_sources(sources: Iterable[str], data_path: str) -> List[str]:
+    """Stored sources whose file is gone, resolved against the index's data folder.
+
+    Sources are stored as populate-db saw them (data_path joined with the file
+    path), so a relative source is looked up from the working directory, inside
+    the data folder and next to it. Raises ValueError if the data folder itself
+    is missing, since then every source would look deleted.
+    """
+    data_dir = os.path.abspath(data_path)
+    if not os.path.isdir(data_dir):
+        raise ValueError(f"Data folder '{data_path}' not found; cannot tell which sources were deleted.")
+
+    def exists(source: str) -> bool:
+        if os.path.isabs(source):
+            return os.path.exists(source)
+        return any(os.path.exists(path) for path in (
+            source, os.path.join(data_dir, source), os.path.join(os.path.dirname(data_dir), source)
+        ))
+
+    return sorted(s for s in sources if s and not exists(s))
+
+
+def collect_stats(vector_store_path: str, data_path: str | None = None) -> Dict[str, Any]:
+    meta = vector_store_manager.read_index_meta(vector_store_path) or {}
+    active = meta.get("active") or {}
+    collection_name = vector_store_manager.active_collection_name(vector_store_path)
+    collection = vector_store_manager.get_client(vector_store_path).get_or_create_collection(collection_name)
+    counts = source_counts(collection)
+    free_bytes, sqlite_bytes = sqlite_free_bytes(vector_store_path)
+    orphan_dirs = orphaned_segment_dirs(vector_store_path)
+    return {
+        "collection": collection_name,
+        "provider": active.get("provider"),
+        "model": active.get("model"),
+        "reduction": active.get("reduction"),
+        "dimension": active.get("dimension"),
+        "pending": (meta.get("pending") or {}).get("collection"),
+        "chunks": sum(counts.values()),
+        "sources": counts,
+        "missing_sources": missing_sources(counts, data_path) if data_path and os.path.isdir(data_path) else [],
+        "disk_bytes": directory_size(vector_store_path),
+        "sqlite_bytes": sqlite_bytes,
+        "sqlite_free_bytes": free_bytes,
+        "orphaned_segment_bytes": sum(directory_size(d) for d in orphan_dirs),
+    }
+
+
+def _fragmentation(stats: Dict[str, Any]) -> float:
+    reclaimable = stats["sqlite_free_bytes"] + stats["orphaned_segment_bytes"]
+    return reclaimable / stats["disk_bytes"] if stats["disk_bytes"] else 0.0
+
+
+def stats_command(config: dict, top: int = 20):
+    root = config["vector_store_path"]
+    if not index_generations.has_data(root):
+        raise ValueError(f"Vector store '{root}' does not exist. Run populate-db first.")
+    with index_generations.open_snapshot(root) as snapshot:
+        stats = collect_stats(snapshot.path, populate_db.data_path(config))
+    generations = index_generations.generation_stats(root)
+    embedding = f"{stats['provider']}/{stats['model']}"
+    if stats["reduction"]:
+        embedding += f" ({stats['reduction']})"
+    cli_utils.print_info(f"Collection: {stats['collection']}" + (f" (re-embedding into {stats['pending']})" if stats["pending"] else ""))
+    cli_utils.print_info(f"Embedding: {embedding}, dimension {stats['dimension'] or 'unknown'}")
+    cli_utils.print_info(
+        f"Generation: {generations['generation'] or '(pre-generation layout)'}, "
+        f"{generations['generations_on_disk']} on disk, {generations['readers']} active reader(s)"
+        + (f", {generations['writer']} being written" if generations["writer"] else "")
+        + (f", {', '.join(generations['parked'])} interrupted (continue with 'populate-db --resume')" if generations["parked"] else "")
+    )
+    cli_utils.print_info(f"Chunks: {stats['chunks']} from {len(stats['sources'])} sources")
+    if cli_utils.is_interactive():
+        for source, count in stats["sources"].most_common(top):
+            missing = " [yellow](missing)[/yellow]" if source in stats["missing_sources"] else ""
+            cli_utils.console.print(f"  {count:>8}  {source}{missing}")
+    if len(stats["sources"]) > top:
+        cli_utils.print_info(f"... and {len(stats['sources']) - top} more sources")
+    cli_utils.print_info(
+        f"Disk: {stats['disk_bytes'] / 1e6:.1f} MB, SQLite {stats['sqlite_bytes'] / 1e6:.1f} MB "
+        f"({stats['sqlite_free_bytes'] / 1e6:.1f} MB free pages), "
+        f"orphaned index segments {stats['orphaned_segment_bytes'] / 1e6:.1f} MB"
+    )
+    cli_utils.log(
+        "info",
+        f"Fragmentation: {_fragmentation(stats):.1%} reclaimable; "
+        f"{len(stats['missing_sources'])} sources no longer exist on disk.",
+        event="index_stats",
+        **{key: value for key, value in stats.items() if key != "sources"},
+        source_count=len(stats["sources"]),
+        **generations,
+        fragmentation=round(_fragmentation(stats), 4),
+    )
+    if stats["missing_sources"] or _fragmentation(stats) > 0.2:
+        flag = " --drop-missing" if stats["missing_sources"] else ""
+        cli_utils.print_info(f"Run 'chat-with-docs index-compact{flag}' to reclaim the space.")
+
+
+def list_command(config: dict):
+    """Print every configured index with its store, embedding model and current generation."""
+    default = config.get("default_index")
+    # The top-level settings are an index of their own unless a named one is the default.
+    names = ([] if default else [None]) + config_manager.index_names(config)
+    for name in names:
+        index = config_manager.index_config(config, name)
+        root = index["vector_store_path"]
+        provider, model = embedding_manager.get_embedding_settings(index)
+        populated = index_generations.has_data(root)
+        generation = index_generations.current_generation(root) if populated else None
+        label = name or "(top-level settings)"
+        if name and name == default:
+            label += " [default]"
+        cli_utils.print_info(
+            f"{label}: {root} — {provider}/{model}, "
+            f"{generation or ('pre-generation layout' if populated else 'not populated')}, "
+            f"data from {populate_db.data_path(index)}"
+        )
+        cli_utils.log(
+            "debug", f"Index {label}", event="index_list", index=name, vector_store_path=root,
+            provider=provider, model=model, generation=generation, data_path=populate_db.data_path(index),
+        )
+
+
+def _compacted_name(collection_name: str) -> str:
+    base = re.sub(r"-c\d+$", "", collection_name)[:48]
+    return f"{base}-c{int(time.time())}"
+
+
+def rewrite_collection(vector_store_path: str) -> str:
+    """Copy the active collection into a fresh one and switch over; returns the new name.
+
+    Stored embeddings are copied as they are, so nothing is re-embedded. The
+    rebuilt HNSW index holds no deleted elements.
+    """
+    client = vector_store_manager.get_client(vector_store_path)
+    old_name = vector_store_manager.active_collection_name(vector_store_path)
+    old = client.get_or_create_collection(old_name)
+    new_name = _compacted_name(old_name)
+    new = client.create_collection(new_name, metadata=old.metadata)
+    total = old.count()
+    with cli_utils.progress("[green]Rewriting collection...", total=total) as advance:
+        for offset in range(0, total, REWRITE_BATCH_SIZE):
+            page = old.get(limit=REWRITE_BATCH_SIZE, offset=offset, include=["embeddings", "documents", "metadatas"])
+            if not page["ids"]:
+                break
+            new.add(ids=page["ids"], embeddings=page["embeddings"], documents=page["documents"],
+                    metadatas=page["metadatas"])
+            advance(len(page["ids"]))
+    if new.count() != total:
+        client.delete_collection(new_name)
+        raise RuntimeError(f"Rewrite copied {new.count()} of {total} chunks; keeping the original collection.")
+    document_index.update_document_index(client, new_name)
+    meta = vector_store_manager.read_index_meta(vector_store_path) or {
+        "version": 1, "active": {"provider": None, "model": None, "dimension": None},
+    }
+    meta["active"]["collection"] = new_name
+    vector_store_manager.write_index_meta(vector_store_path, meta)
+    vector_store_manager.drop_collection(vector_store_path, old_name)
+    return new_name
+
+
+def vacuum(vector_store_path: str):
+    for segment_dir in orphaned_segment_dirs(vector_store_path):
+        shutil.rmtree(segment_dir, ignore_errors=True)
+    db_path = _sqlite_path(vector_store_path)
+    if os.path.exists(db_path):
+        conn = sqlite3.connect(db_path, timeout=60)
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+
+
+def compact_command(config: dict, drop_missing: bool = False, rewrite: bool = True):
+    root = config["vector_store_path"]
+    if not index_generations.has_data(root):
+        raise ValueError(f"Vector store '{root}' does not exist. Run populate-db first.")
+    data_path = populate_db.data_path(config)
+    if drop_missing and not os.path.isdir(data_path):
+        raise ValueError(f"Data folder '{data_path}' not found; refusing to drop sources. Run from the folder populate-db used or set 'data_path'.")
+    meta = vector_store_manager.read_index_meta(index_generations.resolve(root)) or {}
+    if meta.get("pending"):
+        raise ValueError("A re-embedding is in progress; run populate-db to finish it before compacting.")
+    with index_generations.open_snapshot(root) as snapshot:
+        disk_before = directory_size(snapshot.path)
+        latency_before = query_latency(
+            vector_store_manager.get_client(snapshot.path).get_or_create_collection(
+                vector_store_manager.active_collection_name(snapshot.path)
+            )
+        )
+    # Compaction works on a copy; queries keep using the current generation until it is published.
+    with index_generations.write_generation(root) as vector_store_path:
+        client = vector_store_manager.get_client(vector_store_path)
+
+        def active_collection():
+            return client.get_or_create_collection(vector_store_manager.active_collection_name(vector_store_path))
+
+        removed = 0
+        if drop_missing:
+            sources = source_counts(active_collection())
+            missing = missing_sources(sources, data_path)
+            if missing and len(missing) == len([s for s in sources if s]):
+                raise ValueError(
+                    f"None of the {len(missing)} stored sources exist under '{data_path}'; refusing to drop them all. "
+                    "Check 'data_path' and the working directory."
+                )
+            if missing:
+                cli_utils.print_info(f"Dropping chunks of {len(missing)} sources that no longer exist...")
+                # Only used if near-duplicate aliases of the dropped chunks must be promoted.
+                embedding_func = embedding_manager.get_embedding_function(
+                    vector_store_manager.with_store_path(config, vector_store_path)
+                )
+                removed = populate_db.remove_sources_from_DB(missing, vector_store_path, embedding_func)
+        if rewrite:
+            new_name = rewrite_collection(vector_store_path)
+            cli_utils.print_info(f"Rewrote the index into collection '{new_name}'.")
+        latency_after = query_latency(active_collection())
+        index_generations.close_clients(vector_store_path)  # VACUUM needs Chroma's connection closed
+        vacuum(vector_store_path)
+        if parent_store.exists(vector_store_path):
+            parent_store.compact(vector_store_path)
+        disk_after = directory_size(vector_store_path)
+
+    def latency(value):
+        return f"p50 {value['p50_ms']:.2f} ms / p95 {value['p95_ms']:.2f} ms" if value else "n/a"
+
+    cli_utils.log(
+        "success",
+        f"Compaction done: removed {removed} orphaned chunks, disk {disk_before / 1e6:.1f} MB -> "
+        f"{disk_after / 1e6:.1f} MB ({(disk_before - disk_after) / 1e6:.1f} MB reclaimed); "
+        f"query latency {latency(latency_before)} -> {latency(latency_after)}.",
+        event="index_compacted",
+        removed_chunks=removed,
+        disk_bytes_before=disk_before,
+        disk_bytes_after=disk_after,
+        latency_before=latency_before,
+        latency_after=latency_after,
+    )
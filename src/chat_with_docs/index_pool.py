@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Tuple
+
+from chat_with_docs import cli_utils
+from chat_with_docs import config_manager
+from chat_with_docs import dimension_reduction
+from chat_with_docs import embedding_manager
+from chat_with_docs import query_deadline
+from chat_with_docs import vector_store_manager
+
+
+DEFAULT_MAX_OPEN = 8
+DEFAULT_IDLE_SECONDS = 600.0
+
+
+class _Entry:
+    __slots__ = ("store", "last_used")
+
+    def __init__(self, store: Any):
+        self.store = store
+        self.last_used = time.monotonic()
+
+
+class IndexPool:
+    """Bounded LRU pool of open vector stores and embedding clients for named indexes.
+
+    Each store is a leased snapshot (see index_generations), so keeping it
+    open costs its Chroma handle and in-memory HNSW index but never blocks
+    writers. Stores beyond `max_open`, or unused for `idle_seconds`, are
+    closed on the next `get()` or by a background thread that checks a few
+    times per `idle_seconds`, so an idle session frees them too. Embedding
+    clients are shared by indexes with the same provider, model and endpoint.
+    Callers should `get()` the store for each request instead of holding on
+    to it, since an evicted store is closed.
+    """
+
+    def __init__(self, config: dict, max_open: int | None = None, idle_seconds: float | None = None):
+        self._config = config
+        self.max_open = max(1, max_open or config.get("index_pool_size") or DEFAULT_MAX_OPEN)
+        self.idle_seconds = idle_seconds if idle_seconds is not None else (
+            config.get("index_idle_seconds") or DEFAULT_IDLE_SECONDS
+        )
+        self._stores: "OrderedDict[str | None, _Entry]" = OrderedDict()
+        self._embeddings: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._janitor = threading.Thread(target=self._evict_periodically, name="index-pool-janitor", daemon=True)
+        self._janitor.start()
+
+    def _evict_periodically(self):
+        while not self._stop.wait(max(1.0, self.idle_seconds / 4)):
+            self.evict_idle()
+
+    def config_for(self, name: str | None = None) -> dict:
+        config = config_manager.index_config(self._config, name)
+        # Embedding requests of a question end with its retrieval budget instead of lingering after a timeout.
+        return {**config, "embedding_request_timeout": query_deadline.request_timeout(config)}
+
+    def names(self) -> list:
+        return config_manager.index_names(self._config)
+
+    @staticmethod
+    def _embedding_key(config: dict) -> Tuple:
+        service, model_name = embedding_manager.get_embedding_settings(config)
+        return (
+            service, model_name, dimension_reduction.reduction_label(config), config.get(f"{service}_base_url"),
+            config.get("embedding_batch_size"), config.get("embedding_max_concurrency"),
+            config.get("onnx_threads"), config.get("onnx_pooling"), config.get("embedding_request_timeout"),
+        )
+
+    def _embedding_function(self, config: dict) -> Any:
+        key = self._embedding_key(config)
+        with self._lock:
+            client = self._embeddings.get(key)
+            if client is not None:
+                self._embeddings.move_to_end(key)
+        if client is None:
+            client = embedding_manager.get_base_embedding_function(config)
+            with self._lock:
+                self._embeddings[key] = client
+                while len(self._embeddings) > self.max_open:
+                    self._embeddings.popitem(last=False)
+        # Reduction is per store: a PCA projection belongs to the index it was fitted on.
+        return embedding_manager.apply_dimension_reduction(client, config)
+
+    def get(self, name: str | None = None) -> Any:
+        """Open store of the named index (None: the default index), opening it if needed."""
+        config = self.config_for(name)
+        key = config.get("index_name")
+        with self._lock:
+            closing = self._take_idle()
+            entry = self._stores.get(key)
+            if entry is not None:
+                self._stores.move_to_end(key)
+                entry.last_used = time.monotonic()
+        self._close(closing)
+        if entry is not None:
+            return entry.store
+        store = vector_store_manager.get_vector_store(config, self._embedding_function(config))
+        with self._lock:
+            existing = self._stores.get(key)
+            if existing is not None:  # opened concurrently by another thread
+                duplicate, store = store, existing.store
+            else:
+                duplicate = None
+                self._stores[key] = _Entry(store)
+            closing = []
+            while len(self._stores) > self.max_open:
+                closing.append(self._stores.popitem(last=False)[1].store)
+        if duplicate is not None:
+            self._close([duplicate])
+        self._close(closing)
+        return store
+
+    def _take_idle(self) -> list:
+        cutoff = time.monotonic() - self.idle_seconds
+        idle = [key for key, entry in self._stores.items() if entry.last_used < cutoff]
+        return [self._stores.pop(key).store for key in idle]
+
+    def _close(self, stores: list):
+        for store in stores:
+            try:
+                store.close()
+            except Exception as e:
+                cli_utils.print_warning(f"Could not close a pooled vector store: {e}")
+
+    def evict_idle(self) -> int:
+        with self._lock:
+            closing = self._take_idle()
+        self._close(closing)
+        return len(closing)
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            closing = [entry.store for entry in self._stores.values()]
+            self._stores.clear()
+            self._embeddings.clear()
+        self._close(closing)
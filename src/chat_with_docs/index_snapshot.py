@@ -0,0 +1,239 @@
+import json
+import os
+import shutil
+import struct
+import tempfile
+import time
+import zlib
+from typing import Any, Iterator, List
+
+import numpy as np
+
+from chat_with_docs import cli_utils
+from chat_with_docs import dimension_reduction
+from chat_with_docs import document_index
+from chat_with_docs import index_generations
+from chat_with_docs import vector_store_manager
+
+
+SNAPSHOT_MAGIC = b"CWDXSNAP"
+SNAPSHOT_FORMAT_VERSION = 1
+ALIGNMENT = 64            # Embedding block offset alignment, keeps np.memmap reads page-friendly
+EXPORT_PAGE_SIZE = 2000
+IMPORT_BATCH_SIZE = 5000  # Stays under Chroma's default max batch size
+TEXT_COLUMNS = ("ids", "documents", "metadatas")
+
+# Snapshot layout:
+#   magic (8 bytes) | header length (uint64 LE) | header JSON | padding to ALIGNMENT
+#   | embeddings: raw float32 little-endian, shape (count, dimension), memory-mappable
+#   | one zlib stream of JSON lines per text column (ids, documents, metadatas)
+
+
+def _pad(f, alignment: int = ALIGNMENT):
+    remainder = f.tell() % alignment
+    if remainder:
+        f.write(b"\0" * (alignment - remainder))
+
+
+class _ColumnWriter:
+    def __init__(self, directory: str, name: str):
+        self.path = os.path.join(directory, f"{name}.z")
+        self._file = open(self.path, "wb")
+        self._compressor = zlib.compressobj(6)
+
+    def write(self, values: List[Any]):
+        payload = "".join(json.dumps(v, ensure_ascii=False) + "\n" for v in values).encode("utf-8")
+        self._file.write(self._compressor.compress(payload))
+
+    def close(self):
+        self._file.write(self._compressor.flush())
+        self._file.close()
+
+
+def export_index(vector_store_path: str, output_path: str) -> dict:
+    """Write the active collection of a store to a single compact snapshot file."""
+    meta = vector_store_manager.read_index_meta(vector_store_path)
+    collection_name = vector_store_manager.active_collection_name(vector_store_path)
+    collection = vector_store_manager.get_client(vector_store_path).get_or_create_collection(collection_name)
+    total = collection.count()
+    start = time.perf_counter()
+    dimension = None
+    count = 0
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_path))) as tmp:
+        columns = {name: _ColumnWriter(tmp, name) for name in TEXT_COLUMNS}
+        embeddings_path = os.path.join(tmp, "embeddings.f32")
+        with open(embeddings_path, "wb") as embeddings_file:
+            for offset in range(0, total, EXPORT_PAGE_SIZE):
+                page = collection.get(
+                    limit=EXPORT_PAGE_SIZE,
+                    offset=offset,
+                    include=["embeddings", "documents", "metadatas"],
+                )
+                if not page["ids"]:
+                    break
+                vectors = np.asarray(page["embeddings"], dtype="<f4")
+                dimension = dimension or vectors.shape[1]
+                embeddings_file.write(vectors.tobytes())
+                for name in TEXT_COLUMNS:
+                    columns[name].write(page[name])
+                count += len(page["ids"])
+        for column in columns.values():
+            column.close()
+
+        sections = {}
+        header = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "count": count,
+            "dimension": dimension or 0,
+            "embedding": (meta or {}).get("active"),
+            "sections": sections,
+        }
+        # Section offsets live in the header itself; re-encode until its length is stable.
+        parts = [("embeddings", embeddings_path)] + [(name, columns[name].path) for name in TEXT_COLUMNS]
+        projection = dimension_reduction.projection_path_for_record(vector_store_path, (meta or {}).get("active"))
+        if projection and os.path.exists(projection):
+            parts.append(("projection", projection))  # queries need the same PCA projection
+        header_bytes = b""
+        while True:
+            position = len(SNAPSHOT_MAGIC) + 8 + len(header_bytes)
+            position += (-position) % ALIGNMENT
+            for name, path in parts:
+                size = os.path.getsize(path)
+                codec = {"embeddings": "raw-f32le", "projection": "npz"}.get(name, "zlib-jsonl")
+                sections[name] = {"offset": position, "length": size, "codec": codec}
+                position += size
+            encoded = json.dumps(header).encode("utf-8")
+            if len(encoded) == len(header_bytes):
+                header_bytes = encoded
+                break
+            header_bytes = encoded
+
+        tmp_output = f"{output_path}.tmp"
+        with open(tmp_output, "wb") as out:
+            out.write(SNAPSHOT_MAGIC)
+            out.write(struct.pack("<Q", len(header_bytes)))
+            out.write(header_bytes)
+            _pad(out)
+            for name, path in parts:
+                assert out.tell() == sections[name]["offset"]
+                with open(path, "rb") as part:
+                    shutil.copyfileobj(part, out, 1024 * 1024)
+        os.replace(tmp_output, output_path)
+
+    seconds = time.perf_counter() - start
+    return {"count": count, "dimension": dimension or 0, "bytes": os.path.getsize(output_path), "seconds": seconds}
+
+
+def read_header(snapshot_path: str) -> dict:
+    with open(snapshot_path, "rb") as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError(f"'{snapshot_path}' is not an index snapshot.")
+        (header_length,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_length))
+    if header.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported snapshot format version {header.get('format_version')} "
+            f"(expected {SNAPSHOT_FORMAT_VERSION})."
+        )
+    return header
+
+
+def open_embeddings(snapshot_path: str, header: dict) -> np.ndarray:
+    section = header["sections"]["embeddings"]
+    if not header["count"]:
+        return np.zeros((0, header["dimension"]), dtype="<f4")
+    return np.memmap(snapshot_path, dtype="<f4", mode="r", offset=section["offset"],
+                     shape=(header["count"], header["dimension"]))
+
+
+def iter_column(snapshot_path: str, header: dict, name: str, read_size: int = 1024 * 1024) -> Iterator[Any]:
+    section = header["sections"][name]
+    decompressor = zlib.decompressobj()
+    buffer = b""
+    with open(snapshot_path, "rb") as f:
+        f.seek(section["offset"])
+        remaining = section["length"]
+        while remaining:
+            raw = f.read(min(read_size, remaining))
+            if not raw:
+                break
+            remaining -= len(raw)
+            buffer += decompressor.decompress(raw)
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                yield json.loads(line)
+    buffer += decompressor.flush()
+    for line in buffer.split(b"\n"):
+        if line:
+            yield json.loads(line)
+
+
+def import_index(snapshot_path: str, vector_store_path: str, batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """Bulk-load a snapshot into a fresh store without re-embedding anything."""
+    header = read_header(snapshot_path)
+    start = time.perf_counter()
+    embeddings = open_embeddings(snapshot_path, header)
+    embedding_record = dict(header.get("embedding") or {})
+    collection_name = embedding_record.get("collection") or vector_store_manager.DEFAULT_COLLECTION
+    client = vector_store_manager.get_client(vector_store_path)
+    collection = client.get_or_create_collection(collection_name)
+
+    columns = [iter_column(snapshot_path, header, name) for name in TEXT_COLUMNS]
+    row = 0
+    ids: List[str] = []
+    documents: List[str] = []
+    metadatas: List[Any] = []
+    for chunk_id, document, metadata in zip(*columns):
+        ids.append(chunk_id)
+        documents.append(document)
+        metadatas.append(metadata)
+        if len(ids) == batch_size:
+            collection.add(ids=ids, embeddings=embeddings[row:row + len(ids)], documents=documents, metadatas=metadatas)
+            row += len(ids)
+            ids, documents, metadatas = [], [], []
+    if ids:
+        collection.add(ids=ids, embeddings=embeddings[row:row + len(ids)], documents=documents, metadatas=metadatas)
+        row += len(ids)
+    if row != header["count"]:
+        raise ValueError(f"Snapshot is truncated: expected {header['count']} rows, read {row}.")
+
+    document_index.update_document_index(client, collection_name)
+    projection = dimension_reduction.projection_path_for_record(vector_store_path, embedding_record)
+    if projection and "projection" in header["sections"]:
+        section = header["sections"]["projection"]
+        with open(snapshot_path, "rb") as src, open(projection, "wb") as dst:
+            src.seek(section["offset"])
+            dst.write(src.read(section["length"]))
+    embedding_record.update({"collection": collection_name, "dimension": header["dimension"] or None})
+    vector_store_manager.write_index_meta(vector_store_path, {"version": 1, "active": embedding_record})
+    return {"count": row, "dimension": header["dimension"], "seconds": time.perf_counter() - start}
+
+
+def export_command(config: dict, output_path: str):
+    vector_store_path = config["vector_store_path"]
+    if not index_generations.has_data(vector_store_path):
+        raise ValueError(f"Vector store '{vector_store_path}' does not exist. Run populate-db first.")
+    cli_utils.print_info(f"Exporting '{vector_store_path}' to '{output_path}'...")
+    with index_generations.open_snapshot(vector_store_path) as snapshot:
+        stats = export_index(snapshot.path, output_path)
+    rate = stats["count"] / stats["seconds"] if stats["seconds"] else 0
+    cli_utils.print_success(
+        f"Exported {stats['count']} chunks (dim {stats['dimension']}) into "
+        f"{stats['bytes'] / 1e6:.1f} MB in {stats['seconds']:.1f}s ({rate:,.0f} chunks/s)."
+    )
+
+
+def import_command(config: dict, snapshot_path: str, force: bool = False):
+    vector_store_path = config["vector_store_path"]
+    if index_generations.has_data(vector_store_path) and not force:
+        raise ValueError(f"Vector store '{vector_store_path}' is not empty. Use --force to replace it.")
+    cli_utils.print_info(f"Importing '{snapshot_path}' into '{vector_store_path}'...")
+    # The replaced index stays readable until the imported generation is published.
+    with index_generations.write_generation(vector_store_path, fresh=True) as generation:
+        stats = import_index(snapshot_path, generation)
+    rate = stats["count"] / stats["seconds"] if stats["seconds"] else 0
+    cli_utils.print_success(
+        f"Imported {stats['count']} chunks (dim {stats['dimension']}) in {stats['seconds']:.1f}s ({rate:,.0f} chunks/s)."
+    )
@@ -0,0 +1,153 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from chat_with_docs import chunk_records
+
+
+# populate-db's progress, kept beside the index generations so it outlives a failed run:
+#
+#   <root>/ingest_journal/journal.sqlite3   per-file stage and committed embedding batches
+#   <root>/ingest_journal/spool/<hash>.gz   split chunk records of each file, gzip JSON lines
+#
+# A file is 'split' once its chunks are spooled and 'embedded' once every one of
+# them is in the generation named in `state`. The journal is cleared when that
+# generation is published.
+
+JOURNAL_DIR = "ingest_journal"
+JOURNAL_FILE = "journal.sqlite3"
+SPOOL_DIR = "spool"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    chunking TEXT NOT NULL,      -- "size/overlap" the spool was split with, "+offsets" when chunks carry start offsets
+    stage TEXT NOT NULL,         -- split | embedded
+    chunks INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    generation TEXT NOT NULL,
+    chunks INTEGER NOT NULL,
+    committed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS state (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _file_state(path: str) -> Tuple[int, int] | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class IngestJournal:
+    """Durable record of which files populate-db has split and embedded.
+
+    Spooled chunks let a resumed run skip parsing and OCR; the 'embedded'
+    stage lets it skip files whose chunks are already in the generation it
+    resumes. Entries are ignored when the file or the chunking changed.
+    """
+
+    def __init__(self, root: str, chunking: Tuple[int, int], offsets: bool = False):
+        self.path = os.path.join(root, JOURNAL_DIR)
+        self.chunking = f"{chunking[0]}/{chunking[1]}" + ("+offsets" if offsets else "")
+        os.makedirs(os.path.join(self.path, SPOOL_DIR), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(self.path, JOURNAL_FILE), timeout=60, isolation_level=None)
+        self._conn.execute("PRAGMA busy_timeout = 60000")
+        self._conn.executescript(SCHEMA)
+
+    def _spool_path(self, path: str) -> str:
+        return os.path.join(self.path, SPOOL_DIR, hashlib.sha1(path.encode("utf-8")).hexdigest() + ".gz")
+
+    def reset(self):
+        """Forget all progress, e.g. when a run starts over instead of resuming."""
+        self._conn.executescript("DELETE FROM files; DELETE FROM batches; DELETE FROM state;")
+        shutil.rmtree(os.path.join(self.path, SPOOL_DIR), ignore_errors=True)
+        os.makedirs(os.path.join(self.path, SPOOL_DIR), exist_ok=True)
+
+    def bind(self, generation: str) -> Dict[str, int]:
+        """Attach the journal to the generation being written; returns the progress carried over.
+
+        Files embedded into a different generation (one that was discarded)
+        fall back to 'split', so only their embedding is redone.
+        """
+        row = self._conn.execute("SELECT value FROM state WHERE name='generation'").fetchone()
+        if row and row[0] != generation:
+            self._conn.execute("UPDATE files SET stage='split' WHERE stage='embedded'")
+            self._conn.execute("DELETE FROM batches")
+        self._conn.execute("INSERT OR REPLACE INTO state (name, value) VALUES ('generation', ?)", (generation,))
+        self.generation = generation
+        progress = {stage: n for stage, n in self._conn.execute("SELECT stage, COUNT(*) FROM files GROUP BY stage")}
+        progress["batches"] = self._conn.execute("SELECT COUNT(*) FROM batches").fetchone()[0]
+        return progress
+
+    def stage(self, path: str) -> str | None:
+        """'split' or 'embedded' if the journal still holds valid progress for the file."""
+        row = self._conn.execute(
+            "SELECT mtime_ns, size, chunking, stage FROM files WHERE path=?", (path,)
+        ).fetchone()
+        if row is None or (row[0], row[1]) != _file_state(path) or row[2] != self.chunking:
+            return None
+        if not os.path.exists(self._spool_path(path)):
+            return None
+        return row[3]
+
+    def spool(self, path: str, chunks: Iterable[chunk_records.ChunkRecord]) -> Iterator[chunk_records.ChunkRecord]:
+        """Pass chunks through while writing them to the file's spool; marks the file 'split' at the end."""
+        state = _file_state(path)
+        spool_path = self._spool_path(path)
+        tmp_path = spool_path + ".tmp"
+        count = 0
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=1) as f:
+            for chunk in chunks:
+                f.write(json.dumps([chunk.source, chunk.page, chunk.index, chunk.text, chunk.extra or None, chunk.start]) + "\n")
+                count += 1
+                yield chunk
+        os.replace(tmp_path, spool_path)
+        if state is not None:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, mtime_ns, size, chunking, stage, chunks) VALUES (?, ?, ?, ?, 'split', ?)",
+                (path, state[0], state[1], self.chunking, count),
+            )
+
+    def read_spool(self, path: str) -> Iterator[chunk_records.ChunkRecord]:
+        extras: Dict[str, Any] = {}
+        with gzip.open(self._spool_path(path), "rt", encoding="utf-8") as f:
+            for line in f:
+                source, page, index, text, extra, start = json.loads(line)
+                if isinstance(source, str):
+                    source = sys.intern(source)
+                if not extra:
+                    yield chunk_records.ChunkRecord(source, page, index, text, start=start)
+                    continue
+                # One shared dict per distinct metadata, as when the file was split.
+                extra = extras.setdefault(json.dumps(extra, sort_keys=True), extra)
+                yield chunk_records.ChunkRecord(source, page, index, text, extra, start)
+
+    def commit_batch(self, chunk_count: int, embedded_files: List[str]):
+        """Record an embedding batch the store has committed and the files it completed."""
+        self._conn.execute("BEGIN")
+        if chunk_count:
+            self._conn.execute(
+                "INSERT INTO batches (generation, chunks, committed_at) VALUES (?, ?, ?)",
+                (self.generation, chunk_count, time.time()),
+            )
+        self._conn.executemany("UPDATE files SET stage='embedded' WHERE path=?", [(path,) for path in embedded_files])
+        self._conn.execute("COMMIT")
+
+    def close(self):
+        self._conn.close()
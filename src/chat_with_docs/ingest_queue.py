@@ -0,0 +1,312 @@
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from chat_with_docs import chunk_records
+from chat_with_docs import cli_utils
+from chat_with_docs import document_index
+from chat_with_docs import document_loader
+from chat_with_docs import embedding_manager
+from chat_with_docs import parent_store
+from chat_with_docs import populate_db
+from chat_with_docs import usage_ledger
+from chat_with_docs import vector_store_manager
+
+
+DEFAULT_LEASE_SECONDS = 600.0  # A claimed file is re-queued if its worker stops renewing the lease
+MAX_ATTEMPTS = 3
+POLL_INTERVAL = 2.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'queued',  -- queued | leased | done | failed
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    payload BLOB NOT NULL,     -- zlib-compressed JSON: ids, documents, metadatas, pages (small-to-big only)
+    embeddings BLOB NOT NULL,  -- float32 little-endian, row-major
+    dimension INTEGER NOT NULL
+);
+"""
+
+
+def connect(queue_path: str) -> sqlite3.Connection:
+    # Rollback journal rather than WAL: WAL needs shared memory and breaks on network filesystems.
+    conn = sqlite3.connect(queue_path, timeout=60, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout = 60000")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+@contextmanager
+def _immediate(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    # Take the write lock up front so two workers can never claim the same file.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def enqueue(queue_path: str, data_path: str, requeue: bool = False) -> int:
+    conn = connect(queue_path)
+    paths = []
+    for root, _, files in os.walk(data_path):
+        for file in files:
+            file_path = os.path.join(root, file)
+            if document_loader.is_supported(file_path):
+                paths.append((file_path,))
+    with _immediate(conn):
+        if requeue:
+            conn.execute("UPDATE files SET status='queued', worker=NULL, lease_expires=NULL, attempts=0, error=NULL")
+        before = conn.total_changes
+        conn.executemany("INSERT OR IGNORE INTO files (path) VALUES (?)", paths)
+        added = conn.total_changes - before
+    conn.close()
+    return added
+
+
+def claim(conn: sqlite3.Connection, worker_id: str, lease_seconds: float) -> str | None:
+    now = time.time()
+    with _immediate(conn):
+        row = conn.execute(
+            "SELECT path FROM files WHERE attempts < ? AND "
+            "(status='queued' OR (status='leased' AND lease_expires < ?)) ORDER BY path LIMIT 1",
+            (MAX_ATTEMPTS, now),
+        ).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE files SET status='leased', worker=?, lease_expires=?, attempts=attempts+1 WHERE path=?",
+                (worker_id, now + lease_seconds, row[0]),
+            )
+    return row[0] if row else None
+
+
+def renew(conn: sqlite3.Connection, path: str, worker_id: str, lease_seconds: float) -> bool:
+    cursor = conn.execute(
+        "UPDATE files SET lease_expires=? WHERE path=? AND worker=? AND status='leased'",
+        (time.time() + lease_seconds, path, worker_id),
+    )
+    return cursor.rowcount == 1
+
+
+def counts(conn: sqlite3.Connection) -> dict:
+    result = {status: n for status, n in conn.execute("SELECT status, COUNT(*) FROM files GROUP BY status")}
+    result["exhausted"] = conn.execute(
+        "SELECT COUNT(*) FROM files WHERE status='leased' AND attempts >= ? AND lease_expires < ?",
+        (MAX_ATTEMPTS, time.time()),
+    ).fetchone()[0]
+    result["batches"] = conn.execute("SELECT COUNT(*) FROM batches").fetchone()[0]
+    return result
+
+
+def _outstanding(stats: dict) -> int:
+    return stats.get("queued", 0) + stats.get("leased", 0) - stats.get("exhausted", 0)
+
+
+class _LeaseKeeper:
+    """Renews a file lease in the background while OCR/embedding runs."""
+
+    def __init__(self, queue_path: str, path: str, worker_id: str, lease_seconds: float):
+        self._args = (path, worker_id, lease_seconds)
+        self._queue_path = queue_path
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        conn = connect(self._queue_path)
+        try:
+            while not self._stop.wait(self._args[2] / 3):
+                renew(conn, *self._args)
+        finally:
+            conn.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def process_file(file_path: str, embedding_func: Any,
+                 chunking: Tuple[int, int] = (populate_db.CHUNK_SIZE, populate_db.CHUNK_OVERLAP),
+                 parents: bool = False) -> Tuple[List[str], List[str], List[dict], np.ndarray, List[list]]:
+    """Parse, split and embed one file.
+
+    With `parents`, chunks record their offsets in the page text and the parsed
+    pages are returned as [source, page, text] so the writer can store them.
+    """
+    documents = document_loader.load_file(file_path)
+    if not documents:
+        return [], [], [], np.zeros((0, 0), dtype="<f4"), []
+    chunks = populate_db.split_documents(documents, *chunking, offsets=parents)
+    texts = chunk_records.texts(chunks)
+    embeddings = np.asarray(embedding_func.embed_documents(texts), dtype="<f4")
+    pages = [[d.metadata.get("source"), d.metadata.get("page"), d.page_content] for d in documents] if parents else []
+    return chunk_records.ids(chunks), texts, chunk_records.metadatas(chunks), embeddings, pages
+
+
+def run_worker(config: dict, queue_path: str, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+               log_settings: dict | None = None):
+    """Claim files from the queue, parse/OCR/split/embed them and hand the batches to the writer."""
+    if log_settings:
+        cli_utils.configure_logging(**log_settings)  # spawned processes start with default logging
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    # Each worker records its own ingest batches in the ledger of the host it runs on.
+    ledger = usage_ledger.open_ledger(config)
+    embedding_func = usage_ledger.meter(embedding_manager.get_embedding_function(config), config, ledger)
+    chunking = populate_db.chunking_settings(config)
+    parents = bool(config.get("parent_chunk_size"))
+    conn = connect(queue_path)
+    processed = 0
+    try:
+        while True:
+            file_path = claim(conn, worker_id, lease_seconds)
+            if file_path is None:
+                if _outstanding(counts(conn)) == 0:
+                    break
+                time.sleep(POLL_INTERVAL)  # other workers hold leases that may still expire
+                continue
+            try:
+                with _LeaseKeeper(queue_path, file_path, worker_id, lease_seconds):
+                    ids, texts, metadatas, embeddings, pages = process_file(file_path, embedding_func, chunking, parents)
+            except Exception as e:
+                cli_utils.print_warning(f"[{worker_id}] Failed to process '{file_path}': {e}")
+                conn.execute(
+                    "UPDATE files SET status=CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                    "worker=NULL, error=? WHERE path=? AND worker=?",
+                    (MAX_ATTEMPTS, str(e), file_path, worker_id),
+                )
+                continue
+            batch = {"ids": ids, "documents": texts, "metadatas": metadatas}
+            if parents:
+                batch["pages"] = pages
+            payload = zlib.compress(json.dumps(batch).encode("utf-8"))
+            with _immediate(conn):
+                # Only hand over the batch if we still own the lease; otherwise another worker redoes it.
+                owned = conn.execute(
+                    "UPDATE files SET status='done', error=NULL WHERE path=? AND worker=? AND status='leased'",
+                    (file_path, worker_id),
+                ).rowcount
+                if owned:
+                    conn.execute(
+                        "INSERT INTO batches (path, payload, embeddings, dimension) VALUES (?, ?, ?, ?)",
+                        (file_path, payload, embeddings.tobytes(), embeddings.shape[1] if embeddings.size else 0),
+                    )
+            processed += 1
+            cli_utils.log("info", f"[{worker_id}] Processed {os.path.basename(file_path)} ({len(ids)} chunks)",
+                          event="file_processed", worker=worker_id, path=file_path, chunks=len(ids))
+    finally:
+        conn.close()
+        if ledger:
+            ledger.close()
+    cli_utils.print_success(f"[{worker_id}] Worker finished after {processed} file(s).")
+
+
+def commit_batches(conn: sqlite3.Connection, vector_store_path: str,
+                   parents: parent_store.ParentStoreWriter | None = None) -> int:
+    """Single writer: move finished batches from the queue into the vector store.
+
+    With `parents`, the page text of each batch replaces the file's parent text
+    before its chunks are written, so no chunk points at text that is not stored.
+    """
+    client = vector_store_manager.get_client(vector_store_path)
+    collection_name = vector_store_manager.active_collection_name(vector_store_path)
+    collection = client.get_or_create_collection(collection_name)
+    committed = 0
+    for batch_id, path, payload, blob, dimension in conn.execute(
+        "SELECT id, path, payload, embeddings, dimension FROM batches ORDER BY id"
+    ).fetchall():
+        data = json.loads(zlib.decompress(payload))
+        if parents is not None:
+            parents.remove_sources([path])
+            parents.store(Document(page_content=text, metadata={"source": source, "page": page})
+                          for source, page, text in data.get("pages", []))
+        stale = set(collection.get(where={"source": path}, include=[])["ids"]) - set(data["ids"])
+        if stale:
+            collection.delete(ids=list(stale))
+        if data["ids"]:
+            embeddings = np.frombuffer(blob, dtype="<f4").reshape(len(data["ids"]), dimension)
+            for start in range(0, len(data["ids"]), 5000):
+                end = start + 5000
+                collection.upsert(
+                    ids=data["ids"][start:end],
+                    embeddings=embeddings[start:end],
+                    documents=data["documents"][start:end],
+                    metadatas=data["metadatas"][start:end],
+                )
+        document_index.update_document_index(client, collection_name, [path])
+        conn.execute("DELETE FROM batches WHERE id=?", (batch_id,))
+        committed += len(data["ids"])
+    return committed
+
+
+def run_coordinator(config: dict, embedding_func: Any, queue_path: str, data_path: str, workers: int = 0,
+                    lease_seconds: float = DEFAULT_LEASE_SECONDS, requeue: bool = False):
+    """Fill the queue, optionally start local workers, and act as the single vector-store writer."""
+    vector_store_path = config["vector_store_path"]
+    vector_store_manager.get_vector_store(config, embedding_func, background=False)
+    if getattr(embedding_func, "needs_fit", False):
+        # Workers in other processes must all share one projection, so it has to exist up front.
+        raise ValueError("The PCA projection for this store has not been fitted yet. "
+                         "Run a regular 'populate-db' on a sample of the data first.")
+    added = enqueue(queue_path, data_path, requeue=requeue)
+    cli_utils.print_info(f"Queued {added} new file(s) from '{data_path}' in '{queue_path}'.")
+
+    context = multiprocessing.get_context("spawn")
+    worker_args = (config, queue_path, lease_seconds, cli_utils.logging_settings())
+    processes = [context.Process(target=run_worker, args=worker_args, daemon=True) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    if workers:
+        cli_utils.print_info(f"Started {workers} local worker process(es). Remote workers can join with "
+                             f"'chat-with-docs ingest-worker --queue {queue_path}'.")
+
+    # Small-to-big: workers ship parsed pages with their batches and the writer stores them here.
+    parents = parent_store.ParentStoreWriter(vector_store_path) if config.get("parent_chunk_size") else None
+    conn = connect(queue_path)
+    committed = 0
+    try:
+        while True:
+            committed += commit_batches(conn, vector_store_path, parents)
+            stats = counts(conn)
+            if _outstanding(stats) == 0 and stats["batches"] == 0:
+                break
+            if processes and not any(p.is_alive() for p in processes) and not stats.get("leased"):
+                cli_utils.print_warning("All local workers exited; waiting for remote workers to finish the queue.")
+                processes = []
+            time.sleep(POLL_INTERVAL)
+    finally:
+        conn.close()
+        if parents:
+            parents.close()
+        for process in processes:
+            process.join(timeout=5)
+    vector_store_manager.record_dimension(vector_store_path)
+    conn = connect(queue_path)
+    stats = counts(conn)
+    conn.close()
+    cli_utils.print_success(
+        f"Committed {committed} chunks. Files done: {stats.get('done', 0)}, failed: "
+        f"{stats.get('failed', 0) + stats.get('exhausted', 0)}."
+    )
@@ -1,6 +1,7 @@
 import os
 import requests
 import sys
+import threading
 
 from typing import Any
 from pydantic import SecretStr
@@ -190,29 +191,82 @@ def select_chat_model(config:dict):
                 cli_utils.print_warning(f"No chat model selected for {service.upper()}.")
 
 
-def get_chat_llm(config:dict)->Any:
+CHARS_PER_TOKEN=4
+RESPONSE_TOKEN_RESERVE=1024
+MIN_NUM_CTX=2048
+MAX_NUM_CTX=32768
+
+
+def context_window_for(max_prompt_chars:int)->int:
+    """Smallest power-of-two context that fits the largest prompt we can build plus the answer.
+
+    Keeping num_ctx fixed for a session matters: Ollama reloads the model
+    whenever a request asks for a different context size.
+    """
+    needed=max_prompt_chars//CHARS_PER_TOKEN+RESPONSE_TOKEN_RESERVE
+    num_ctx=MIN_NUM_CTX
+    while num_ctx<needed and num_ctx<MAX_NUM_CTX:
+        num_ctx*=2
+    return num_ctx
+
+
+def warm_up(llm_model:Any)->threading.Thread|None:
+    """Ask Ollama to load the chat model in the background; a no-op for hosted services.
+
+    An empty generate request loads the model and refreshes its keep-alive
+    without producing tokens, so it can overlap with retrieval.
+    """
+    if not isinstance(llm_model,OllamaLLM):
+        return None
+    payload={"model":llm_model.model,"keep_alive":llm_model.keep_alive}
+    if llm_model.num_ctx:
+        payload["options"]={"num_ctx":llm_model.num_ctx}
+    base_url=(llm_model.base_url or "http://localhost:11434").rstrip("/")
+
+    def _load():
+        try:
+            requests.post(f"{base_url}/api/generate",json=payload,timeout=300)
+        except requests.exceptions.RequestException:
+            pass # generation will surface connection problems
+
+    thread=threading.Thread(target=_load,name="ollama-warm-up",daemon=True)
+    thread.start()
+    return thread
+
+
+def get_chat_llm(config:dict,max_prompt_chars:int|None=None)->Any:
     service=config.get("preferred_ai_service")
+    # A request never outlives the question it answers, so an abandoned stream closes its connection.
+    timeout=config.get("query_deadline_seconds")
     match service:
         case "ollama":
             model_name=config.get("ollama_chat_model")
             if not model_name:
                  raise ValueError("Ollama chat model not configured. Please run setup.")
-            cli_utils.print_info(f"Initializing OllamaLLM with model: {model_name}")
-            return OllamaLLM(model=model_name)
+            num_ctx=config.get("ollama_num_ctx") or (context_window_for(max_prompt_chars) if max_prompt_chars else None)
+            cli_utils.print_info(f"Initializing OllamaLLM with model: {model_name}" + (f" (num_ctx={num_ctx})" if num_ctx else ""))
+            return OllamaLLM(
+                model=model_name,
+                base_url=config.get("ollama_base_url"),
+                keep_alive=config.get("ollama_keep_alive"),
+                num_ctx=num_ctx,
+                client_kwargs={"timeout":timeout} if timeout else {},
+            )
         case "gemini":
             model_name=config.get("gemini_chat_model")
             api_key=config.get("gemini_api_key") or os.getenv("GEMINI_API_KEY")
             if not model_name or not api_key:
                 raise ValueError("Gemini chat model or API key not configured. Please run setup.")
             cli_utils.print_info(f"Initializing ChatGoogleGenerativeAI with model: {model_name}")
-            return ChatGoogleGenerativeAI(model=model_name,google_api_key=SecretStr(api_key))
+            return ChatGoogleGenerativeAI(model=model_name,google_api_key=SecretStr(api_key),timeout=timeout)
         case "openai":
             model_name=config.get("openai_chat_model")
             api_key=config.get("openai_api_key") or os.getenv("OPENAI_API_KEY")
             if not model_name or not api_key:
                 raise ValueError("OpenAI chat model or API key not configured. Please run setup.")
             cli_utils.print_info(f"Initializing ChatOpenAI with model: {model_name}")
-            return ChatOpenAI(model=model_name, api_key=SecretStr(api_key))
+            # stream_usage: the last streamed chunk carries token counts for the usage ledger.
+            return ChatOpenAI(model=model_name, api_key=SecretStr(api_key), stream_usage=True, timeout=timeout)
         case _:
              raise ValueError(f"Unsupported AI service configured: {service}. Please run setup.")
 
@@ -2,14 +2,37 @@
 import argparse
 import sys
 
+from chat_with_docs import chunk_tuning
 from chat_with_docs import cli_utils
 from chat_with_docs import config_manager
 from chat_with_docs import llm_manager
 from chat_with_docs import embedding_manager
+from chat_with_docs import index_generations
+from chat_with_docs import index_pool
+from chat_with_docs import index_maintenance
+from chat_with_docs import index_snapshot
+from chat_with_docs import ingest_journal
+from chat_with_docs import ingest_queue
+from chat_with_docs import usage_ledger
 from chat_with_docs import vector_store_manager
 
 from chat_with_docs import populate_db
 from chat_with_docs import query_data
+from chat_with_docs import watcher
+
+def _int_list(value:str)->tuple:
+    try:
+        return tuple(int(part) for part in value.split(",") if part.strip())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected comma-separated integers, got '{value}'")
+
+
+def _since(value:str)->float:
+    try:
+        return usage_ledger.parse_since(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
 
 def setup_wizard(config: dict) -> dict:
     cli_utils.print_info("[bold cyan]🚀 Chat With Documents - AI-Powered Document Conversations[/bold cyan]")
@@ -36,9 +59,12 @@ def setup_wizard(config: dict) -> dict:
 
     cli_utils.print_info("\n--- [bold]Embedding Model Selection[/bold] ---")
     try:
+        embedding_manager.select_embedding_service(config)
         embedding_manager.select_embedding_model(config)
         config_manager.save_config(config)
-        cli_utils.print_success(f"Selected Embedding Model: [bold green]{config.get(f'{selected_service}_embedding_model', 'N/A')}[/bold green]")
+        embedding_service,embedding_model=embedding_manager.get_embedding_settings(config)
+        cli_utils.print_success(f"Selected Embedding Model: [bold green]{embedding_service}/{embedding_model or 'N/A'}[/bold green]")
+        vector_store_manager.notify_embedding_change(config)
     except Exception as e:
         cli_utils.print_error(f"Failed to set up embedding model: {e}")
         cli_utils.print_info("Please resolve the issue and run setup again.")
@@ -57,8 +83,16 @@ def setup_wizard(config: dict) -> dict:
     return config
 
 
+def _print_resume_hint(config:dict):
+    try:
+        parked=index_generations.generation_stats(config["vector_store_path"])["parked"]
+    except Exception:
+        return
+    if parked:
+        cli_utils.print_info("Run 'chat-with-docs populate-db --resume' to continue where it stopped.")
+
+
 def main():
-    config=config_manager.load_config()
     parser=argparse.ArgumentParser(
         description="Chat with your documents using various AI models.",
         formatter_class=argparse.RawTextHelpFormatter # For better help text formatting
@@ -68,6 +102,29 @@ def main():
         action="store_true",
         help="Run the interactive setup wizard to configure AI services, models, and data paths."
     )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Only print warnings and errors (no progress bars)."
+    )
+    parser.add_argument(
+        "--log-format",
+        choices=cli_utils.LOG_FORMATS,
+        default="rich",
+        help="'rich' for the interactive terminal UI, 'json' for buffered JSON-lines events on stderr."
+    )
+    parser.add_argument(
+        "--log-level",
+        choices=list(cli_utils.LEVELS),
+        default="info",
+        help="Lowest message level to report (default: info)."
+    )
+    parser.add_argument(
+        "--index",
+        type=str,
+        default=None,
+        help="Named index (from 'indexes' in the config) to use instead of the default one."
+    )
     subparsers=parser.add_subparsers(dest="command",help="Available commands")
     populate_parser=subparsers.add_parser(
         "populate-db",
@@ -78,8 +135,160 @@ def main():
     populate_parser.add_argument(
         "--reset",
         action="store_true",
-        help="Clear the existing vector database before adding new documents."
+        help="Rebuild the vector database from scratch; queries keep using the old index until the new one is ready."
+    )
+    populate_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted populate-db run without re-parsing or re-embedding the files it finished."
+    )
+    populate_parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After populating, keep running and incrementally index files added, modified or deleted in 'data/'."
+    )
+    populate_parser.add_argument(
+        "--debounce",
+        type=float,
+        default=watcher.DEFAULT_DEBOUNCE,
+        help="Seconds the data folder must be quiet before a burst of changes is indexed (with --watch)."
+    )
+    populate_parser.add_argument(
+        "--publish-interval",
+        type=float,
+        default=watcher.DEFAULT_PUBLISH_INTERVAL,
+        help="Publish watched changes to queries at most this often, in seconds; bursts in between share\n"
+             "one copy of the index (with --watch)."
+    )
+    populate_parser.add_argument(
+        "--queue",
+        type=str,
+        help="Coordinate a multi-worker ingest through this SQLite work queue file (on a shared filesystem\n"
+             "for multi-host runs). This process enqueues the files and is the single vector-store writer."
+    )
+    populate_parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Number of local worker processes to start with --queue."
+    )
+    populate_parser.add_argument(
+        "--requeue",
+        action="store_true",
+        help="With --queue, re-process files already marked done or failed in the queue (implied by --reset)."
+    )
+    populate_parser.add_argument(
+        "--lease-seconds",
+        type=float,
+        default=ingest_queue.DEFAULT_LEASE_SECONDS,
+        help="Seconds before a file claimed by an unresponsive worker is re-queued."
+    )
+    worker_parser=subparsers.add_parser(
+        "ingest-worker",
+        help="Process files from a populate-db --queue work queue (run on any host sharing the filesystem).",
+        description="Claims files from the work queue, parses/OCRs/splits/embeds them and hands the\n"
+                    "finished batches to the populate-db --queue coordinator, which writes them to the vector store."
+    )
+    worker_parser.add_argument("--queue",type=str,required=True,help="Path of the SQLite work queue file.")
+    worker_parser.add_argument(
+        "--lease-seconds",
+        type=float,
+        default=ingest_queue.DEFAULT_LEASE_SECONDS,
+        help="Seconds a claimed file stays leased without renewal."
+    )
+    export_parser=subparsers.add_parser(
+        "export-index",
+        help="Write the vector database to a compact, versioned snapshot file.",
+        description="Exports chunk IDs, text, metadata and embeddings into a single compressed snapshot\n"
+                    "that can be copied to other machines and loaded with 'import-index'."
+    )
+    export_parser.add_argument("snapshot_path",type=str,help="Path of the snapshot file to write.")
+    import_parser=subparsers.add_parser(
+        "import-index",
+        help="Load a snapshot written by 'export-index' into the configured vector database.",
+        description="Bulk-loads a snapshot into a fresh vector store without re-embedding any text."
+    )
+    import_parser.add_argument("snapshot_path",type=str,help="Path of the snapshot file to load.")
+    import_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Replace the configured vector store if it already contains data."
     )
+    stats_parser=subparsers.add_parser(
+        "index-stats",
+        help="Show chunk counts per source, embedding model, disk usage and fragmentation of the vector store."
+    )
+    stats_parser.add_argument("--top",type=int,default=20,help="Number of sources to list (largest first).")
+    compact_parser=subparsers.add_parser(
+        "index-compact",
+        help="Rewrite the index and vacuum the store, optionally dropping chunks of deleted files (no re-embedding).",
+        description="Copies the stored vectors into a fresh collection, vacuums the SQLite file and reports disk\n"
+                    "and query latency before and after. With --drop-missing, chunks of deleted files are removed first."
+    )
+    compact_parser.add_argument(
+        "--drop-missing",
+        action="store_true",
+        help="Also drop chunks whose source file no longer exists in the index's data folder."
+    )
+    compact_parser.add_argument(
+        "--no-rewrite",
+        action="store_true",
+        help="Only vacuum (and drop missing sources with --drop-missing); do not rebuild the collection."
+    )
+    reduction_parser=subparsers.add_parser(
+        "eval-reduction",
+        help="Measure recall@k of the configured embedding dimension reduction.",
+        description="Embeds a sample of stored chunks at full and reduced dimensions and reports how many\n"
+                    "of the full-dimension top-k neighbours the reduced vectors still retrieve."
+    )
+    reduction_parser.add_argument("--k",type=int,default=10,help="Neighbours compared per query.")
+    reduction_parser.add_argument("--queries",type=int,default=100,help="Number of sampled queries.")
+    reduction_parser.add_argument("--corpus",type=int,default=2000,help="Number of stored chunks to search.")
+    tune_parser=subparsers.add_parser(
+        "tune-chunking",
+        help="Sweep chunk sizes and overlaps on a sample of your documents and pick the best setting.",
+        description="Indexes a sample of 'data/' once per chunk size/overlap (embeddings are cached on disk),\n"
+                    "then reports ingest time, index size, recall@k on your questions and prompt tokens per query."
+    )
+    tune_parser.add_argument(
+        "--questions",
+        type=str,
+        required=True,
+        help='JSON-lines file of {"question": ..., "source": ...} pairs; "sources": [...] accepts several files.'
+    )
+    tune_parser.add_argument(
+        "--sizes",
+        type=_int_list,
+        default=chunk_tuning.DEFAULT_SIZES,
+        help="Comma-separated chunk sizes in characters (default: 400,800,1200,1600)."
+    )
+    tune_parser.add_argument(
+        "--overlaps",
+        type=_int_list,
+        default=chunk_tuning.DEFAULT_OVERLAPS,
+        help="Comma-separated chunk overlaps in characters (default: 0,80,160)."
+    )
+    tune_parser.add_argument(
+        "--sample-files",
+        type=int,
+        default=chunk_tuning.DEFAULT_SAMPLE_FILES,
+        help="Files to index per trial; the files your questions expect are always included."
+    )
+    tune_parser.add_argument("--k",type=int,default=query_data.RETRIEVAL_K,help="Chunks retrieved per question.")
+    tune_parser.add_argument("--apply",action="store_true",help="Save the chosen chunk_size/chunk_overlap to your config.")
+    subparsers.add_parser(
+        "index-list",
+        help="List the configured named indexes with their store path, embedding model and generation."
+    )
+    usage_parser=subparsers.add_parser(
+        "usage-report",
+        help="Summarize recorded token usage, latency percentiles and estimated cost of questions and populate-db runs.",
+        description="Reads the usage ledger (see 'usage_ledger' in the config) and reports totals, p50/p95/p99\n"
+                    "latencies and cost, optionally per day, week, model, index or run."
+    )
+    usage_parser.add_argument("--since",type=_since,default=None,help="Window start: 24h, 7d, 2w or a date like 2026-10-01 (default: everything).")
+    usage_parser.add_argument("--by",choices=usage_ledger.GROUPS,default=None,help="Report one row per group instead of one for the whole window.")
+    usage_parser.add_argument("--kind",choices=("query","ingest"),default=None,help="Only report questions or only populate-db batches.")
     query_parser=subparsers.add_parser(
         "query",
         help="Ask questions about your documents using the configured AI model.",
@@ -93,6 +302,8 @@ def main():
         help="The specific question to ask about your documents. If not provided, enters interactive mode."
     )
     args=parser.parse_args()
+    cli_utils.configure_logging(level=args.log_level,quiet=args.quiet,log_format=args.log_format)
+    config=config_manager.load_config()
     if args.setup or not config_manager.is_configured(config):
         config=setup_wizard(config)
         if not args.command:
@@ -101,20 +312,120 @@ def main():
     if not config_manager.is_configured(config):
         cli_utils.print_error("Configuration is incomplete. Please run 'python main.py --setup' first.")
         sys.exit(1)
+    base_config=config
+    try:
+        config=config_manager.index_config(base_config,args.index)
+    except ValueError as e:
+        cli_utils.print_error(str(e))
+        sys.exit(1)
     if args.command=="populate-db":
         cli_utils.print_info("\n--- Populating Document Database ---")
         try:
-            embedding_func=embedding_manager.get_embedding_function(config)
-            populate_db.main(config,embedding_func,reset_db=args.reset)
+            if args.reset:
+                cli_utils.print_info("✨ Building a fresh index; queries keep using the current one until it is ready.")
+            # Writes go to a new index generation that is published atomically when the run succeeds;
+            # an interrupted run leaves it parked, with its progress journaled, for --resume.
+            journal=ingest_journal.IngestJournal(
+                config["vector_store_path"],populate_db.chunking_settings(config),offsets=bool(config.get("parent_chunk_size"))
+            )
+            if not args.resume:
+                journal.reset()
+            ledger=usage_ledger.open_ledger(config)
+            with index_generations.write_generation(config["vector_store_path"],fresh=args.reset,resumable=True,resume=args.resume) as generation:
+                generation_config=vector_store_manager.with_store_path(config,generation)
+                embedding_func=usage_ledger.meter(embedding_manager.get_embedding_function(generation_config),config,ledger)
+                if args.queue:
+                    ingest_queue.run_coordinator(
+                        generation_config,embedding_func,args.queue,populate_db.data_path(config),
+                        workers=args.workers,lease_seconds=args.lease_seconds,
+                        # A fresh generation starts empty, so files the queue already finished must be processed again.
+                        requeue=args.requeue or args.reset
+                    )
+                else:
+                    populate_db.main(generation_config,embedding_func,journal=journal)
+            journal.reset()
+            journal.close()
+            if args.watch:
+                watcher.watch(
+                    populate_db.data_path(config),config["vector_store_path"],
+                    usage_ledger.meter(embedding_manager.get_embedding_function(config),config,ledger),
+                    debounce=args.debounce,
+                    near_duplicate_threshold=config.get("near_duplicate_threshold"),
+                    chunking=populate_db.chunking_settings(config),
+                    parents=bool(config.get("parent_chunk_size")),
+                    publish_interval=args.publish_interval
+                )
+        except KeyboardInterrupt:
+            cli_utils.print_warning("Interrupted.")
+            _print_resume_hint(config)
+            sys.exit(130)
         except Exception as e:
             cli_utils.print_error(f"Error during database population: {e}")
+            _print_resume_hint(config)
+            sys.exit(1)
+    elif args.command=="ingest-worker":
+        try:
+            ingest_queue.run_worker(config,args.queue,lease_seconds=args.lease_seconds)
+        except Exception as e:
+            cli_utils.print_error(f"Error in ingest worker: {e}")
+            sys.exit(1)
+    elif args.command=="export-index":
+        try:
+            index_snapshot.export_command(config,args.snapshot_path)
+        except Exception as e:
+            cli_utils.print_error(f"Error during index export: {e}")
+            sys.exit(1)
+    elif args.command=="import-index":
+        try:
+            index_snapshot.import_command(config,args.snapshot_path,force=args.force)
+        except Exception as e:
+            cli_utils.print_error(f"Error during index import: {e}")
+            sys.exit(1)
+    elif args.command=="index-stats":
+        try:
+            index_maintenance.stats_command(config,top=args.top)
+        except Exception as e:
+            cli_utils.print_error(f"Error reading index stats: {e}")
+            sys.exit(1)
+    elif args.command=="index-compact":
+        try:
+            index_maintenance.compact_command(config,drop_missing=args.drop_missing,rewrite=not args.no_rewrite)
+        except Exception as e:
+            cli_utils.print_error(f"Error during index compaction: {e}")
+            sys.exit(1)
+    elif args.command=="eval-reduction":
+        try:
+            vector_store_manager.evaluate_reduction_command(config,k=args.k,queries=args.queries,corpus=args.corpus)
+        except Exception as e:
+            cli_utils.print_error(f"Error during reduction evaluation: {e}")
+            sys.exit(1)
+    elif args.command=="tune-chunking":
+        try:
+            chunk_tuning.tune_command(
+                config,args.questions,sizes=args.sizes,overlaps=args.overlaps,
+                sample_files=args.sample_files,k=args.k,apply=args.apply
+            )
+        except Exception as e:
+            cli_utils.print_error(f"Error during chunking tuning: {e}")
+            sys.exit(1)
+    elif args.command=="index-list":
+        try:
+            index_maintenance.list_command(base_config)
+        except Exception as e:
+            cli_utils.print_error(f"Error listing indexes: {e}")
+            sys.exit(1)
+    elif args.command=="usage-report":
+        try:
+            usage_ledger.report_command(config,since=args.since,by=args.by,kind=args.kind)
+        except Exception as e:
+            cli_utils.print_error(f"Error reading usage: {e}")
             sys.exit(1)
     elif args.command=="query":
         cli_utils.print_info("\n--- Querying Documents ---")
         try:
-            llm_model=llm_manager.get_chat_llm(config)
-            embedding_func=embedding_manager.get_embedding_function(config)
-            query_data.main(config, llm_model, embedding_func, query_text=args.query_text) # type: ignore
+            pool=index_pool.IndexPool(base_config)
+            llm_model=llm_manager.get_chat_llm(config,max_prompt_chars=query_data.session_prompt_chars(config,pool))
+            query_data.main(config, llm_model, pool, query_text=args.query_text, ledger=usage_ledger.open_ledger(config)) # type: ignore
         except Exception as e :
             cli_utils.print_error(f"Error during query: {e}")
             sys.exit(1)
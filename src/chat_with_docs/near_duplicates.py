@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import zlib
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+
+INDEX_FILE = "near_duplicates.sqlite"
+NUM_PERM = 128
+BANDS = 16                # 16 bands x 8 rows: pairs above ~0.7 Jaccard almost always become candidates
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 3
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+_rng = np.random.RandomState(1)  # Fixed seed: signatures must stay comparable across runs
+_PERM_A = _rng.randint(1, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS signatures (chunk_id TEXT PRIMARY KEY, source TEXT, signature BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS bands (band INTEGER NOT NULL, bucket INTEGER NOT NULL, chunk_id TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS bands_lookup ON bands (band, bucket);
+CREATE INDEX IF NOT EXISTS bands_chunk ON bands (chunk_id);
+CREATE INDEX IF NOT EXISTS signatures_source ON signatures (source);
+CREATE TABLE IF NOT EXISTS aliases (
+    chunk_id TEXT PRIMARY KEY,
+    source TEXT,
+    canonical_id TEXT NOT NULL,
+    similarity REAL NOT NULL,
+    payload BLOB NOT NULL  -- zlib JSON {text, metadata}, kept so the alias can be promoted later
+);
+CREATE INDEX IF NOT EXISTS aliases_canonical ON aliases (canonical_id);
+CREATE INDEX IF NOT EXISTS aliases_source ON aliases (source);
+"""
+
+
+def _shingles(text: str) -> List[str]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+
+
+def minhash(text: str) -> np.ndarray:
+    shingles = _shingles(text)
+    if not shingles:
+        return np.full(NUM_PERM, _MAX_HASH, dtype=np.uint64)
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in set(shingles)), dtype=np.uint64)
+    # Universal hashing (a*x + b) mod p; uint64 wrap-around is fine for hashing purposes.
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME & _MAX_HASH
+    return permuted.min(axis=0)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+def _band_buckets(signature: np.ndarray) -> List[Tuple[int, int]]:
+    buckets = []
+    for band in range(BANDS):
+        digest = hashlib.blake2b(signature[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=8).digest()
+        buckets.append((band, int.from_bytes(digest, "little", signed=True)))
+    return buckets
+
+
+class NearDuplicateIndex:
+    """Persistent MinHash/LSH index of every embedded chunk, stored beside the vector store."""
+
+    def __init__(self, vector_store_path: str):
+        os.makedirs(vector_store_path, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(vector_store_path, INDEX_FILE))
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def find(self, signature: np.ndarray, threshold: float) -> Tuple[str, float] | None:
+        candidates = set()
+        for band, bucket in _band_buckets(signature):
+            candidates.update(row[0] for row in self.conn.execute(
+                "SELECT chunk_id FROM bands WHERE band=? AND bucket=?", (band, bucket)
+            ))
+        best = None
+        for chunk_id in candidates:
+            row = self.conn.execute("SELECT signature FROM signatures WHERE chunk_id=?", (chunk_id,)).fetchone()
+            if row is None:
+                continue
+            score = similarity(signature, np.frombuffer(row[0], dtype=np.uint64))
+            if score >= threshold and (best is None or score > best[1]):
+                best = (chunk_id, score)
+        return best
+
+    def add(self, chunk_id: str, source: str, signature: np.ndarray):
+        self.conn.execute("INSERT OR REPLACE INTO signatures VALUES (?, ?, ?)", (chunk_id, source, signature.tobytes()))
+        self.conn.execute("DELETE FROM bands WHERE chunk_id=?", (chunk_id,))
+        self.conn.executemany(
+            "INSERT INTO bands VALUES (?, ?, ?)",
+            [(band, bucket, chunk_id) for band, bucket in _band_buckets(signature)],
+        )
+
+    def add_alias(self, chunk_id: str, source: str, canonical_id: str, score: float, text: str, metadata: dict):
+        payload = zlib.compress(json.dumps({"text": text, "metadata": metadata}).encode("utf-8"))
+        self.conn.execute(
+            "INSERT OR REPLACE INTO aliases VALUES (?, ?, ?, ?, ?)",
+            (chunk_id, source, canonical_id, score, payload),
+        )
+
+    def alias_ids(self) -> set:
+        return {row[0] for row in self.conn.execute("SELECT chunk_id FROM aliases")}
+
+    def aliases_of(self, canonical_ids: Iterable[str]) -> dict:
+        result: dict = {}
+        for canonical_id in canonical_ids:
+            for (chunk_id,) in self.conn.execute("SELECT chunk_id FROM aliases WHERE canonical_id=?", (canonical_id,)):
+                result.setdefault(canonical_id, []).append(chunk_id)
+        return result
+
+    def remove_sources(self, sources: Iterable[str]) -> List[Tuple[str, str, dict]]:
+        """Forget the given sources and return aliases that lost their canonical chunk.
+
+        The returned (chunk_id, text, metadata) tuples belong to other sources
+        and must be embedded for real now.
+        """
+        sources = list(sources)
+        orphans = []
+        for source in sources:
+            canonical_ids = [row[0] for row in self.conn.execute(
+                "SELECT chunk_id FROM signatures WHERE source=?", (source,)
+            )]
+            for canonical_id in canonical_ids:
+                for chunk_id, alias_source, payload in self.conn.execute(
+                    "SELECT chunk_id, source, payload FROM aliases WHERE canonical_id=?", (canonical_id,)
+                ).fetchall():
+                    self.conn.execute("DELETE FROM aliases WHERE chunk_id=?", (chunk_id,))
+                    if alias_source not in sources:
+                        data = json.loads(zlib.decompress(payload))
+                        orphans.append((chunk_id, data["text"], data["metadata"]))
+                self.conn.execute("DELETE FROM bands WHERE chunk_id=?", (canonical_id,))
+            self.conn.execute("DELETE FROM signatures WHERE source=?", (source,))
+            self.conn.execute("DELETE FROM aliases WHERE source=?", (source,))
+        return orphans
+
+    def commit(self):
+        self.conn.commit()
+
+    def stats(self) -> Tuple[int, int]:
+        signatures = self.conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+        aliases = self.conn.execute("SELECT COUNT(*) FROM aliases").fetchone()[0]
+        return signatures, aliases
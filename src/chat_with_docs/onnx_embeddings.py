@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from chat_with_docs import cli_utils
+
+
+# Local embedding model run in-process on the CPU (embedding_service "onnx"):
+#
+#   <model dir>/model.onnx        or onnx/model.onnx, as in Hugging Face exports
+#   <model dir>/tokenizer.json    the model's Hugging Face `tokenizers` file
+#
+# Sentence-transformer style encoders are supported: token embeddings are pooled
+# (mean over the attention mask, or the first token) and L2-normalised. No server
+# or network is involved, so ingest and queries work offline.
+
+MODEL_FILES = ("model.onnx", os.path.join("onnx", "model.onnx"))
+TOKENIZER_FILE = "tokenizer.json"
+MAX_TOKENS = 512               # Longer texts are truncated, as by sentence-transformers
+POOLING = ("mean", "cls")
+
+_models: Dict[Tuple[str, int], "_Model"] = {}
+_models_lock = threading.Lock()
+
+
+def _import_runtime() -> Tuple[Any, Any]:
+    try:
+        import onnxruntime
+        from tokenizers import Tokenizer
+    except ImportError as e:
+        raise ValueError(
+            "The onnx embedding backend needs onnxruntime and tokenizers: pip install 'chat-with-documents[onnx]'."
+        ) from e
+    return onnxruntime, Tokenizer
+
+
+def resolve_model(path: str) -> Tuple[str, str]:
+    """(model file, tokenizer file) for a model directory or a path to its .onnx file."""
+    path = os.path.abspath(os.path.expanduser(path))
+    if os.path.isfile(path):
+        model_file = path
+    else:
+        model_file = next((os.path.join(path, name) for name in MODEL_FILES if os.path.isfile(os.path.join(path, name))), None)
+        if model_file is None:
+            raise ValueError(f"No ONNX model found in {path} (expected {' or '.join(MODEL_FILES)}).")
+    model_dir = os.path.dirname(model_file)
+    for directory in (model_dir, os.path.dirname(model_dir)):
+        tokenizer_file = os.path.join(directory, TOKENIZER_FILE)
+        if os.path.isfile(tokenizer_file):
+            return model_file, tokenizer_file
+    raise ValueError(f"No {TOKENIZER_FILE} found next to {model_file}.")
+
+
+class _Model:
+    """An ONNX Runtime session and its tokenizer, shared by every caller in the process."""
+
+    def __init__(self, model_file: str, tokenizer_file: str, threads: int):
+        onnxruntime, Tokenizer = _import_runtime()
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self.input_types = {
+            i.name: np.int32 if i.type == "tensor(int32)" else np.int64 for i in self.session.get_inputs()
+        }
+        if "input_ids" not in self.input_types:
+            raise ValueError(f"{model_file} has no 'input_ids' input; is it a text encoder?")
+        self.output = self.session.get_outputs()[0].name
+        self.tokenizer = Tokenizer.from_file(tokenizer_file)
+        self.pad_id = (self.tokenizer.padding or {}).get("pad_id", 0)
+        # Batches are padded here, per batch, to their longest text.
+        self.tokenizer.no_padding()
+        width = self.session.get_inputs()[0].shape[-1]
+        self.tokenizer.enable_truncation(min(MAX_TOKENS, width) if isinstance(width, int) else MAX_TOKENS)
+
+    def embed(self, texts: List[str], batch_size: int, pooling: str) -> Tuple[np.ndarray, int]:
+        """Normalised embeddings of `texts` in input order, and the number of tokens encoded."""
+        encodings = self.tokenizer.encode_batch(texts)  # tokenizes on all cores
+        lengths = [len(encoding.ids) for encoding in encodings]
+        # Texts of similar length share a batch, so little compute goes into padding.
+        order = sorted(range(len(texts)), key=lengths.__getitem__)
+        vectors: List[np.ndarray] = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            width = max(1, max(lengths[i] for i in rows))
+            ids = np.full((len(rows), width), self.pad_id, dtype=np.int64)
+            mask = np.zeros((len(rows), width), dtype=np.int64)
+            for row, i in enumerate(rows):
+                ids[row, :lengths[i]] = encodings[i].ids
+                mask[row, :lengths[i]] = 1
+            feed = {"input_ids": ids, "attention_mask": mask, "token_type_ids": np.zeros_like(ids)}
+            feed = {name: feed[name].astype(dtype, copy=False) for name, dtype in self.input_types.items() if name in feed}
+            output = self.session.run([self.output], feed)[0]
+            for row, vector in zip(rows, _pool(output, mask, pooling)):
+                vectors[row] = vector
+        return np.stack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32), sum(lengths)
+
+
+def _pool(output: np.ndarray, mask: np.ndarray, pooling: str) -> np.ndarray:
+    if output.ndim == 3:  # token embeddings; 2-D outputs are already sentence embeddings
+        if pooling == "cls":
+            output = output[:, 0]
+        else:
+            weights = mask[:, :, None].astype(output.dtype)
+            output = (output * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+    output = output.astype(np.float32, copy=False)
+    return output / np.maximum(np.linalg.norm(output, axis=1, keepdims=True), 1e-12)
+
+
+def load_model(path: str, threads: int | None = None) -> _Model:
+    """The model at `path`, loaded on first use and then kept for the life of the process."""
+    model_file, tokenizer_file = resolve_model(path)
+    threads = max(1, threads or os.cpu_count() or 1)
+    key = (model_file, threads)
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            started = time.monotonic()
+            model = _models[key] = _Model(model_file, tokenizer_file, threads)
+            cli_utils.log(
+                "debug", f"Loaded {model_file} in {time.monotonic() - started:.2f}s ({threads} threads)",
+                event="onnx_model_loaded", model=model_file, threads=threads,
+            )
+        return model
+
+
+class OnnxEmbeddings(Embeddings):
+    """LangChain embeddings computed in-process with ONNX Runtime.
+
+    Texts are tokenized in parallel, grouped into length-sorted batches and
+    run through one shared session whose operators use `threads` CPU cores.
+    """
+
+    def __init__(self, model_path: str, batch_size: int = 32, threads: int | None = None, pooling: str = "mean"):
+        if pooling not in POOLING:
+            raise ValueError(f"Unsupported onnx_pooling '{pooling}'. Use one of: {', '.join(POOLING)}.")
+        self.model_path = model_path
+        self.batch_size = max(1, batch_size)
+        self.pooling = pooling
+        self._model = load_model(model_path, threads)
+        self._lock = threading.Lock()
+        self.tokens = 0
+        self.seconds = 0.0
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        started = time.monotonic()
+        vectors, tokens = self._model.embed(texts, self.batch_size, self.pooling)
+        with self._lock:
+            self.tokens += tokens
+            self.seconds += time.monotonic() - started
+        return vectors.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(list(texts)) if texts else []
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+    def report(self):
+        cli_utils.log(
+            "info",
+            f"Embedding throughput: {self.tokens_per_second:,.0f} tokens/s (local ONNX, batch {self.batch_size})",
+            event="embedding_throughput",
+            tokens_per_second=round(self.tokens_per_second, 1),
+            batch_size=self.batch_size,
+        )
@@ -0,0 +1,252 @@
+import mmap
+import os
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from langchain_core.documents import Document
+
+from chat_with_docs import chunk_records
+
+
+# Parent passages for small-to-big retrieval, stored in each index generation:
+#
+#   parents.dat       append-only zlib blocks of page text, memory-mapped by readers
+#   parents.sqlite3   block index: source:page key and character range -> byte range
+#
+# Search runs over small child chunks; at answer time only the pages of the
+# winning children are touched, and only the blocks around each child are
+# decompressed.
+
+DATA_FILE = "parents.dat"
+INDEX_FILE = "parents.sqlite3"
+BLOCK_CHARS = 16_384       # Page text compressed per block
+SNAP_FRACTION = 0.1        # Passage edges move inward up to this much to end at a line break (or a space)
+OPEN_READERS = 4           # Generations whose parent store stays mapped
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocks (
+    key TEXT NOT NULL,           -- source:page, as in chunk IDs
+    source TEXT NOT NULL,
+    char_start INTEGER NOT NULL,
+    char_end INTEGER NOT NULL,
+    offset INTEGER NOT NULL,     -- byte range of the compressed block in parents.dat
+    length INTEGER NOT NULL,
+    PRIMARY KEY (key, char_start)
+);
+CREATE INDEX IF NOT EXISTS blocks_source ON blocks (source);
+"""
+
+
+def exists(path: str) -> bool:
+    return os.path.exists(os.path.join(path, INDEX_FILE))
+
+
+class ParentStoreWriter:
+    """Appends page text to the parent store of a generation being written.
+
+    Data is flushed and synced before the index rows that point at it are
+    committed, so an interrupted run never leaves rows pointing past the data.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data = open(os.path.join(path, DATA_FILE), "ab")
+        self._conn = sqlite3.connect(os.path.join(path, INDEX_FILE))
+        self._conn.executescript(SCHEMA)
+        self._last_key = None
+        self._offset = 0
+
+    def has_source(self, source: str) -> bool:
+        return self._conn.execute("SELECT 1 FROM blocks WHERE source=? LIMIT 1", (source,)).fetchone() is not None
+
+    def add(self, key: str, source: str, text: str, char_start: int):
+        offset = self._data.tell()
+        rows = []
+        for start in range(0, len(text), BLOCK_CHARS):
+            block = zlib.compress(text[start:start + BLOCK_CHARS].encode("utf-8"), 6)
+            self._data.write(block)
+            end = min(start + BLOCK_CHARS, len(text))
+            rows.append((key, source, char_start + start, char_start + end, offset, len(block)))
+            offset += len(block)
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO blocks (key, source, char_start, char_end, offset, length) VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    def tee(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """Pass loader output through while storing it as parent text.
+
+        Consecutive documents of one source:page are stored as one text, the
+        same way chunk_records.split_into_records computes chunk offsets.
+        Sources already in the store are not stored again.
+        """
+        stored: Dict[str, bool] = {}
+        for document in documents:
+            source = document.metadata.get("source")
+            key = chunk_records.page_key(source, document.metadata.get("page"))
+            if key != self._last_key:
+                self._last_key, self._offset = key, 0
+            if source is not None and source not in stored:
+                stored[source] = not self.has_source(source)
+            if stored.get(source):
+                self.add(key, source, document.page_content, self._offset)
+            self._offset += len(document.page_content)
+            yield document
+        self.commit()
+
+    def store(self, documents: Iterable[Document]):
+        for _ in self.tee(documents):
+            pass
+
+    def remove_sources(self, sources: Iterable[str]) -> int:
+        removed = 0
+        for source in sources:
+            removed += self._conn.execute("DELETE FROM blocks WHERE source=?", (source,)).rowcount
+        self._conn.commit()
+        return removed
+
+    def commit(self):
+        self._data.flush()
+        os.fsync(self._data.fileno())
+        self._conn.commit()
+
+    def close(self):
+        self.commit()
+        self._data.close()
+        self._conn.close()
+
+
+def compact(path: str) -> Tuple[int, int]:
+    """Rewrite parents.dat without blocks of removed sources; returns bytes (before, after)."""
+    data_path = os.path.join(path, DATA_FILE)
+    before = os.path.getsize(data_path)
+    conn = sqlite3.connect(os.path.join(path, INDEX_FILE))
+    try:
+        rows = conn.execute("SELECT key, char_start, offset, length FROM blocks ORDER BY offset").fetchall()
+        tmp_path = data_path + ".tmp"
+        updates = []
+        with open(data_path, "rb") as source, open(tmp_path, "wb") as target:
+            for key, char_start, offset, length in rows:
+                source.seek(offset)
+                updates.append((target.tell(), key, char_start))
+                target.write(source.read(length))
+            target.flush()
+            os.fsync(target.fileno())
+        conn.executemany("UPDATE blocks SET offset=? WHERE key=? AND char_start=?", updates)
+        # Runs on a private generation (index-compact), which is discarded if this is interrupted.
+        os.replace(tmp_path, data_path)
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    return before, os.path.getsize(data_path)
+
+
+class ParentStore:
+    """Read side: memory-maps parents.dat and decompresses only the blocks a passage needs."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(f"file:{os.path.join(path, INDEX_FILE)}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._file = open(os.path.join(path, DATA_FILE), "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def page_length(self, key: str) -> int | None:
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(char_end) FROM blocks WHERE key=?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def text(self, key: str, start: int, end: int) -> str:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT char_start, offset, length FROM blocks WHERE key=? AND char_end>? AND char_start<? ORDER BY char_start",
+                (key, start, end),
+            ).fetchall()
+        if not rows or self._map is None:
+            return ""
+        text = "".join(zlib.decompress(self._map[offset:offset + length]).decode("utf-8") for _, offset, length in rows)
+        first = rows[0][0]
+        return text[start - first:end - first]
+
+    def passage(self, key: str, start: int, end: int, page_length: int) -> str:
+        """Page text in [start, end), trimmed inward to a line break or space where an edge cuts the page."""
+        text = self.text(key, start, end)
+        slack = int(len(text) * SNAP_FRACTION)
+        head = tail = -1
+        for boundary in ("\n", " "):
+            if start > 0 and head < 0:
+                head = text.find(boundary, 0, slack)
+            if end < page_length and slack and tail < 0:
+                tail = text.rfind(boundary, len(text) - slack)
+        return text[head + 1:tail if tail > head + 1 else len(text)].strip()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+            if self._map is not None:
+                self._map.close()
+            self._file.close()
+
+
+_readers: "OrderedDict[str, ParentStore]" = OrderedDict()
+_readers_lock = threading.Lock()
+
+
+def open_reader(path: str) -> ParentStore | None:
+    """Shared reader of a generation's parent store, or None if it has none."""
+    with _readers_lock:
+        reader = _readers.get(path)
+        if reader is not None:
+            _readers.move_to_end(path)
+            return reader
+        if not exists(path):
+            return None
+        reader = _readers[path] = ParentStore(path)
+        while len(_readers) > OPEN_READERS:
+            _readers.popitem(last=False)[1].close()
+        return reader
+
+
+def expand(path: str, results: List[Tuple[Document, Any]], size: int) -> List[str]:
+    """Context passages for retrieved child chunks: about `size` characters of parent text around each.
+
+    Children of the same page whose windows overlap share one passage.
+    Passages keep the rank of their best child. Children without a stored
+    parent (no start offset, or a store without parents) are used as they are.
+    """
+    reader = open_reader(path)
+    windows: "OrderedDict[Any, List[List[int]]]" = OrderedDict()
+    for position, (doc, _) in enumerate(results):
+        metadata = doc.metadata or {}
+        start = metadata.get("start")
+        key = chunk_records.page_key(metadata.get("source"), metadata.get("page"))
+        length = reader.page_length(key) if reader is not None and start is not None else None
+        if not length:
+            windows[("child", position)] = [[0, 0, position, 0]]
+            continue
+        center = start + len(doc.page_content) // 2
+        window_start = max(0, min(center - size // 2, length - size))
+        windows.setdefault(key, []).append([window_start, min(length, window_start + size), position, length])
+    for key, spans in windows.items():
+        # Sweep the windows in page order, so a window bridging two spans merges all three.
+        merged: List[List[int]] = []
+        for span in sorted(spans):
+            if merged and span[0] < merged[-1][1]:
+                last = merged[-1]
+                last[1], last[2] = max(last[1], span[1]), min(last[2], span[2])
+            else:
+                merged.append(span)
+        windows[key] = merged
+    passages = []
+    for key, spans in windows.items():
+        for start, end, position, length in spans:
+            if isinstance(key, tuple):
+                passages.append((position, results[position][0].page_content))
+            else:
+                passages.append((position, reader.passage(key, start, end, length)))
+    return [text for _, text in sorted(passages, key=lambda item: item[0])]
@@ -1,143 +1,309 @@
 import os 
-import shutil
-from typing import List,Any
+import time
+from typing import Any,Iterator,List,Tuple
 
 
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain.schema.document import Document
-from langchain_chroma import Chroma
-from rich.progress import Progress,SpinnerColumn,TextColumn,BarColumn,TimeRemainingColumn,TimeElapsedColumn
 
+from chat_with_docs import chunk_records
 from chat_with_docs import cli_utils
+from chat_with_docs import document_index
 from chat_with_docs import document_loader
+from chat_with_docs import ingest_journal
+from chat_with_docs import near_duplicates
+from chat_with_docs import parent_store
+from chat_with_docs import vector_store_manager
 
 
 
 DATA_PATH="data"
+CHUNK_SIZE=800
+CHUNK_OVERLAP=80
+INGEST_BATCH_CHARS=8_000_000 # Chunk text embedded per populate-db batch
 
 
-def main(config:dict,embedding_func:Any,reset_db:bool=False):
+def chunking_settings(config:dict)->Tuple[int,int]:
+    chunk_size=config.get("chunk_size") or CHUNK_SIZE
+    chunk_overlap=config.get("chunk_overlap")
+    return chunk_size,CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+
+
+def data_path(config:dict)->str:
+    return config.get("data_path") or DATA_PATH
+
+
+def main(config:dict,embedding_func:Any,journal:ingest_journal.IngestJournal|None=None):
+    # vector_store_path is the private generation from index_generations.write_generation;
+    # readers keep querying the published one until this run finishes.
     vector_store_path=config["vector_store_path"]
-    if reset_db:
-        cli_utils.print_info("✨ Clearing Database...")
-        clear_DB(vector_store_path)
-        cli_utils.print_success("Database cleared.")
-    cli_utils.print_info(f"Loading documents from '{DATA_PATH}'...")
-
-    documents=document_loader.load_documents_from_directory(DATA_PATH)
-    if not documents:
-        cli_utils.print_warning("No documents loaded. Exiting database population.")
-        return
-    cli_utils.print_info("Splitting documents into chunks...")
-    chunks=split_documents(documents)
+    chunking=chunking_settings(config)
+    # Re-embeds an existing store in the foreground if the embedding model changed.
+    vector_store_manager.get_vector_store(config,embedding_func,background=False)
+    document_index.ensure_document_index(
+        vector_store_manager.get_client(vector_store_path),
+        vector_store_manager.active_collection_name(vector_store_path),
+    )
+    vector_store_manager.check_chunking(vector_store_path,*chunking)
+    existing_ids=set(vector_store_manager.open_active_store(vector_store_path,embedding_func).get(include=[])["ids"])
+    cli_utils.print_info(f"Number of existing documents in DB: {len(existing_ids)}")
+    # Small-to-big: pages are kept as parent text and chunks record where they start in them.
+    parents=parent_store.ParentStoreWriter(vector_store_path) if config.get("parent_chunk_size") else None
+    if journal:
+        progress=journal.bind(os.path.basename(vector_store_path))
+        if progress.get("split") or progress.get("embedded"):
+            cli_utils.print_info(
+                f"Resuming: {progress.get('embedded',0)} file(s) already embedded, "
+                f"{progress.get('split',0)} parsed and waiting, {progress['batches']} batch(es) committed."
+            )
+    cli_utils.print_info(f"Loading documents from '{data_path(config)}'...")
 
-    if not chunks:
+    # Chunks are embedded in bounded batches, so huge text/CSV files stream through.
+    added_sources=set()
+    resumed_sources=set()
+    chunk_count=0
+    for chunks,completed_files in _chunk_batches(data_path(config),chunking,journal,resumed_sources,parents):
+        if chunks:
+            if not chunk_count and cli_utils.is_interactive():
+                # Document text stays out of --quiet runs and JSON logs.
+                cli_utils.print_info("✅ First chunk preview:")
+                cli_utils.console.print(f"  Content: {chunks[0].text[:200]}...")
+                cli_utils.console.print(f"  Metadata: {chunks[0].metadata()}")
+            chunk_count+=len(chunks)
+            if getattr(embedding_func,"needs_fit",False):
+                embedding_func.fit(chunk_records.texts(chunks))
+            cli_utils.print_info("Adding documents to the vector database...")
+            added_sources|=add_to_DB(
+                chunks,vector_store_path,embedding_func,near_duplicate_threshold=config.get("near_duplicate_threshold"),
+                existing_ids=existing_ids,finalize=False,
+            )
+        if journal:
+            journal.commit_batch(len(chunks),completed_files)
+    if parents:
+        parents.close()
+    # Files embedded before an interruption still need their document-index entries.
+    added_sources|=resumed_sources
+    if not chunk_count and not resumed_sources:
         cli_utils.print_warning("No chunks generated from documents. Exiting database population.")
         return
-    if chunks:
-        cli_utils.print_info("✅ First chunk preview:")
-        cli_utils.console.print(f"  Content: {chunks[0].page_content[:200]}...")
-        cli_utils.console.print(f"  Metadata: {chunks[0].metadata}")
-    
-    cli_utils.print_info("Adding documents to the vector database...")
-    add_to_DB(chunks,vector_store_path,embedding_func)
+    if added_sources:
+        finalize_ingest(vector_store_path,embedding_func,added_sources)
+    else:
+        cli_utils.print_info("✅ No new documents to add.")
     cli_utils.print_success("Database population complete!")
 
 
+def _chunk_batches(path:str,chunking:Tuple[int,int],journal:ingest_journal.IngestJournal|None=None,
+                   resumed_sources:set|None=None,parents:parent_store.ParentStoreWriter|None=None,
+                   max_chars:int=INGEST_BATCH_CHARS)->Iterator[Tuple[List[chunk_records.ChunkRecord],List[str]]]:
+    """Yield (chunks, files whose last chunk is in this batch) in batches of about `max_chars` of text.
 
-def split_documents(documents:list[Document])->List[Document]:
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=800,
-        chunk_overlap=80,
+    With a journal, files it lists as embedded are skipped (and added to
+    `resumed_sources`), files it lists as split are read back from the spool,
+    and everything else is parsed, split and spooled. With `parents`, parsed
+    pages are stored as parent text; a spooled file whose parents are missing
+    is parsed again.
+    """
+    text_splitter=make_text_splitter(*chunking)
+    batch:List[chunk_records.ChunkRecord]=[]
+    completed:List[str]=[]
+    size=0
+    start=time.perf_counter()
+    for file_path in document_loader.iter_files_from_directory(path):
+        stage=journal.stage(file_path) if journal else None
+        if stage=="split" and parents and not parents.has_source(file_path):
+            stage=None
+        if stage=="embedded":
+            if resumed_sources is not None:
+                resumed_sources.add(file_path)
+            continue
+        if stage=="split":
+            chunks=journal.read_spool(file_path)
+        else:
+            documents=document_loader.iter_file(file_path)
+            if parents:
+                documents=parents.tee(documents)
+            # Chunk IDs (source:page:index) are assigned while splitting.
+            chunks=chunk_records.split_into_records(documents,text_splitter,offsets=parents is not None,chunk_overlap=chunking[1])
+            if journal and document_loader.is_supported(file_path):
+                chunks=journal.spool(file_path,chunks)
+        for chunk in chunks:
+            batch.append(chunk)
+            size+=len(chunk.text)
+            if size>=max_chars:
+                yield _produced(batch,completed,start)
+                batch,completed,size=[],[],0
+                start=time.perf_counter()
+        completed.append(file_path)
+    if batch or completed:
+        yield _produced(batch,completed,start)
+
+
+def _produced(batch:List[chunk_records.ChunkRecord],completed:List[str],start:float)->Tuple[List[chunk_records.ChunkRecord],List[str]]:
+    if batch:
+        cli_utils.log(
+            "info",f"Generated {len(batch)} chunks.",event="chunks_produced",
+            files=len(completed),chunks=len(batch),seconds=round(time.perf_counter()-start,3),
+        )
+    return batch,completed
+
+
+def make_text_splitter(chunk_size:int=CHUNK_SIZE,chunk_overlap:int=CHUNK_OVERLAP)->RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
         length_function=len,
         is_separator_regex=False
 
     )
-    with Progress(
-    SpinnerColumn(),
-    TextColumn("[progress.description]{task.description}"),
-    BarColumn(),
-    TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-    TimeRemainingColumn(),
-    TimeElapsedColumn(),
-    console=cli_utils.console
-    ) as progress:
-        task = progress.add_task("[cyan]Splitting text...", total=len(documents))
-        chunked_documents=[]
-        for i ,doc in enumerate(documents):
-            chunked_documents.extend(text_splitter.split_documents([doc]))
-            progress.update(task,advance=1)
-    cli_utils.print_info(f"Generated {len(chunked_documents)} chunks.")
-    return chunked_documents
-
-
-
-def calculate_chunk_ids(chunks:List[Document])->List[Document]:
-    last_source_page_id = None
-    current_chunk_idx = 0 
-    for chunk in chunks:
-        src = chunk.metadata.get("source")
-        page = chunk.metadata.get("page","0")
-        current_source_page_id = f"{src}:{page}"
 
-        if current_source_page_id ==last_source_page_id:
-            current_chunk_idx+=1
-        else:
-            current_chunk_idx =0
-        
-        chunk_id=f"{current_source_page_id}:{current_chunk_idx}"
-        last_source_page_id=current_source_page_id
-        chunk.metadata["id"]=chunk_id
+
+def split_documents(documents:list[Document],chunk_size:int=CHUNK_SIZE,chunk_overlap:int=CHUNK_OVERLAP,offsets:bool=False)->List[chunk_records.ChunkRecord]:
+    text_splitter = make_text_splitter(chunk_size,chunk_overlap)
+    start=time.perf_counter()
+    with cli_utils.progress("[cyan]Splitting text...",total=len(documents)) as advance:
+        def advancing(docs):
+            for doc in docs:
+                yield doc
+                advance()
+        # Chunk IDs (source:page:index) are assigned while splitting.
+        chunks=list(chunk_records.split_into_records(advancing(documents),text_splitter,offsets=offsets,chunk_overlap=chunk_overlap))
+    cli_utils.log(
+        "info",f"Generated {len(chunks)} chunks.",event="chunks_produced",
+        documents=len(documents),chunks=len(chunks),seconds=round(time.perf_counter()-start,3),
+    )
     return chunks
 
 
-def add_to_DB(chunks: List[Document], vector_store_path: str, embedding_func: Any):
-    db = Chroma(
-        persist_directory=vector_store_path,
-        embedding_function=embedding_func
-    )
-    chunks_with_ids = calculate_chunk_ids(chunks)
-    
-    existing_items = db.get(include=[])
-    existing_ids = set(existing_items["ids"])
-    cli_utils.print_info(f"Number of existing documents in DB: {len(existing_ids)}")
+def _skip_near_duplicates(chunks:List[chunk_records.ChunkRecord],dup_index:near_duplicates.NearDuplicateIndex,threshold:float,vector_store_path:str)->List[chunk_records.ChunkRecord]:
+    kept=[]
+    skipped_text_bytes=0
+    for chunk in chunks:
+        signature=near_duplicates.minhash(chunk.text)
+        match=dup_index.find(signature,threshold)
+        if match:
+            canonical_id,score=match
+            dup_index.add_alias(chunk.id,chunk.source,canonical_id,score,chunk.text,chunk.metadata())
+            skipped_text_bytes+=len(chunk.text.encode("utf-8"))
+        else:
+            # Registered right away so later duplicates in the same run match it too.
+            dup_index.add(chunk.id,chunk.source,signature)
+            kept.append(chunk)
+    skipped=len(chunks)-len(kept)
+    if skipped:
+        meta=vector_store_manager.read_index_meta(vector_store_path) or {}
+        dimension=meta.get("active",{}).get("dimension") or 0
+        saved_bytes=skipped*dimension*4+skipped_text_bytes
+        cli_utils.print_info(
+            f"♻️  Skipped {skipped} near-duplicate chunks (similarity ≥ {threshold}): "
+            f"{skipped} embeddings and ~{saved_bytes/1e6:.1f} MB of vector/text storage saved."
+        )
+    return kept
 
+
+def add_to_DB(chunks: List[chunk_records.ChunkRecord], vector_store_path: str, embedding_func: Any, near_duplicate_threshold:float|None=None,
+              existing_ids:set|None=None,finalize:bool=True)->set:
+    """Embed and store chunks whose IDs are not in the store yet; returns the sources that got new chunks.
+
+    Batched callers pass one `existing_ids` set (updated in place) and
+    `finalize=False`, then call finalize_ingest() once at the end.
+    """
+    db = vector_store_manager.open_active_store(vector_store_path,embedding_func)
+    if existing_ids is None:
+        existing_ids = set(db.get(include=[])["ids"])
+        cli_utils.print_info(f"Number of existing documents in DB: {len(existing_ids)}")
+
+    dup_index=near_duplicates.NearDuplicateIndex(vector_store_path) if near_duplicate_threshold else None
+    if dup_index:
+        existing_ids|=dup_index.alias_ids()
     new_chunks = []
-    for chunk in chunks_with_ids:
-        if chunk.metadata["id"] not in existing_ids:
+    for chunk in chunks:
+        if chunk.id not in existing_ids:
             new_chunks.append(chunk)
+    if dup_index and new_chunks:
+        new_chunks=_skip_near_duplicates(new_chunks,dup_index,near_duplicate_threshold,vector_store_path)
     if len(new_chunks):
         cli_utils.print_info(f"👉 Adding {len(new_chunks)} new documents...")
-        new_chunk_ids = [chunk.metadata["id"] for chunk in new_chunks]
-        db.add_documents(new_chunks,ids=new_chunk_ids)
-
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[progress.description]{task.description}"),
-            BarColumn(),
-            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-            TimeRemainingColumn(),
-            TimeElapsedColumn(),
-            console=cli_utils.console
-        ) as progress:
-            task = progress.add_task("[green]Adding chunks to DB...", total=len(new_chunks))
-            batch_size=100
+
+        with cli_utils.progress("[green]Adding chunks to DB...",total=len(new_chunks)) as advance:
+            batch_size=getattr(embedding_func,"ingest_batch_size",100)
             for i in range(0,len(new_chunks),batch_size):
                 batch=new_chunks[i:i+batch_size]
-                batch_ids=new_chunk_ids[i:i+batch_size]
-                db.add_documents(batch,ids=batch_ids)
-                progress.update(task,advance=len(batch))
+                start=time.perf_counter()
+                # The only place chunk records become full metadata dicts.
+                db.add_texts(
+                    chunk_records.texts(batch),
+                    metadatas=chunk_records.metadatas(batch),
+                    ids=chunk_records.ids(batch),
+                )
+                cli_utils.log("debug",event="batch_embedded",chunks=len(batch),seconds=round(time.perf_counter()-start,3))
+                advance(len(batch))
         cli_utils.print_success(f"Added {len(new_chunks)} new documents to the database.")
+        existing_ids.update(chunk_records.ids(new_chunks))
+        if dup_index:
+            dup_index.commit()
+        sources={chunk.source for chunk in new_chunks}
+        if finalize:
+            finalize_ingest(vector_store_path,embedding_func,sources)
     else:
-        cli_utils.print_info("✅ No new documents to add.")
+        sources=set()
+        if dup_index:
+            dup_index.commit() # aliases recorded for chunks that were all duplicates
+        if finalize:
+            cli_utils.print_info("✅ No new documents to add.")
+    if dup_index:
+        dup_index.close()
+    return sources
 
 
+def finalize_ingest(vector_store_path:str,embedding_func:Any,sources:set):
+    """Bookkeeping after chunks were added: index dimension, document centroids, throughput."""
+    vector_store_manager.record_dimension(vector_store_path)
+    _refresh_document_index(vector_store_path,list(sources))
+    if hasattr(embedding_func,"report"):
+        embedding_func.report()
 
 
-def clear_DB(vector_store_path:str):
-    if os.path.exists(vector_store_path):
-        shutil.rmtree(vector_store_path)
-    else:
-        cli_utils.print_warning(f"Database directory '{vector_store_path}' does not exist. Nothing to clear.")
 
 
+def _refresh_document_index(vector_store_path:str,sources:List[str]):
+    document_index.update_document_index(
+        vector_store_manager.get_client(vector_store_path),
+        vector_store_manager.active_collection_name(vector_store_path),
+        [source for source in sources if source],
+    )
+
+
+def remove_sources_from_DB(sources:List[str],vector_store_path:str,embedding_func:Any)->int:
+    db = vector_store_manager.open_active_store(vector_store_path,embedding_func)
+    stale_ids=[]
+    for source in sources:
+        stale_ids.extend(db.get(where={"source":source},include=[])["ids"])
+    if stale_ids:
+        db.delete(ids=stale_ids)
+        cli_utils.print_info(f"🗑️  Removed {len(stale_ids)} chunks from {len(sources)} changed or deleted file(s).")
+    if os.path.exists(os.path.join(vector_store_path,near_duplicates.INDEX_FILE)):
+        _promote_orphaned_aliases(db,vector_store_path,sources)
+    if parent_store.exists(vector_store_path):
+        parents=parent_store.ParentStoreWriter(vector_store_path)
+        parents.remove_sources(sources)
+        parents.close()
+    _refresh_document_index(vector_store_path,sources)
+    return len(stale_ids)
+
+
+def _promote_orphaned_aliases(db:Any,vector_store_path:str,sources:List[str]):
+    # Duplicates of the removed chunks were never embedded; embed them now that their canonical copy is gone.
+    dup_index=near_duplicates.NearDuplicateIndex(vector_store_path)
+    try:
+        orphans=dup_index.remove_sources(sources)
+        if orphans:
+            documents=[Document(page_content=text,metadata=metadata) for _,text,metadata in orphans]
+            db.add_documents(documents,ids=[chunk_id for chunk_id,_,_ in orphans])
+            for chunk_id,text,metadata in orphans:
+                dup_index.add(chunk_id,metadata.get("source"),near_duplicates.minhash(text))
+            _refresh_document_index(vector_store_path,[metadata.get("source") for _,_,metadata in orphans])
+            cli_utils.print_info(f"Embedded {len(orphans)} chunks that were near-duplicates of removed content.")
+        dup_index.commit()
+    finally:
+        dup_index.close()
@@ -3,21 +3,32 @@ import sys
 from typing import Any
 
 
-from langchain_chroma import Chroma
+from langchain_core.messages.ai import add_usage
 from langchain.prompts import ChatPromptTemplate
-from rich.console import Console
 from rich.markdown import Markdown
 from rich.prompt import Prompt 
 from rich.panel import Panel
 from rich.text import Text
 from rich.align import Align
-from rich.progress import Progress,SpinnerColumn,TextColumn
+from rich.live import Live
 
 from chat_with_docs import cli_utils
+from chat_with_docs import document_index
+from chat_with_docs import embedding_dispatcher
+from chat_with_docs import embedding_manager
+from chat_with_docs import index_pool
+from chat_with_docs import llm_manager
+from chat_with_docs import parent_store
+from chat_with_docs import populate_db
+from chat_with_docs import query_deadline
+from chat_with_docs import usage_ledger
 from chat_with_docs import vector_store_manager
 
 
 
+# Everything that never changes comes first so Ollama (and hosted providers'
+# prompt caches) can reuse the processed prefix across questions; only the
+# retrieved context and the question vary at the end.
 PROMPT_TEMPLATE = """
 You are a helpful and knowledgeable assistant.
 
@@ -38,12 +49,27 @@ Answer:
 =========
 """
 
+RETRIEVAL_K=5
+MAX_QUESTION_CHARS=2000 # Budget for the question when sizing the LLM context window
 
+_PROMPT=ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
 
-_console=Console()
 
+def context_chars(config:dict)->int:
+    """Characters of context one retrieved chunk contributes to the prompt."""
+    return config.get("parent_chunk_size") or populate_db.chunking_settings(config)[0]
 
-def print_intro():
+
+def max_prompt_chars(chunk_size:int=populate_db.CHUNK_SIZE,k:int=RETRIEVAL_K)->int:
+    separators=len("\n\n---\n\n")*(k-1)
+    return len(PROMPT_TEMPLATE)+k*chunk_size+separators+MAX_QUESTION_CHARS
+
+
+
+def print_intro(indexes:list|None=None):
+    if not cli_utils.is_interactive():
+        return
+    index_hint=f"\n[yellow]💡 Type '/index NAME' to switch index ({', '.join(indexes)}).[/yellow]" if indexes else ""
     instructions = Text.from_markup(
         "\n[bold green]📝 You can either:[/bold green]\n"
         "1. Pass your question as a CLI argument:\n"
@@ -51,6 +77,7 @@ def print_intro():
         "2. Or enter interactively below.\n\n"
         "[yellow]💡 Type 'q' and hit Enter to exit interactive mode.[/yellow]\n"
         "[yellow]💡 Type 'clear' to clear the screen.[/yellow]"
+        + index_hint
     )
 
     panel = Panel.fit(
@@ -60,69 +87,261 @@ def print_intro():
         padding=(1, 4)
     )
 
-    _console.print(panel)
+    cli_utils.console.print(panel)
+
+
+def session_prompt_chars(config:dict,pool:index_pool.IndexPool)->int:
+    # Sized for the largest chunks of any index, since '/index' can switch between them mid-session.
+    return max_prompt_chars(max(context_chars(index_config) for index_config in [config,*map(pool.config_for,pool.names())]))
+
+
+def _chat_settings(config:dict)->tuple:
+    service=config.get("preferred_ai_service")
+    return (service,*(config.get(key) for key in (
+        f"{service}_chat_model",f"{service}_base_url",f"{service}_api_key","ollama_keep_alive","ollama_num_ctx","query_deadline_seconds"
+    )))
+
+
+def _top_documents(config:dict)->int|None:
+    return config.get("two_stage_top_documents") if config.get("two_stage_retrieval") else None
 
 
+def _ask(query_text:str,db:vector_store_manager.SnapshotVectorStore,llm_model:Any,config:dict,cache:query_deadline.QueryCache,
+         ledger:usage_ledger.UsageLedger|None=None)->dict:
+    # Each question gets its own budget; None in the config means no deadline.
+    deadline=query_deadline.Deadline(config.get("query_deadline_seconds"))
+    report=query_rag(query_text,db,llm_model,top_documents=_top_documents(config),deadline=deadline,
+                     retrieval_seconds=config.get("query_retrieval_seconds"),cache=cache,
+                     parent_chars=config.get("parent_chunk_size"))
+    if ledger:
+        ledger.record_query(config,usage_ledger.model_label(*embedding_manager.get_embedding_settings(config)),report)
+    return report
 
-def main(config:dict,llm_model:Any,embedding_func:Any,query_text:str  | None =None):
-    print_intro()
+
+def main(config:dict,llm_model:Any,pool:index_pool.IndexPool,query_text:str  | None =None,
+         ledger:usage_ledger.UsageLedger|None=None):
+    """Answer questions against `config`'s index; stores come from `pool`, so switching indexes is cheap.
+
+    Switching to an index that overrides the chat model also switches
+    `llm_model`. Each answered question is recorded in `ledger`, if given.
+    """
+    print_intro(pool.names())
+    index_name=config.get("index_name")
+    cache=query_deadline.QueryCache()
     try:
-        db = vector_store_manager.get_vector_store(config,embedding_func)
+        pool.get(index_name)
     except Exception as e:
         cli_utils.print_error(f"Failed to initialize vector store: {e}")
         sys.exit(1)
-    if query_text:
-        query_rag(query_text,db,llm_model)
-        return
-    while True:
+    try:
+        if query_text:
+            _ask(query_text,pool.get(index_name),llm_model,config,cache,ledger)
+            return
+        while True:
+            try:
+                query_input=Prompt.ask("🔍 Enter your query (or 'q' to quit, 'clear' to clear screen)").strip()
+            except(KeyboardInterrupt,EOFError):
+                cli_utils.print_info("\n👋 Exiting.")
+                break
+            if query_input.lower()=="q":
+                cli_utils.print_info("\n👋 Exiting.")
+                break
+            elif query_input.lower()=="clear":
+                os.system('cls' if os.name=="nt" else "clear")
+                print_intro(pool.names())
+            elif query_input.startswith("/index"):
+                name=query_input[len("/index"):].strip()
+                if not name:
+                    cli_utils.print_info(f"Current index: {index_name or '(default)'}. Available: {', '.join(pool.names()) or 'none'}.")
+                    continue
+                try:
+                    new_config=pool.config_for(name)
+                    pool.get(name)
+                    if _chat_settings(new_config)!=_chat_settings(config):
+                        llm_model=llm_manager.get_chat_llm(new_config,max_prompt_chars=session_prompt_chars(new_config,pool))
+                    config=new_config
+                    index_name=config.get("index_name")
+                    cli_utils.print_success(f"Switched to index '{index_name}'.")
+                except Exception as e:
+                    cli_utils.print_error(f"Cannot switch to index '{name}': {e}")
+            elif query_input:
+                # The pool may have closed an idle store; get() reopens it.
+                db=pool.get(index_name)
+                # Pick up an index generation published by populate-db since the last question.
+                if db.refresh():
+                    cli_utils.print_info(f"Using the updated index ({db.generation}).")
+                _ask(query_input,db,llm_model,config,cache,ledger)
+    finally:
+        # Releases the snapshot leases so older generations can be cleaned up.
+        pool.close()
+        if ledger:
+            ledger.close()
+
+
+def _cache_scope(db:vector_store_manager.SnapshotVectorStore)->tuple:
+    # The generation directory and collection pin down both the chunks and the embedding model.
+    return (db.path,db.collection_name)
+
+
+def _embed_query(query_text:str,db:vector_store_manager.SnapshotVectorStore,timeout:float|None,cache:query_deadline.QueryCache|None)->list:
+    key=("embedding",*_cache_scope(db),query_text)
+    embedding=cache.get(key) if cache else None
+    if embedding is None:
+        embedding=query_deadline.call_with_timeout(db.embeddings.embed_query,timeout,query_text)
+        if cache:
+            cache.put(key,embedding)
+    return embedding
+
+
+def _fallback_results(query_text:str,db:vector_store_manager.SnapshotVectorStore,k:int,deadline:query_deadline.Deadline,cache:query_deadline.QueryCache|None,
+                      results_key:tuple,stage:str,degraded:list)->list:
+    cached=cache.get(results_key) if cache else None
+    if cached is not None:
+        degraded.append(f"{stage} (cached results)")
+        return cached
+    degraded.append(f"{stage} (keyword search)")
+    try:
+        return query_deadline.call_with_timeout(query_deadline.lexical_search,deadline.remaining(),db,query_text,k,deadline)
+    except query_deadline.DeadlineExceeded:
+        degraded.append("keyword search (no results)")
+        return []
+
+
+def retrieve(query_text:str,db:vector_store_manager.SnapshotVectorStore,k:int=RETRIEVAL_K,top_documents:int|None=None,
+             deadline:query_deadline.Deadline|None=None,retrieval_seconds:float|None=None,
+             cache:query_deadline.QueryCache|None=None,degraded:list|None=None)->list:
+    """Flat chunk search, or coarse-to-fine when `top_documents` is set.
+
+    The coarse stage picks the closest documents by centroid; the fine stage
+    only searches chunks of those documents. Falls back to the flat search
+    when the store has no document index yet.
+
+    Vector search may use at most `retrieval_seconds` of the `deadline`. A
+    slow query embedding or search falls back to the cached results of the
+    same question, else to keyword search; a slow coarse stage is skipped.
+    Each fallback is appended to `degraded`.
+    """
+    deadline=deadline or query_deadline.Deadline(None)
+    search=query_deadline.Deadline(deadline.remaining(retrieval_seconds))
+    degraded=[] if degraded is None else degraded
+    results_key=("results",*_cache_scope(db),query_text,k,top_documents)
+    try:
+        query_embedding=_embed_query(query_text,db,search.remaining(),cache)
+    except query_deadline.DeadlineExceeded:
+        return _fallback_results(query_text,db,k,deadline,cache,results_key,"embedding",degraded)
+    search_filter=None
+    if top_documents:
         try:
-            query_input=Prompt.ask("🔍 Enter your query (or 'q' to quit, 'clear' to clear screen)").strip()
-        except(KeyboardInterrupt,EOFError):
-            cli_utils.print_info("\n👋 Exiting.")
-            break
-        if query_input.lower()=="q":
-            cli_utils.print_info("\n👋 Exiting.")
-            break
-        elif query_input.lower()=="clear":
-            os.system('cls' if os.name=="nt" else "clear")
-            print_intro()
-        elif query_input:
-             query_rag(query_input, db, llm_model)
-
-
-def query_rag(query_text:str,db:Chroma,llm_model:Any):
+            sources=query_deadline.call_with_timeout(
+                document_index.select_documents,search.remaining(),db.client,db.collection_name,query_embedding,top_documents
+            )
+            if sources:
+                search_filter={"source":{"$in":sources}}
+        except query_deadline.DeadlineExceeded:
+            degraded.append("document selection (flat search)")
+    try:
+        results=query_deadline.call_with_timeout(
+            db.similarity_search_by_vector_with_relevance_scores,search.remaining(),query_embedding,k=k,filter=search_filter
+        )
+    except query_deadline.DeadlineExceeded:
+        return _fallback_results(query_text,db,k,deadline,cache,results_key,"vector search",degraded)
+    if cache:
+        cache.put(results_key,results)
+    return results
+
+
+def query_rag(query_text:str,db:vector_store_manager.SnapshotVectorStore,llm_model:Any,top_documents:int|None=None,
+              deadline:query_deadline.Deadline|None=None,retrieval_seconds:float|None=None,
+              cache:query_deadline.QueryCache|None=None,parent_chars:int|None=None)->dict:
+    """Answer one question and return a report of stage timings, token counts and degraded stages.
+
+    With a `deadline`, retrieval falls back as described in `retrieve` and the
+    answer is streamed until the deadline, so a stalled model yields a
+    partial answer instead of hanging the session. With `parent_chars`, the
+    retrieved chunks are replaced by that much surrounding page text.
+    Token counts are the model's own usage report when it sends one, else
+    estimates from the text length (`tokens_estimated`).
+    """
+    deadline=deadline or query_deadline.Deadline(None)
+    degraded=[]
+    report={"degraded":degraded,"results":0,"answer_chars":0,"prompt_tokens":0,"completion_tokens":0}
+    hits_before=dict(cache.hits) if cache else {}
+    # Load the chat model while retrieval runs instead of after it.
+    llm_manager.warm_up(llm_model)
     cli_utils.print_info(f"Searching for relevant documents for: '{query_text}'")
-    results = db.similarity_search_with_score(query_text, k=5) # k=5 for top 5 relevant chunks
+    results = retrieve(query_text,db,top_documents=top_documents,deadline=deadline,
+                       retrieval_seconds=retrieval_seconds,cache=cache,degraded=degraded)
+    report["retrieval_ms"]=round(deadline.elapsed()*1000,1)
+    report["results"]=len(results)
+    hits={kind:n-hits_before.get(kind,0) for kind,n in (cache.hits.items() if cache else [])}
+    report["cache_hits"]=sum(hits.values())
+    # A cached query embedding costs nothing; otherwise the question was sent to the embedding model.
+    report["embedding_tokens"]=0 if hits.get("embedding") else embedding_dispatcher.estimate_tokens(query_text)
     if not results:
         cli_utils.print_warning("No relevant documents found in the database for your query.")
-        return
-    context_chunk=[doc.page_content for doc,_ in results]
+        _report_degraded(deadline,report)
+        return report
+    if parent_chars:
+        context_chunk=parent_store.expand(db.path,results,parent_chars)
+    else:
+        context_chunk=[doc.page_content for doc,_ in results]
     context_text="\n\n---\n\n".join(context_chunk)
-    prompt_template=ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-    prompt = prompt_template.format(context=context_text, question=query_text)
+    report["context_chars"]=len(context_text)
+    prompt = _PROMPT.format(context=context_text, question=query_text)
     cli_utils.print_info("Generating response with LLM...")
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        console=cli_utils.console,
-        transient=True # Spinner disappears after completion
-    ) as progress:
-        task=progress.add_task("[cyan]Thinking...", total=None)
-        try:
-            response=llm_model.invoke(prompt)
-            progress.stop()
-            response_text=response.content if hasattr(response,"content") else str(response)
-        except Exception as e :
-            progress.stop()
-            cli_utils.print_error(f"Error invoking LLM: {e}")
-            return
-    sources=[doc.metadata.get("id","unknown") for doc,_ in results]
+    response_text=""
+    usage={}
+    generation_started=deadline.elapsed()
+
+    def _stream():
+        for chunk in llm_model.stream(prompt):
+            # Chunk usage is a delta (langchain-google-genai converts Gemini's running totals);
+            # OpenAI and Ollama report it once, on the final chunk. Summing is right for both.
+            chunk_usage=getattr(chunk,"usage_metadata",None)
+            if chunk_usage:
+                usage.update(add_usage(usage,chunk_usage))
+            yield chunk
+
     cli_utils.console.print("\n[bold magenta]🧠 Response:[/bold magenta]")
-    cli_utils.console.print(Markdown(response_text))
+    try:
+        with Live(Markdown(""),console=cli_utils.console,auto_refresh=False) as live:
+            for text in query_deadline.stream_until(_stream,deadline):
+                if not response_text:
+                    report["first_token_ms"]=round(deadline.elapsed()*1000,1)
+                response_text+=text
+                live.update(Markdown(response_text),refresh=True)
+    except query_deadline.DeadlineExceeded:
+        degraded.append("generation (partial answer)" if response_text else "generation (no answer)")
+        cli_utils.console.print("\n[dim]… answer cut off at the deadline.[/dim]")
+    except Exception as e :
+        cli_utils.print_error(f"Error invoking LLM: {e}")
+        return report
+    finally:
+        report["generation_ms"]=round((deadline.elapsed()-generation_started)*1000,1)
+        report["answer_chars"]=len(response_text)
+        _count_tokens(report,usage,prompt,response_text)
+    sources=[doc.metadata.get("id","unknown") for doc,_ in results]
 
     cli_utils.console.print("\n[bold yellow]📚 Sources:[/bold yellow]", style="bold yellow")
     for source_id in sorted(list(set(sources))):
         cli_utils.console.print(f"  - {source_id}")
+    _report_degraded(deadline,report)
+    return report
 
 
+def _count_tokens(report:dict,usage:dict,prompt:str,response_text:str):
+    if usage.get("input_tokens") or usage.get("output_tokens"):
+        report["prompt_tokens"]=usage.get("input_tokens",0)
+        report["completion_tokens"]=usage.get("output_tokens",0)
+        return
+    report["prompt_tokens"]=embedding_dispatcher.estimate_tokens(prompt)
+    report["completion_tokens"]=embedding_dispatcher.estimate_tokens(response_text) if response_text else 0
+    report["tokens_estimated"]=True
+
 
+def _report_degraded(deadline:query_deadline.Deadline,report:dict):
+    report["total_ms"]=round(deadline.elapsed()*1000,1)
+    message=None
+    if report["degraded"]:
+        message=f"Degraded to stay within the query deadline: {', '.join(report['degraded'])}."
+    cli_utils.log("warning" if message else "debug",message,event="query",deadline_seconds=deadline.seconds,**report)
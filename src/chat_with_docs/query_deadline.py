@@ -0,0 +1,206 @@
+import queue
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Hashable, Iterable, Iterator, List, Tuple
+
+from langchain_core.documents import Document
+
+
+LEXICAL_MAX_TERMS = 6          # Longest query words searched when falling back to keyword search
+LEXICAL_CANDIDATES = 50        # Chunks fetched per word
+CACHE_ENTRIES = 256            # Query embeddings and result lists kept per session
+STAGE_WORKERS = 4              # Threads shared by the timed stages of every question
+_WORD = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in into is it its of on or "
+    "that the their there these this to was were what when where which who why will with would you your".split()
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Deadline:
+    """Time budget of one question, shared by every stage that answers it.
+
+    `seconds=None` means no limit: `remaining()` is None and every stage
+    runs to completion, as before deadlines existed.
+    """
+
+    def __init__(self, seconds: float | None):
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.expires = None if seconds is None else self.started + seconds
+
+    def remaining(self, cap: float | None = None) -> float | None:
+        """Seconds left, optionally limited to `cap` (a per-stage budget)."""
+        if self.expires is None:
+            return cap
+        left = max(0.0, self.expires - time.monotonic())
+        return left if cap is None else min(left, cap)
+
+    def expired(self) -> bool:
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+
+def request_timeout(config: dict) -> float | None:
+    """Longest a single retrieval request may take: the retrieval budget, within the question's deadline."""
+    budgets = [config.get(key) for key in ("query_retrieval_seconds", "query_deadline_seconds")]
+    budgets = [budget for budget in budgets if budget is not None]
+    return min(budgets) if budgets else None
+
+
+class _StagePool:
+    """A few daemon threads that run the timed stages of all questions.
+
+    Blocking client calls cannot be cancelled, so a call that overruns keeps
+    its thread until the client's own request timeout ends it. Sharing a
+    bounded pool means a stalled server ties up at most STAGE_WORKERS
+    threads, however many questions time out; stages queued behind them
+    time out too and never start.
+    """
+
+    def __init__(self, workers: int = STAGE_WORKERS):
+        self.workers = workers
+        self._tasks: "queue.SimpleQueue[Tuple[Future, Callable[..., Any], tuple, dict]]" = queue.SimpleQueue()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def submit(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        with self._lock:
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"query-stage-{len(self._threads)}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+        future: Future = Future()
+        self._tasks.put((future, func, args, kwargs))
+        return future
+
+    def _work(self):
+        while True:
+            future, func, args, kwargs = self._tasks.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+
+_stages = _StagePool()
+
+
+def call_with_timeout(func: Callable[..., Any], timeout: float | None, *args: Any, **kwargs: Any) -> Any:
+    """Run `func` on the shared stage pool and return its result, or raise DeadlineExceeded after `timeout` seconds.
+
+    An overrunning call's result is dropped; see _StagePool.
+    """
+    if timeout is None:
+        return func(*args, **kwargs)
+    future = _stages.submit(func, *args, **kwargs)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        future.cancel()  # still queued behind stalled calls: never run it
+        raise DeadlineExceeded(f"{getattr(func, '__name__', 'call')} did not finish within {timeout:.1f}s") from None
+
+
+def stream_until(chunks: Callable[[], Iterable[Any]], deadline: Deadline) -> Iterator[str]:
+    """Yield text chunks from the `chunks()` stream until it ends or the deadline passes.
+
+    Raises DeadlineExceeded when the deadline cuts the stream short; the text
+    yielded so far is the partial answer. The stream is consumed in a daemon
+    thread that stops at its next chunk once the reader has given up.
+    """
+    buffer: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+    abandoned = threading.Event()
+
+    def _produce():
+        try:
+            for chunk in chunks():
+                if abandoned.is_set():
+                    return
+                buffer.put(("chunk", chunk))
+            buffer.put(("done", None))
+        except BaseException as e:
+            buffer.put(("error", e))
+
+    threading.Thread(target=_produce, name="query-stream", daemon=True).start()
+    try:
+        while True:
+            try:
+                kind, value = buffer.get(timeout=deadline.remaining())
+            except queue.Empty:
+                raise DeadlineExceeded("the answer did not finish before the deadline") from None
+            if kind == "done":
+                return
+            if kind == "error":
+                raise value
+            text = getattr(value, "content", value)
+            yield text if isinstance(text, str) else str(text)
+    finally:
+        abandoned.set()
+
+
+def query_terms(query_text: str, limit: int = LEXICAL_MAX_TERMS) -> List[str]:
+    words = {word for word in _WORD.findall(query_text.lower()) if len(word) > 2 and word not in _STOPWORDS}
+    return sorted(words, key=lambda word: (-len(word), word))[:limit]
+
+
+def lexical_search(db: Any, query_text: str, k: int, deadline: Deadline | None = None) -> List[Tuple[Document, float]]:
+    """Keyword fallback that needs no query embedding: chunks containing the most query words.
+
+    Uses Chroma's full-text `$contains` filter, one lookup per word, and stops
+    early when the deadline passes. Scores are the fraction of words not
+    matched, so lower is closer, as with vector distances.
+    """
+    terms = query_terms(query_text)
+    if not terms:
+        return []
+    hits: dict = {}
+    for term in terms:
+        if deadline is not None and deadline.expired():
+            break
+        found = db.get(where_document={"$contains": term}, limit=LEXICAL_CANDIDATES, include=["documents", "metadatas"])
+        for chunk_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"]):
+            entry = hits.setdefault(chunk_id, [0, text, metadata])
+            entry[0] += 1
+    ranked = sorted(hits.values(), key=lambda entry: -entry[0])[:k]
+    return [(Document(page_content=text, metadata=metadata or {}), 1 - count / len(terms)) for count, text, metadata in ranked]
+
+
+class QueryCache:
+    """Per-session LRU of query embeddings and retrieval results.
+
+    Embeddings are reused for repeated questions so no embedding call is
+    needed; results are keyed by index generation and only served when a
+    fresh search cannot finish in time.
+    """
+
+    def __init__(self, max_entries: int = CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits: Counter = Counter()  # by the first element of the key, e.g. "embedding"
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits[key[0] if isinstance(key, tuple) else key] += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
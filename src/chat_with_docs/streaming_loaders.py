@@ -0,0 +1,190 @@
+import csv
+import mmap
+import os
+import re
+from html.parser import HTMLParser
+from typing import Iterator, List, Tuple
+
+from langchain.schema.document import Document
+
+from chat_with_docs import cli_utils
+
+
+SEGMENT_BYTES = 1 << 20           # Raw bytes per yielded text/Markdown document
+MMAP_THRESHOLD_BYTES = 64 << 20   # Larger files are memory-mapped instead of read
+HTML_SEGMENT_CHARS = 1 << 20      # Extracted HTML text per yielded document
+CSV_ROWS_PER_DOCUMENT = 200       # Rows grouped into one document
+CSV_SNIFF_BYTES = 64 << 10
+_SEPARATORS = (b"\n\n", b"\n", b" ")
+
+# Each streamed document is one "page" of its file: chunk IDs stay source:page:index
+# and the metadata records where in the file the text came from.
+
+
+def _boundary(data, start: int, end: int) -> int:
+    # Prefer paragraph, then line, then word breaks in the second half of the window.
+    for separator in _SEPARATORS:
+        position = data.rfind(separator, start + (end - start) // 2, end)
+        if position != -1:
+            return position + len(separator)
+    # No break at all: cut at a UTF-8 character boundary.
+    while end > start + 1 and data[end] & 0xC0 == 0x80:
+        end -= 1
+    return end
+
+
+def _cut_segments(data, size: int, segment_bytes: int) -> Iterator[Tuple[int, bytes]]:
+    start = 0
+    while start < size:
+        end = min(start + segment_bytes, size)
+        if end < size:
+            end = _boundary(data, start, end)
+        yield start, data[start:end]
+        start = end
+
+
+def iter_byte_segments(file_path: str, segment_bytes: int = SEGMENT_BYTES) -> Iterator[Tuple[int, bytes]]:
+    """Yield (offset, bytes) segments of a file, cut at paragraph/line/word breaks."""
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return
+    with open(file_path, "rb") as f:
+        if size >= MMAP_THRESHOLD_BYTES:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield from _cut_segments(data, size, segment_bytes)
+        else:
+            yield from _cut_segments(f.read(), size, segment_bytes)
+
+
+def _loaded(file_path: str, kind: str, parts: int):
+    cli_utils.log("info", f"Loaded {kind.upper()}: {os.path.basename(file_path)} ({parts} parts)",
+                  event="file_loaded", path=file_path, kind=kind, parts=parts)
+
+
+def load_text(file_path: str) -> Iterator[Document]:
+    kind = "markdown" if file_path.lower().endswith(".md") else "text"
+    page = 0
+    try:
+        for offset, raw in iter_byte_segments(file_path):
+            text = raw.decode("utf-8", errors="replace")
+            if text.strip():
+                yield Document(page_content=text, metadata={
+                    "source": file_path, "page": page, "type": kind, "offset": offset, "length": len(raw),
+                })
+                page += 1
+    except OSError as e:
+        cli_utils.print_warning(f"Could not read '{os.path.basename(file_path)}': {e}")
+        return
+    _loaded(file_path, kind, page)
+
+
+class _HTMLTextExtractor(HTMLParser):
+    SKIP = {"script", "style", "noscript", "template"}
+    BLOCK = {"p", "div", "br", "li", "tr", "pre", "table", "ul", "ol", "section", "article", "header", "footer",
+             "h1", "h2", "h3", "h4", "h5", "h6", "blockquote"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.size = 0
+        self._skip = 0
+
+    def _append(self, text: str):
+        self.parts.append(text)
+        self.size += len(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip += 1
+        elif tag in self.BLOCK:
+            self._append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skip = max(0, self._skip - 1)
+        elif tag in self.BLOCK:
+            self._append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self._append(data)
+
+    def take(self) -> str:
+        text = "".join(self.parts)
+        self.parts, self.size = [], 0
+        text = re.sub(r"[ \t\r\f\v]+", " ", text)
+        return re.sub(r"\s*\n\s*(\n\s*)+", "\n\n", text).strip()
+
+
+def load_html(file_path: str) -> Iterator[Document]:
+    parser = _HTMLTextExtractor()
+    page = 0
+    start = 0
+
+    def document(text: str, end: int) -> Document:
+        return Document(page_content=text, metadata={
+            "source": file_path, "page": page, "type": "html", "offset": start, "length": end - start,
+        })
+
+    try:
+        end = 0
+        for offset, raw in iter_byte_segments(file_path):
+            parser.feed(raw.decode("utf-8", errors="replace"))
+            end = offset + len(raw)
+            if parser.size >= HTML_SEGMENT_CHARS:
+                text = parser.take()
+                if text:
+                    yield document(text, end)
+                    page += 1
+                start = end
+        parser.close()
+        text = parser.take()
+        if text:
+            yield document(text, end)
+            page += 1
+    except OSError as e:
+        cli_utils.print_warning(f"Could not read '{os.path.basename(file_path)}': {e}")
+        return
+    _loaded(file_path, "html", page)
+
+
+def _csv_dialect(file_path: str):
+    with open(file_path, newline="", encoding="utf-8", errors="replace") as f:
+        sample = f.read(CSV_SNIFF_BYTES)
+    try:
+        return csv.Sniffer().sniff(sample)
+    except csv.Error:
+        return csv.excel
+
+
+def load_csv(file_path: str) -> Iterator[Document]:
+    """Group rows into documents; each row becomes a "column: value | ..." line."""
+    page = 0
+    try:
+        dialect = _csv_dialect(file_path)
+        with open(file_path, newline="", encoding="utf-8", errors="replace") as f:
+            reader = csv.reader(f, dialect)
+            header = next(reader, None)
+            if not header:
+                return
+            lines: List[str] = []
+            row_start = 1
+            for row_number, row in enumerate(reader, start=1):
+                lines.append(" | ".join(f"{name}: {value}" for name, value in zip(header, row) if value))
+                if len(lines) == CSV_ROWS_PER_DOCUMENT:
+                    yield Document(page_content="\n".join(lines), metadata={
+                        "source": file_path, "page": page, "type": "csv", "row_start": row_start, "row_end": row_number,
+                    })
+                    page += 1
+                    lines = []
+                    row_start = row_number + 1
+            if lines:
+                yield Document(page_content="\n".join(lines), metadata={
+                    "source": file_path, "page": page, "type": "csv", "row_start": row_start,
+                    "row_end": row_start + len(lines) - 1,
+                })
+                page += 1
+    except (OSError, csv.Error) as e:
+        cli_utils.print_warning(f"Could not read CSV '{os.path.basename(file_path)}': {e}")
+        return
+    _loaded(file_path, "csv", page)
@@ -0,0 +1,354 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from chat_with_docs import cli_utils
+from chat_with_docs import config_manager
+from chat_with_docs import embedding_dispatcher
+from chat_with_docs import embedding_manager
+
+
+# Append-only record of what questions and populate-db runs used, next to the config:
+#
+#   ~/.chat_with_docs/usage.sqlite3   one row per answered question and per embedded ingest batch
+#
+# Only token counts and timings are stored. usage-report prices them with the
+# current usage_prices, so a corrected price also applies to past usage.
+
+LEDGER_FILE = "usage.sqlite3"
+LOCAL_SERVICES = ("ollama", "onnx")  # run on your own hardware: no per-token cost
+# USD per million tokens; 'usage_prices' in the config overrides or extends these.
+DEFAULT_PRICES = {
+    "gpt-3.5-turbo": {"input": 0.50, "output": 1.50},
+    "text-embedding-ada-002": {"input": 0.10},
+    "text-embedding-3-small": {"input": 0.02},
+    "text-embedding-3-large": {"input": 0.13},
+}
+GROUPS = ("day", "week", "model", "index", "run")
+PERCENTILES = (50, 95, 99)
+_WINDOW = re.compile(r"^(\d+(?:\.\d+)?)([hdw])$")
+_WINDOW_SECONDS = {"h": 3600, "d": 86400, "w": 7 * 86400}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    at REAL NOT NULL,                 -- unix time the question or batch finished
+    kind TEXT NOT NULL,               -- query | ingest
+    run TEXT NOT NULL,                -- one CLI invocation (query session or populate-db run)
+    index_name TEXT,
+    chat_model TEXT,                  -- provider/model
+    embedding_model TEXT,             -- provider/model
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    embedding_tokens INTEGER NOT NULL DEFAULT 0,
+    estimated INTEGER NOT NULL DEFAULT 0,   -- 1 when the provider reported no usage and tokens were estimated
+    items INTEGER NOT NULL DEFAULT 0,       -- chunks retrieved (query) or embedded (ingest)
+    context_chars INTEGER NOT NULL DEFAULT 0,
+    cache_hits INTEGER NOT NULL DEFAULT 0,
+    retrieval_ms REAL,
+    first_token_ms REAL,
+    generation_ms REAL,
+    total_ms REAL,
+    degraded TEXT                     -- comma-separated stages cut short by the query deadline
+);
+CREATE INDEX IF NOT EXISTS events_kind_at ON events (kind, at);
+"""
+
+COLUMNS = (
+    "index_name", "chat_model", "embedding_model", "prompt_tokens", "completion_tokens", "embedding_tokens",
+    "estimated", "items", "context_chars", "cache_hits", "retrieval_ms", "first_token_ms", "generation_ms",
+    "total_ms", "degraded",
+)
+
+
+def ledger_path(config: dict) -> str:
+    return config.get("usage_ledger_path") or os.path.join(
+        os.path.dirname(config_manager.get_config_file_path()), LEDGER_FILE
+    )
+
+
+def model_label(service: str | None, model: str | None) -> str | None:
+    return f"{service}/{model}" if service and model else None
+
+
+def chat_model_label(config: dict) -> str | None:
+    service = config.get("preferred_ai_service")
+    return model_label(service, config.get(f"{service}_chat_model"))
+
+
+class UsageLedger:
+    """Appends usage events to the ledger; recording never fails the question or batch it describes."""
+
+    def __init__(self, path: str, run: str | None = None):
+        self.path = path
+        self.run = run or uuid.uuid4().hex[:12]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._warned = False
+
+    def record(self, kind: str, **fields: Any):
+        values = {name: fields[name] for name in COLUMNS if fields.get(name) is not None}
+        names = ", ".join(["at", "kind", "run", *values])
+        marks = ", ".join("?" * (3 + len(values)))
+        try:
+            with self._lock:
+                self._conn.execute(
+                    f"INSERT INTO events ({names}) VALUES ({marks})", (time.time(), kind, self.run, *values.values())
+                )
+        except sqlite3.Error as e:
+            if not self._warned:
+                self._warned = True
+                cli_utils.print_warning(f"Could not record usage in {self.path}: {e}")
+
+    def record_query(self, config: dict, embedding_model: str | None, report: Dict[str, Any]):
+        self.record(
+            "query",
+            index_name=config.get("index_name"),
+            chat_model=chat_model_label(config),
+            embedding_model=embedding_model,
+            items=report.get("results"),
+            degraded=", ".join(report.get("degraded") or []) or None,
+            **{name: report.get(name) for name in (
+                "prompt_tokens", "completion_tokens", "embedding_tokens", "context_chars", "cache_hits",
+                "retrieval_ms", "first_token_ms", "generation_ms", "total_ms",
+            )},
+            estimated=int(bool(report.get("tokens_estimated"))),
+        )
+
+    def events(self, since: float | None = None, kind: str | None = None) -> List[Dict[str, Any]]:
+        query = "SELECT * FROM events WHERE at >= ?" + (" AND kind = ?" if kind else "") + " ORDER BY at"
+        with self._lock:
+            cursor = self._conn.execute(query, (since or 0, kind) if kind else (since or 0,))
+            names = [column[0] for column in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_ledger(config: dict) -> UsageLedger | None:
+    """The configured ledger, or None when usage_ledger is off or the file cannot be opened."""
+    if not config.get("usage_ledger", True):
+        return None
+    path = ledger_path(config)
+    try:
+        return UsageLedger(path)
+    except (OSError, sqlite3.Error) as e:
+        cli_utils.print_warning(f"Usage is not recorded: cannot open {path} ({e}).")
+        return None
+
+
+class MeteredEmbeddings(Embeddings):
+    """Records every embed_documents() call, i.e. every ingest batch, as an 'ingest' event.
+
+    Providers do not report embedding usage, so tokens are estimated from the
+    text length. Query embeddings are not recorded here; they are part of the
+    question's event.
+    """
+
+    def __init__(self, embeddings: Any, ledger: UsageLedger, config: dict, model: str | None):
+        self.embeddings = embeddings
+        self.ledger = ledger
+        self.index_name = config.get("index_name")
+        self.model = model
+
+    def __getattr__(self, name: str) -> Any:
+        # needs_fit, fit(), report(), ingest_batch_size... of the wrapped embeddings
+        if name == "embeddings":
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        vectors = self.embeddings.embed_documents(texts)
+        self.ledger.record(
+            "ingest",
+            index_name=self.index_name,
+            embedding_model=self.model,
+            embedding_tokens=sum(embedding_dispatcher.estimate_tokens(text) for text in texts),
+            estimated=1,
+            items=len(texts),
+            context_chars=sum(len(text) for text in texts),
+            total_ms=round((time.perf_counter() - start) * 1000, 1),
+        )
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+
+def meter(embeddings: Any, config: dict, ledger: UsageLedger | None) -> Any:
+    """`embeddings` wrapped in MeteredEmbeddings, or unchanged without a ledger."""
+    if ledger is None:
+        return embeddings
+    return MeteredEmbeddings(embeddings, ledger, config, model_label(*embedding_manager.get_embedding_settings(config)))
+
+
+def parse_since(value: str) -> float:
+    """Start of a report window: '24h', '7d', '2w' back from now, or a date such as '2026-10-01'."""
+    match = _WINDOW.match(value.strip().lower())
+    if match:
+        return time.time() - float(match.group(1)) * _WINDOW_SECONDS[match.group(2)]
+    try:
+        return datetime.fromisoformat(value.strip()).timestamp()
+    except ValueError:
+        raise ValueError(f"expected a window like 24h, 7d or 2w, or a date like 2026-10-01, got '{value}'") from None
+
+
+def prices(config: dict) -> Dict[str, Dict[str, float]]:
+    return {**DEFAULT_PRICES, **(config.get("usage_prices") or {})}
+
+
+def _price(table: Dict[str, Dict[str, float]], label: str | None, unpriced: set) -> Dict[str, float] | None:
+    if not label:
+        return None
+    service, _, model = label.partition("/")
+    if service in LOCAL_SERVICES:
+        return {}
+    price = table.get(label) or table.get(model) or table.get(model.removeprefix("models/"))
+    if price is None:
+        unpriced.add(label)
+    return price
+
+
+def event_cost(event: Dict[str, Any], table: Dict[str, Dict[str, float]], unpriced: set) -> float:
+    cost = 0.0
+    chat = _price(table, event["chat_model"], unpriced) if event["prompt_tokens"] or event["completion_tokens"] else None
+    if chat:
+        cost += event["prompt_tokens"] * chat.get("input", 0) + event["completion_tokens"] * chat.get("output", 0)
+    embedding = _price(table, event["embedding_model"], unpriced) if event["embedding_tokens"] else None
+    if embedding:
+        cost += event["embedding_tokens"] * embedding.get("input", 0)
+    return cost / 1e6
+
+
+def _group_key(event: Dict[str, Any], by: str | None) -> str:
+    if by == "day":
+        return time.strftime("%Y-%m-%d", time.localtime(event["at"]))
+    if by == "week":
+        return time.strftime("%G-W%V", time.localtime(event["at"]))
+    if by == "model":
+        return (event["chat_model"] if event["kind"] == "query" else event["embedding_model"]) or "unknown"
+    if by == "index":
+        return event["index_name"] or "(default)"
+    if by == "run":
+        return event["run"]
+    return "all"
+
+
+def _percentiles(values: List[float]) -> Dict[int, float] | None:
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return {p: round(float(np.percentile(values, p)), 1) for p in PERCENTILES}
+
+
+def summarize(events: List[Dict[str, Any]], table: Dict[str, Dict[str, float]], unpriced: set) -> Dict[str, Any]:
+    """Totals and latency percentiles of one group of events (all of one kind)."""
+    summary: Dict[str, Any] = {
+        "events": len(events),
+        "runs": len({event["run"] for event in events}),
+        "prompt_tokens": sum(event["prompt_tokens"] for event in events),
+        "completion_tokens": sum(event["completion_tokens"] for event in events),
+        "embedding_tokens": sum(event["embedding_tokens"] for event in events),
+        "estimated": sum(event["estimated"] for event in events),
+        "items": sum(event["items"] for event in events),
+        "cache_hits": sum(event["cache_hits"] for event in events),
+        "degraded": sum(1 for event in events if event["degraded"]),
+        "cost_usd": round(sum(event_cost(event, table, unpriced) for event in events), 6),
+    }
+    for stage in ("retrieval_ms", "first_token_ms", "generation_ms", "total_ms"):
+        summary[stage] = _percentiles([event[stage] for event in events])
+    summary["prompt_tokens_per_query"] = _percentiles([event["prompt_tokens"] for event in events])
+    if events[0]["kind"] == "ingest":
+        seconds = sum(event["total_ms"] or 0 for event in events) / 1000
+        summary["tokens_per_second"] = round(summary["embedding_tokens"] / seconds, 1) if seconds else None
+    return summary
+
+
+def _ms(value: Dict[int, float] | None, p: int) -> str:
+    return f"{value[p]:,.0f}" if value else "-"
+
+
+def _print_tables(groups: Dict[Tuple[str, str], Dict[str, Any]], by: str | None):
+    from rich.table import Table
+
+    queries = {key: s for key, s in groups.items() if key[0] == "query"}
+    if queries:
+        table = Table(title="Questions")
+        for column in (by or "window", "questions", "tokens in/out", "prompt p50", "retrieval ms p50",
+                       "1st token ms p50", "total ms p50/95/99", "cache hits", "degraded", "cost $"):
+            table.add_column(column, justify="left" if column == (by or "window") else "right", no_wrap=column == (by or "window"))
+        for (_, group), s in queries.items():
+            table.add_row(
+                group, str(s["events"]), f"{s['prompt_tokens']:,}/{s['completion_tokens']:,}",
+                _ms(s["prompt_tokens_per_query"], 50), _ms(s["retrieval_ms"], 50), _ms(s["first_token_ms"], 50),
+                f"{_ms(s['total_ms'], 50)}/{_ms(s['total_ms'], 95)}/{_ms(s['total_ms'], 99)}",
+                str(s["cache_hits"]), str(s["degraded"]), f"{s['cost_usd']:.4f}",
+            )
+        cli_utils.console.print(table)
+    ingest = {key: s for key, s in groups.items() if key[0] == "ingest"}
+    if ingest:
+        table = Table(title="populate-db embedding batches")
+        for column in (by or "window", "runs", "batches", "chunks", "embedding tok", "batch ms p50/95/99",
+                       "tokens/s", "cost $"):
+            table.add_column(column, justify="left" if column == (by or "window") else "right", no_wrap=column == (by or "window"))
+        for (_, group), s in ingest.items():
+            table.add_row(
+                group, str(s["runs"]), str(s["events"]), f"{s['items']:,}", f"{s['embedding_tokens']:,}",
+                f"{_ms(s['total_ms'], 50)}/{_ms(s['total_ms'], 95)}/{_ms(s['total_ms'], 99)}",
+                f"{s['tokens_per_second']:,.0f}" if s.get("tokens_per_second") else "-", f"{s['cost_usd']:.4f}",
+            )
+        cli_utils.console.print(table)
+
+
+def report_command(config: dict, since: float | None = None, by: str | None = None, kind: str | None = None):
+    path = ledger_path(config)
+    if not os.path.exists(path):
+        cli_utils.print_info(f"No usage recorded yet ({path} does not exist).")
+        return
+    ledger = UsageLedger(path)
+    try:
+        events = ledger.events(since, kind)
+    finally:
+        ledger.close()
+    if not events:
+        cli_utils.print_info("No usage recorded in this window.")
+        return
+    grouped: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for event in events:
+        grouped.setdefault((event["kind"], _group_key(event, by)), []).append(event)
+    table, unpriced = prices(config), set()
+    groups = {key: summarize(group, table, unpriced) for key, group in sorted(grouped.items())}
+    for (event_kind, group), summary in groups.items():
+        cli_utils.log("info", event="usage_report", kind=event_kind, group=group, by=by, **summary)
+    if cli_utils.is_interactive():
+        _print_tables(groups, by)
+    total = sum(summary["cost_usd"] for summary in groups.values())
+    estimated = sum(summary["estimated"] for summary in groups.values())
+    cli_utils.log(
+        "success",
+        f"{len(events)} events, estimated cost ${total:.4f}"
+        + (f" ({estimated} with token counts estimated from text length)" if estimated else "") + ".",
+        event="usage_total",
+        events=len(events),
+        cost_usd=round(total, 6),
+        estimated=estimated,
+    )
+    if unpriced:
+        cli_utils.print_warning(
+            f"No price for {', '.join(sorted(unpriced))}; counted as free. "
+            "Add them to 'usage_prices' (USD per million input/output tokens)."
+        )
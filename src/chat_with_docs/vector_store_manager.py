@@ -1,10 +1,19 @@
+import hashlib
+import json
 import os 
+import re
+import threading
 
 
 from chat_with_docs import cli_utils
+from chat_with_docs import dimension_reduction
+from chat_with_docs import document_index
+from chat_with_docs import embedding_manager
+from chat_with_docs import index_generations
 
 
 from typing import Any,List
+import chromadb
 from langchain_chroma import Chroma
 
 
@@ -41,17 +50,351 @@ def set_vector_store_path(config:dict):
 
 
 
-def get_vector_store(config:dict,embedding_function:Any)->Chroma:
+INDEX_META_FILE="index_meta.json"
+DEFAULT_COLLECTION="langchain" # langchain_chroma's default collection name
+BACKFILL_BATCH_SIZE=256
+
+
+def read_index_meta(vector_store_path:str)->dict|None:
+    meta_path=os.path.join(vector_store_path,INDEX_META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError,json.JSONDecodeError) as e:
+        cli_utils.print_warning(f"Ignoring unreadable index metadata '{meta_path}': {e}")
+        return None
+
+
+def write_index_meta(vector_store_path:str,meta:dict):
+    # Write-then-rename so readers never observe a half-written file.
+    os.makedirs(vector_store_path,exist_ok=True)
+    meta_path=os.path.join(vector_store_path,INDEX_META_FILE)
+    tmp_path=f"{meta_path}.tmp"
+    with open(tmp_path,"w") as f:
+        json.dump(meta,f,indent=4)
+    os.replace(tmp_path,meta_path)
+
+
+def get_client(vector_store_path:str)->Any:
+    return chromadb.PersistentClient(path=vector_store_path)
+
+
+def open_store(vector_store_path:str,embedding_function:Any,collection_name:str=DEFAULT_COLLECTION)->Chroma:
+    return Chroma(
+        persist_directory=vector_store_path,
+        embedding_function=embedding_function,
+        collection_name=collection_name,
+    )
+
+
+def active_collection_name(vector_store_path:str)->str:
+    meta=read_index_meta(vector_store_path)
+    return meta["active"]["collection"] if meta else DEFAULT_COLLECTION
+
+
+def open_active_store(vector_store_path:str,embedding_function:Any)->Chroma:
+    return open_store(vector_store_path,embedding_function,active_collection_name(vector_store_path))
+
+
+def _collection_name_for(service:str,model_name:str,reduction:str|None=None)->str:
+    label=f"{service}-{model_name}-{reduction}" if reduction else f"{service}-{model_name}"
+    slug=re.sub(r"[^a-zA-Z0-9_-]+","-",label).strip("-_")[:48]
+    key=f"{service}:{model_name}:{reduction}" if reduction else f"{service}:{model_name}"
+    digest=hashlib.sha1(key.encode("utf-8")).hexdigest()[:8]
+    return f"emb-{slug}-{digest}"
+
+
+def _peek_dimension(vector_store_path:str,collection_name:str)->int|None:
+    try:
+        collection=get_client(vector_store_path).get_collection(collection_name)
+        sample=collection.get(limit=1,include=["embeddings"])
+    except Exception:
+        return None
+    embeddings=sample.get("embeddings")
+    if embeddings is None or len(embeddings)==0:
+        return None
+    return len(embeddings[0])
+
+
+def _embedding_record(collection:str,service:str|None,model_name:str|None,dimension:int|None,
+                      reduction:str|None=None)->dict:
+    return {"collection":collection,"provider":service,"model":model_name,"dimension":dimension,"reduction":reduction}
+
+
+def _matches(record:dict,service:str|None,model_name:str|None,reduction:str|None=None)->bool:
+    return record.get("provider")==service and record.get("model")==model_name and record.get("reduction")==reduction
+
+
+def _describe(record:dict)->str:
+    label=f"{record['provider']}/{record['model']}"
+    return f"{label} ({record['reduction']})" if record.get("reduction") else label
+
+
+def record_dimension(vector_store_path:str):
+    """Fill in the active embedding dimension once the first vectors exist."""
+    meta=read_index_meta(vector_store_path)
+    if not meta or meta["active"].get("dimension"):
+        return
+    dimension=_peek_dimension(vector_store_path,meta["active"]["collection"])
+    if dimension:
+        meta["active"]["dimension"]=dimension
+        write_index_meta(vector_store_path,meta)
+
+
+def check_chunking(vector_store_path:str,chunk_size:int,chunk_overlap:int):
+    """Record the chunk size/overlap of the store and warn when the configured values differ.
+
+    Chunk IDs are source:page:index, so re-splitting a file with other settings
+    would mix old and new chunks until the store is rebuilt.
+    """
+    meta=read_index_meta(vector_store_path)
+    if meta is None:
+        return
+    chunking={"size":chunk_size,"overlap":chunk_overlap}
+    recorded=meta.get("chunking")
+    if recorded==chunking:
+        return
+    if recorded and get_client(vector_store_path).get_or_create_collection(meta["active"]["collection"]).count():
+        cli_utils.print_warning(
+            f"Vector store was chunked with size {recorded['size']}/overlap {recorded['overlap']}, "
+            f"config now says {chunk_size}/{chunk_overlap}. Run 'populate-db --reset' to re-chunk "
+            "existing documents; only new files use the new settings until then."
+        )
+        return
+    meta["chunking"]=chunking
+    write_index_meta(vector_store_path,meta)
+
+
+def plan_embedding_migration(config:dict)->dict|None:
+    """Record the configured embedding model for the store and detect model changes.
+
+    Returns the index metadata with a `pending` entry when the store was built
+    with a different provider/model and needs re-embedding, otherwise None.
+    """
+    vector_store_path=config["vector_store_path"]
+    service,model_name=embedding_manager.get_embedding_settings(config)
+    reduction=dimension_reduction.reduction_label(config)
+    meta=read_index_meta(vector_store_path)
+    if meta is None:
+        # Stores created before metadata existed are assumed to match the current settings.
+        dimension=_peek_dimension(vector_store_path,DEFAULT_COLLECTION) if os.path.isdir(vector_store_path) else None
+        write_index_meta(vector_store_path,{
+            "version":1,
+            "active":_embedding_record(DEFAULT_COLLECTION,service,model_name,dimension,reduction),
+        })
+        return None
+    if _matches(meta["active"],service,model_name,reduction):
+        if meta.get("pending"):
+            # The model was switched back before the backfill finished.
+            drop_collection(vector_store_path,meta.pop("pending")["collection"])
+            write_index_meta(vector_store_path,meta)
+        return None
+    pending=meta.get("pending")
+    if pending and not _matches(pending,service,model_name,reduction):
+        drop_collection(vector_store_path,pending["collection"])
+        pending=None
+    if not pending:
+        meta["pending"]=_embedding_record(
+            _collection_name_for(service,model_name,reduction),service,model_name,None,reduction
+        )
+        write_index_meta(vector_store_path,meta)
+        cli_utils.print_warning(
+            f"Vector store was built with {_describe(meta['active'])}; "
+            f"re-embedding stored chunks with {_describe(meta['pending'])}."
+        )
+    return meta
+
+
+def notify_embedding_change(config:dict):
+    meta=read_index_meta(index_generations.resolve(config.get("vector_store_path") or ""))
+    if not meta:
+        return
+    service,model_name=embedding_manager.get_embedding_settings(config)
+    if not _matches(meta["active"],service,model_name,dimension_reduction.reduction_label(config)):
+        cli_utils.print_info(
+            f"Your vector store was built with [bold]{_describe(meta['active'])}[/bold]. "
+            "It will be re-embedded in the background on the next query or populate-db run; "
+            "queries keep working with the old model until then."
+        )
+
+
+def drop_collection(vector_store_path:str,collection_name:str):
+    client=get_client(vector_store_path)
+    for name in (collection_name,document_index.document_collection_name(collection_name)):
+        try:
+            client.delete_collection(name)
+        except Exception:
+            pass
+
+
+def backfill_pending_collection(vector_store_path:str,embedding_function:Any,batch_size:int=BACKFILL_BATCH_SIZE)->bool:
+    """Re-embed every chunk of the active collection into the pending one, then switch over.
+
+    Stored chunk text and metadata are reused, so no document is re-parsed.
+    Already backfilled IDs are skipped, which makes an interrupted backfill
+    resumable. Returns True once the pending collection became active.
+    """
+    meta=read_index_meta(vector_store_path)
+    if not meta or not meta.get("pending"):
+        return False
+    client=get_client(vector_store_path)
+    source=client.get_or_create_collection(meta["active"]["collection"])
+    target=client.get_or_create_collection(meta["pending"]["collection"])
+    total=source.count()
+    if getattr(embedding_function,"needs_fit",False):
+        sample=source.get(limit=dimension_reduction.PCA_SAMPLE_SIZE,include=["documents"])
+        embedding_function.fit([text for text in sample["documents"] if text])
+    done=0
+    offset=0
+    while offset<total:
+        page=source.get(limit=batch_size,offset=offset,include=["documents","metadatas"])
+        offset+=batch_size
+        if not page["ids"]:
+            break
+        existing=set(target.get(ids=page["ids"],include=[])["ids"])
+        todo=[i for i,chunk_id in enumerate(page["ids"]) if chunk_id not in existing]
+        if todo:
+            texts=[page["documents"][i] or "" for i in todo]
+            target.upsert(
+                ids=[page["ids"][i] for i in todo],
+                embeddings=embedding_function.embed_documents(texts),
+                documents=texts,
+                metadatas=[page["metadatas"][i] for i in todo],
+            )
+        done+=len(page["ids"])
+    document_index.update_document_index(client,meta["pending"]["collection"])
+    old_collection=meta["active"]["collection"]
+    meta["pending"]["dimension"]=_peek_dimension(vector_store_path,meta["pending"]["collection"])
+    meta["active"]=meta.pop("pending")
+    write_index_meta(vector_store_path,meta)
+    drop_collection(vector_store_path,old_collection)
+    cli_utils.print_success(f"Re-embedded {done} chunks with {_describe(meta['active'])}.")
+    return True
+
+
+def with_store_path(config:dict,vector_store_path:str)->dict:
+    return {**config,"vector_store_path":vector_store_path}
+
+
+def reembed_generation(config:dict):
+    """Re-embed the published store into a new generation if the embedding model changed."""
+    with index_generations.write_generation(config["vector_store_path"]) as generation:
+        generation_config=with_store_path(config,generation)
+        if plan_embedding_migration(generation_config):
+            backfill_pending_collection(generation,embedding_manager.get_embedding_function(generation_config))
+
+
+class SnapshotVectorStore:
+    """Serves queries from one published, read-only index generation.
+
+    Every attribute access is forwarded to the current store. `refresh()`
+    moves to a newer generation once one is published, swapping the store in
+    one assignment. When the embedding model changed, a new generation is
+    re-embedded in the background and queries keep using the old model until
+    it is published.
+    """
+
+    def __init__(self,config:dict,embedding_function:Any):
+        self._config=config
+        self._embedding_function=embedding_function
+        self._snapshot=index_generations.open_snapshot(config["vector_store_path"])
+        self._thread:threading.Thread|None=None
+        self._lock=threading.Lock()
+        self._current=self._open()
+
+    def _open(self)->tuple:
+        # (store, generation directory, collection), swapped together on refresh.
+        path=self._snapshot.path
+        config=with_store_path(self._config,path)
+        projection_file=getattr(self._embedding_function,"projection_file",None)
+        if projection_file and os.path.dirname(projection_file)!=path:
+            # PCA projections belong to a generation; load the one of this snapshot.
+            self._embedding_function=embedding_manager.get_embedding_function(config)
+        meta=read_index_meta(path)
+        service,model_name=embedding_manager.get_embedding_settings(config)
+        if meta is None or _matches(meta["active"],service,model_name,dimension_reduction.reduction_label(config)):
+            collection_name=active_collection_name(path)
+            return open_store(path,self._embedding_function,collection_name),path,collection_name
+        active=meta["active"]
+        try:
+            old_embedding_function=embedding_manager.get_embedding_function(
+                embedding_manager.with_embedding_settings(config,active["provider"],active["model"],active.get("reduction"))
+            )
+        except Exception as e:
+            cli_utils.print_warning(f"Cannot query with the previous embedding model ({e}); re-embedding before querying.")
+            reembed_generation(self._config)
+            self._snapshot.refresh()
+            return self._open()
+        if not self.migrating:
+            cli_utils.print_info("Queries use the previous embedding model until re-embedding completes.")
+            self._thread=threading.Thread(target=self._reembed,name="reembed-backfill",daemon=True)
+            self._thread.start()
+        return open_store(path,old_embedding_function,active["collection"]),path,active["collection"]
+
+    def _reembed(self):
+        try:
+            reembed_generation(self._config)
+        except Exception as e:
+            cli_utils.print_error(f"Background re-embedding failed (queries keep using the old model): {e}")
+
+    @property
+    def migrating(self)->bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def generation(self)->str|None:
+        return self._snapshot.generation
+
+    @property
+    def path(self)->str:
+        """Directory of the generation being queried."""
+        return self._current[1]
+
+    @property
+    def client(self)->Any:
+        return get_client(self._current[1])
+
+    @property
+    def collection_name(self)->str:
+        return self._current[2]
+
+    def refresh(self)->bool:
+        """Switch to the newest published generation; True if it changed."""
+        with self._lock:
+            if not self._snapshot.refresh():
+                return False
+            self._current=self._open()
+            return True
+
+    def close(self):
+        self._snapshot.close()
+
+    def __getattr__(self,name:str)->Any:
+        return getattr(self._current[0],name)
+
+
+def get_vector_store(config:dict,embedding_function:Any,background:bool=True)->Any:
+    """Open the store for querying, or prepare a generation being written.
+
+    With `background` (readers), `vector_store_path` is the index root and
+    queries run on a leased snapshot. Without it (writers), it is a private
+    generation directory from `index_generations.write_generation`, and a
+    pending model change is re-embedded in the foreground.
+    """
     vector_store_path = config.get("vector_store_path")
     if not vector_store_path:
         raise ValueError("Vector store path is not configured. Please run setup.")
     cli_utils.print_info(f"Initializing Chroma vector store at: [blue]{vector_store_path}[/blue]")
     try:
         os.makedirs(vector_store_path,exist_ok=True)
-        db = Chroma(
-            persist_directory=vector_store_path,
-            embedding_function=embedding_function
-        )
+        if background:
+            db=SnapshotVectorStore(config,embedding_function)
+        else:
+            if plan_embedding_migration(config):
+                backfill_pending_collection(vector_store_path,embedding_function)
+            db=open_active_store(vector_store_path,embedding_function)
         cli_utils.print_success("Chroma vector store initialized successfully.")
         return db
     except Exception as e:
@@ -59,5 +402,33 @@ def get_vector_store(config:dict,embedding_function:Any)->Chroma:
         raise
 
 
+def evaluate_reduction_command(config:dict,k:int=10,queries:int=100,corpus:int=2000):
+    """Report recall@k of the configured embedding_reduction against full-dimension vectors."""
+    if not dimension_reduction.reduction_label(config):
+        raise ValueError("Set 'embedding_reduction' and 'embedding_dimensions' in the config first.")
+    with index_generations.open_snapshot(config["vector_store_path"]) as snapshot:
+        _evaluate_reduction(with_store_path(config,snapshot.path),k,queries,corpus)
 
 
+def _evaluate_reduction(config:dict,k:int,queries:int,corpus:int):
+    vector_store_path=config["vector_store_path"]
+    collection=get_client(vector_store_path).get_or_create_collection(active_collection_name(vector_store_path))
+    texts=[text for text in collection.get(limit=corpus,include=["documents"])["documents"] if text]
+    if len(texts)<=k:
+        raise ValueError(f"Need more than {k} stored chunks to evaluate; run populate-db first.")
+    full_embeddings=embedding_manager.get_embedding_function({**config,**dimension_reduction.parse_reduction_label(None)})
+    reduced_embeddings=embedding_manager.get_embedding_function(config)
+    cli_utils.print_info(f"Embedding {len(texts)} stored chunks at full and reduced dimensions...")
+    result=dimension_reduction.evaluate(full_embeddings,reduced_embeddings,texts,k,queries)
+    full_bytes=result["full_dimension"]*4
+    reduced_bytes=result["reduced_dimension"]*4
+    stored=collection.count()
+    cli_utils.print_success(
+        f"{dimension_reduction.reduction_label(config)}: recall@{k} {result['recall']:.3f} vs full dimensions "
+        f"over {result['queries']} queries on {result['corpus']} chunks."
+    )
+    cli_utils.print_info(
+        f"Vector size {result['full_dimension']} -> {result['reduced_dimension']} dims "
+        f"({full_bytes} -> {reduced_bytes} bytes); ~{stored*(full_bytes-reduced_bytes)/1e6:.1f} MB less "
+        f"raw vector data for the {stored} stored chunks."
+    )
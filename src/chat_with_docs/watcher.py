@@ -0,0 +1,200 @@
+import os
+import time
+from contextlib import ExitStack
+from typing import Any, Dict, Set, Tuple
+
+from chat_with_docs import cli_utils
+from chat_with_docs import document_loader
+from chat_with_docs import index_generations
+from chat_with_docs import parent_store
+from chat_with_docs import populate_db
+
+
+POLL_INTERVAL = 1.0       # Seconds between directory scans
+DEFAULT_DEBOUNCE = 2.0    # Quiet period before a burst of changes is indexed
+MAX_BATCH_DELAY = 30.0    # Index anyway if changes keep arriving for this long
+DEFAULT_PUBLISH_INTERVAL = 10.0  # Bursts within this long of a publish share one index generation
+RETRY_DELAY = 5.0         # First wait before a failed burst is indexed again...
+MAX_RETRY_DELAY = 300.0   # ...doubling up to this, e.g. while populate-db holds the writer lease
+
+FileState = Tuple[int, int]  # (mtime_ns, size)
+
+
+def snapshot(data_path: str) -> Dict[str, FileState]:
+    state: Dict[str, FileState] = {}
+    for root, _, files in os.walk(data_path):
+        for file in files:
+            file_path = os.path.join(root, file)
+            if not document_loader.is_supported(file_path):
+                continue
+            try:
+                st = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            state[file_path] = (st.st_mtime_ns, st.st_size)
+    return state
+
+
+def diff(before: Dict[str, FileState], after: Dict[str, FileState]) -> Tuple[Set[str], Set[str]]:
+    """Return (changed, removed) paths between two snapshots."""
+    changed = {path for path, state in after.items() if before.get(path) != state}
+    removed = set(before) - set(after)
+    return changed, removed
+
+
+class OpenGeneration:
+    """The index generation the watcher writes bursts into, published at most every `interval` seconds.
+
+    Opening a generation copies the current one, so bursts that arrive soon
+    after a publish are collected in one open generation instead of each
+    paying for a copy of the whole store. Paths applied to it but not yet
+    published are tracked, so they can be indexed again if it is discarded.
+    """
+
+    def __init__(self, vector_store_path: str, interval: float = DEFAULT_PUBLISH_INTERVAL):
+        self.vector_store_path = vector_store_path
+        self.interval = interval
+        self.path: str | None = None
+        self.changed: Set[str] = set()
+        self.removed: Set[str] = set()
+        self.published_at = float("-inf")
+        self._stack: ExitStack | None = None
+
+    def open(self) -> str:
+        if self._stack is None:
+            stack = ExitStack()
+            self.path = stack.enter_context(index_generations.write_generation(self.vector_store_path))
+            self._stack = stack
+        return self.path
+
+    @property
+    def is_open(self) -> bool:
+        return self._stack is not None
+
+    def due(self, now: float) -> bool:
+        return self.is_open and now - self.published_at >= self.interval
+
+    def publish(self):
+        stack, self._stack = self._stack, None
+        try:
+            stack.close()
+        except BaseException:
+            self.path = None
+            raise
+        cli_utils.print_success(
+            f"Published {len(self.changed)} changed and {len(self.removed)} deleted file(s) to queries."
+        )
+        self.path, self.changed, self.removed = None, set(), set()
+        self.published_at = time.monotonic()
+
+    def discard(self, error: BaseException):
+        """Drop the open generation; its changed and removed paths still need indexing."""
+        stack, self._stack, self.path = self._stack, None, None
+        if stack is not None:
+            stack.__exit__(type(error), error, error.__traceback__)
+
+
+def index_changes(changed: Set[str], removed: Set[str], generation: str, embedding_func: Any,
+                  near_duplicate_threshold: float | None = None,
+                  chunking: Tuple[int, int] = (populate_db.CHUNK_SIZE, populate_db.CHUNK_OVERLAP),
+                  parents: bool = False):
+    """Apply one burst of changes to `generation`, a directory from index_generations.write_generation."""
+    start = time.perf_counter()
+    documents = []
+    for file_path in sorted(changed):
+        if os.path.exists(file_path):
+            documents.extend(document_loader.load_file(file_path))
+    chunks = populate_db.split_documents(documents, *chunking, offsets=parents) if documents else []
+    stale = sorted(changed | removed)
+    if stale:
+        populate_db.remove_sources_from_DB(stale, generation, embedding_func)
+    if parents and documents:
+        writer = parent_store.ParentStoreWriter(generation)
+        writer.store(documents)
+        writer.close()
+    if chunks:
+        # One add_to_DB call per burst so the embedding batches are filled across files.
+        populate_db.add_to_DB(chunks, generation, embedding_func,
+                              near_duplicate_threshold=near_duplicate_threshold)
+    cli_utils.print_success(
+        f"Indexed {len(changed)} changed and removed {len(removed)} deleted file(s) "
+        f"in {time.perf_counter() - start:.1f}s."
+    )
+
+
+def watch(data_path: str, vector_store_path: str, embedding_func: Any, debounce: float = DEFAULT_DEBOUNCE,
+          near_duplicate_threshold: float | None = None,
+          chunking: Tuple[int, int] = (populate_db.CHUNK_SIZE, populate_db.CHUNK_OVERLAP),
+          parents: bool = False, publish_interval: float = DEFAULT_PUBLISH_INTERVAL):
+    """Poll `data_path` and incrementally index files as they are added, modified or deleted.
+
+    Changes are collected until the directory has been quiet for `debounce`
+    seconds (or MAX_BATCH_DELAY has passed), so a burst of copies is
+    embedded as one batch and half-written files are not picked up. Bursts
+    are written to an OpenGeneration that is published to queries at most
+    every `publish_interval` seconds; the first burst after a quiet period is
+    published right away. A burst that fails (embedding outage, another
+    writer holding the index) stays pending, together with the unpublished
+    bursts before it, and is retried with exponential backoff.
+    """
+    if not os.path.isdir(data_path):
+        cli_utils.print_error(f"Data folder '{data_path}' not found. Please create it and add your documents.")
+        return
+    cli_utils.print_info(f"👀 Watching '{data_path}' for changes (Ctrl-C to stop)...")
+    known = snapshot(data_path)
+    pending_changed: Set[str] = set()
+    pending_removed: Set[str] = set()
+    first_change_at = last_change_at = 0.0
+    retry_delay, retry_at = RETRY_DELAY, 0.0
+    generation = OpenGeneration(vector_store_path, publish_interval)
+
+    def failed(error: Exception):
+        nonlocal pending_changed, pending_removed, retry_delay, retry_at
+        # Newer pending changes win over what the discarded generation held.
+        pending_changed = (generation.changed - pending_removed) | pending_changed
+        pending_removed = (generation.removed - pending_changed) | pending_removed
+        generation.changed, generation.removed = set(), set()
+        cli_utils.print_error(f"Failed to index changes: {error}; retrying in {retry_delay:.0f}s.")
+        retry_at = time.monotonic() + retry_delay
+        retry_delay = min(retry_delay * 2, MAX_RETRY_DELAY)
+
+    try:
+        while True:
+            time.sleep(POLL_INTERVAL)
+            current = snapshot(data_path)
+            changed, removed = diff(known, current)
+            known = current
+            now = time.monotonic()
+            if changed or removed:
+                if not (pending_changed or pending_removed):
+                    first_change_at = now
+                last_change_at = now
+                pending_changed = (pending_changed | changed) - removed
+                pending_removed = (pending_removed | removed) - changed
+            if now < retry_at:
+                continue
+            if (pending_changed or pending_removed) and (
+                now - last_change_at >= debounce or now - first_change_at >= MAX_BATCH_DELAY
+            ):
+                try:
+                    index_changes(pending_changed, pending_removed, generation.open(), embedding_func,
+                                  near_duplicate_threshold, chunking, parents)
+                except BaseException as e:
+                    generation.discard(e)
+                    if not isinstance(e, Exception):
+                        raise
+                    failed(e)
+                    continue
+                generation.changed = (generation.changed - pending_removed) | pending_changed
+                generation.removed = (generation.removed - pending_changed) | pending_removed
+                pending_changed, pending_removed = set(), set()
+                retry_delay, retry_at = RETRY_DELAY, 0.0
+            if generation.due(time.monotonic()):
+                try:
+                    generation.publish()
+                except Exception as e:
+                    failed(e)
+    except KeyboardInterrupt:
+        if generation.is_open:
+            generation.publish()
+        cli_utils.print_info("\n👋 Stopped watching.")
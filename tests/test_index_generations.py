@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+from chat_with_docs import index_generations
+
+
+def _write(root, name="marker", text="data"):
+    with index_generations.write_generation(root) as path:
+        with open(os.path.join(path, name), "w") as f:
+            f.write(text)
+    return index_generations.current_generation(root)
+
+
+def _generations(root):
+    return sorted(os.listdir(os.path.join(root, index_generations.GENERATIONS_DIR)))
+
+
+def test_publish_and_refresh(tmp_path):
+    root = str(tmp_path / "store")
+    first = _write(root, text="one")
+    with index_generations.open_snapshot(root) as snapshot:
+        assert snapshot.generation == first
+        assert not snapshot.refresh()
+        second = _write(root, text="two")
+        assert second != first
+        assert index_generations.resolve(root) == index_generations.generation_path(root, second)
+        assert snapshot.generation == first  # readers stay on what they opened until they refresh
+        assert snapshot.refresh()
+        assert snapshot.generation == second
+        with open(os.path.join(snapshot.path, "marker")) as f:
+            assert f.read() == "two"
+
+
+def test_reader_lease_blocks_garbage_collection(tmp_path):
+    root = str(tmp_path / "store")
+    first = _write(root)
+    snapshot = index_generations.open_snapshot(root)
+    second = _write(root)
+    assert _generations(root) == [first, second]
+    snapshot.close()
+    assert index_generations.collect_garbage(root) == 1
+    assert _generations(root) == [second]
+
+
+def test_second_writer_is_rejected(tmp_path):
+    root = str(tmp_path / "store")
+    _write(root)
+    with index_generations.write_generation(root):
+        with pytest.raises(RuntimeError, match="Another process"):
+            with index_generations.write_generation(root):
+                pass
+    _write(root)  # the lease is released once the first writer finishes
+
+
+def test_aborted_write_is_discarded(tmp_path):
+    root = str(tmp_path / "store")
+    first = _write(root)
+    with pytest.raises(ValueError):
+        with index_generations.write_generation(root) as path:
+            aborted = os.path.basename(path)
+            raise ValueError("boom")
+    assert index_generations.current_generation(root) == first
+    assert aborted not in _generations(root)
+    assert index_generations.generation_stats(root)["parked"] == []
+
+
+def test_legacy_store_is_migrated_and_cleaned_up(tmp_path):
+    root = tmp_path / "store"
+    root.mkdir()
+    (root / "chroma.sqlite3").write_text("legacy")
+    (root / "index_meta.json").write_text("{}")
+    (root / "notes.txt").write_text("not part of the store")
+    root = str(root)
+    assert index_generations.has_data(root)
+    assert index_generations.resolve(root) == root
+
+    legacy_reader = index_generations.open_snapshot(root)
+    assert legacy_reader.generation is None and legacy_reader.path == root
+    generation = _write(root)
+    path = index_generations.generation_path(root, generation)
+    assert open(os.path.join(path, "chroma.sqlite3")).read() == "legacy"
+    assert not os.path.exists(os.path.join(path, "notes.txt"))
+    # Still leased by the legacy reader, so the old files stay in place.
+    assert os.path.exists(os.path.join(root, "chroma.sqlite3"))
+
+    legacy_reader.close()
+    index_generations.collect_garbage(root)
+    assert not os.path.exists(os.path.join(root, "chroma.sqlite3"))
+    assert not os.path.exists(os.path.join(root, "index_meta.json"))
+    assert os.path.exists(os.path.join(root, "notes.txt"))
+    assert index_generations.resolve(root) == path